@@ -1,82 +1,198 @@
 #!/usr/bin/env python3
 # File: analysis_tools/analyser.py (REPLACE YOUR EXISTING FILE)
 
-import sys, os
+import sys, os, argparse, csv, glob
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use('Agg')   # files only; also safe inside pool workers
 import matplotlib.pyplot as plt
-import pandas as pd
-from scapy.all import rdpcap
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
 
-def analyze_and_plot(pcap_path, log_path=None, buffer_label="Buffer Metric"):
-    outdir = os.path.join(PROJECT_ROOT, "analysis_output")
-    os.makedirs(outdir, exist_ok=True)
-    pkts = rdpcap(pcap_path)
+from analysis_tools.pcap_reader import iter_chunks
+from analysis_tools.throughput import histogram_from_chunks
+from analysis_tools.capture_cache import load_series
+from analysis_tools.buffer_log import load_log
+
+CAPTURE_DIR = os.path.join(PROJECT_ROOT, "captures")
+OUTPUT_DIR = os.path.join(PROJECT_ROOT, "analysis_output")
+
+# capture name prefix -> (case folder, log file, axis label)
+CASES = {
+    'case1': ('case1_buffer_overflow', 'buffer_log.txt', 'App Buffer (bytes)'),
+    'case2': ('case2_long_queue', 'queue_log.txt', 'Queue Length (items)'),
+    'case3': ('case3_bandwidth_limit', 'bandwidth_log.txt', 'Bytes per Interval'),
+}
+
+def case_log_path(pcap_name, log_name=None):
+    """Log file for a capture, from its 'caseN_' prefix; None if unknown."""
+    case = CASES.get(os.path.basename(pcap_name).split('_')[0])
+    if not case:
+        return None
+    folder, default_log, _label = case
+    path = os.path.join(PROJECT_ROOT, folder, log_name or default_log)
+    if log_name is None:
+        # a --log-binary run writes the same name with .bin; use whichever is newer
+        found = [p for p in (path, os.path.splitext(path)[0] + '.bin') if os.path.exists(p)]
+        if found:
+            return max(found, key=os.path.getmtime)
+    return path
+
+def load_histogram(pcap_path, bin_widths=(1.0,), use_cache=True):
+    if use_cache:
+        return load_series(pcap_path, bin_widths).histogram(bin_widths)
+    return histogram_from_chunks(iter_chunks(pcap_path), bin_widths)
+
+def summarize(pcap_path, hist):
+    """Per-capture figures for the combined summary."""
+    primary = hist.primary
+    _t, mbps = hist.series(primary)
+    _t, fine = hist.series(hist.bin_widths[-1])
+    duration = len(mbps) * primary
+    return {
+        "capture": os.path.basename(pcap_path),
+        "packets": hist.packets,
+        "bytes": hist.total_bytes,
+        "duration_s": round(duration, 3),
+        "mean_mbps": round(hist.total_bytes * 8 / 1e6 / duration, 4) if duration else 0.0,
+        "peak_mbps": round(float(mbps.max()), 4) if len(mbps) else 0.0,
+        "peak_fine_mbps": round(float(fine.max()), 4) if len(fine) else 0.0,
+        "finest_bin_ms": hist.bin_widths[-1] * 1000,
+    }
+
+def plot_histogram(hist, pcap_path, log_path=None, buffer_label="Buffer Metric", bin_widths=(1.0,)):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     pcap_name = os.path.splitext(os.path.basename(pcap_path))[0]
     suffix = "_with_buffer" if log_path and os.path.exists(log_path) else ""
-    plot_filename = os.path.join(outdir, f"throughput_{pcap_name}{suffix}.png")
-    
-    if not pkts: 
-        return
-    
-    times = [float(p.time) for p in pkts]
-    start_time = min(times)
-    duration = max(times) - start_time
-    bins = int(duration) + 1
-    bytes_per_bin = [0] * bins
-    
-    for p in pkts:
-        bin_index = int(float(p.time) - start_time)
-        if bin_index < bins: 
-            bytes_per_bin[bin_index] += len(p)
-    
-    mbps = [(b * 8) / 1e6 for b in bytes_per_bin]
-    time_points = list(range(bins))
-    
+    plot_filename = os.path.join(OUTPUT_DIR, f"throughput_{pcap_name}{suffix}.png")
+    primary = bin_widths[0]
+
     fig, ax1 = plt.subplots(figsize=(12, 6))
     color = 'tab:blue'
     ax1.set_xlabel('Time (seconds)', fontsize=12)
     ax1.set_ylabel('Throughput (Mbps)', fontsize=12, color=color)
-    ax1.plot(time_points, mbps, color=color, linewidth=2, marker='o', markersize=4)
+    for w in sorted(set(bin_widths) - {primary}, reverse=True):
+        time_points, mbps = hist.series(w)
+        ax1.plot(time_points, mbps, linewidth=0.8, alpha=0.5, label=f"{w * 1000:g} ms bins")
+    time_points, mbps = hist.series(primary)
+    ax1.plot(time_points, mbps, color=color, linewidth=2, marker='o', markersize=4,
+             label=f"{primary * 1000:g} ms bins")
+    if len(bin_widths) > 1:
+        ax1.legend(loc='upper left')
     ax1.tick_params(axis='y', labelcolor=color)
     ax1.grid(True, alpha=0.3)
-    
+
     if log_path and os.path.exists(log_path):
         ax2 = ax1.twinx()
         color = 'tab:red'
         ax2.set_ylabel(buffer_label, fontsize=12, color=color)
-        df = pd.read_csv(log_path)
+        df = load_log(log_path)
         ax2.plot(df['Timestamp'], df['BufferSize'], color=color, linestyle='--', linewidth=2)
+        if 'Min' in df and 'Max' in df:
+            # stats-mode log: shade the per-interval range so peaks between samples show
+            ax2.fill_between(df['Timestamp'], df['Min'], df['Max'], color=color, alpha=0.2, step='post')
         ax2.tick_params(axis='y', labelcolor=color)
         print(f"[INFO] Successfully plotted data from {os.path.basename(log_path)}")
     elif log_path:
         print(f"[WARNING] Log file not found: {log_path}")
-    
+
     plt.title(f"Network Analysis - {pcap_name.replace('_', ' ').title()}", fontsize=14)
     fig.tight_layout()
     plt.savefig(plot_filename, dpi=150)
-    plt.close()
+    plt.close(fig)
     print(f"[GRAPH] Saved: {plot_filename}")
+    return plot_filename
+
+def analyze_and_plot(pcap_path, log_path=None, buffer_label="Buffer Metric", bin_widths=(1.0,), use_cache=True):
+    """Plot throughput at every width in ``bin_widths`` from a single read.
+
+    The first width is the main line; finer ones are overlaid so short
+    bursts stand out against the smoothed trend.
+    """
+    hist = load_histogram(pcap_path, bin_widths, use_cache)
+    if not hist.packets:
+        return None
+    plot_histogram(hist, pcap_path, log_path, buffer_label, bin_widths)
+    return summarize(pcap_path, hist)
+
+def _batch_job(pcap_path, bin_widths, use_cache=True):
+    """Parse one capture once and render both the plain and the log overlay plot."""
+    hist = load_histogram(pcap_path, bin_widths, use_cache)
+    if not hist.packets:
+        return None
+    images = [plot_histogram(hist, pcap_path, None, bin_widths=bin_widths)]
+    log_path = case_log_path(pcap_path)
+    if log_path and os.path.exists(log_path):
+        label = CASES[os.path.basename(pcap_path).split('_')[0]][2]
+        images.append(plot_histogram(hist, pcap_path, log_path, label, bin_widths))
+    row = summarize(pcap_path, hist)
+    row["log"] = os.path.relpath(log_path, PROJECT_ROOT) if log_path and os.path.exists(log_path) else ""
+    row["images"] = ";".join(os.path.basename(i) for i in images)
+    return row
+
+def find_captures(capture_dir=CAPTURE_DIR):
+    paths = glob.glob(os.path.join(capture_dir, '**', '*.pcap'), recursive=True)
+    paths += glob.glob(os.path.join(capture_dir, '**', '*.pcapng'), recursive=True)
+    # largest first so the slowest capture starts straight away
+    return sorted(paths, key=os.path.getsize, reverse=True)
+
+def analyze_all(bin_widths=(1.0,), workers=None, capture_dir=CAPTURE_DIR, use_cache=True):
+    """Analyse every capture in parallel and write analysis_output/summary.csv."""
+    captures = find_captures(capture_dir)
+    if not captures:
+        print(f"[WARNING] No captures found under {capture_dir}")
+        return []
+    workers = workers or min(len(captures), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = pool.map(_batch_job, captures, [bin_widths] * len(captures), [use_cache] * len(captures))
+        rows = [r for r in jobs if r]
+    rows.sort(key=lambda r: r["capture"])
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    summary_path = os.path.join(OUTPUT_DIR, "summary.csv")
+    if rows:
+        with open(summary_path, 'w', newline='') as f:
+            w = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            w.writeheader()
+            w.writerows(rows)
+    print(f"\n{'capture':<24}{'packets':>9}{'duration_s':>12}{'mean_mbps':>11}{'peak_mbps':>11}")
+    for r in rows:
+        print(f"{r['capture']:<24}{r['packets']:>9}{r['duration_s']:>12}{r['mean_mbps']:>11}{r['peak_mbps']:>11}")
+    print(f"[SUMMARY] Saved: {summary_path}")
+    return rows
+
+def parse_bin_widths(text):
+    """'1000,10,1' (milliseconds) -> (1.0, 0.01, 0.001); first is primary."""
+    return tuple(float(ms) / 1000.0 for ms in text.split(',') if ms.strip())
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python analysis_tools/analyser.py <pcap_file_name> [log_file_name] [buffer_label]")
+    parser = argparse.ArgumentParser(description="Plot capture throughput against a case log")
+    parser.add_argument("pcap_name", nargs="?", help="file name under captures/")
+    parser.add_argument("log_name", nargs="?", help="log file name inside the case folder")
+    parser.add_argument("buffer_label", nargs="?", default="Buffer Metric")
+    parser.add_argument("--bin-ms", default="1000",
+                        help="comma-separated bin widths in ms, first one is the main line (min 1)")
+    parser.add_argument("--all", action="store_true",
+                        help="analyse every capture under captures/ with its case log")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size for --all")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="re-parse captures instead of using analysis_cache/")
+    args = parser.parse_args()
+    bin_widths = parse_bin_widths(args.bin_ms)
+
+    if args.all:
+        analyze_all(bin_widths, args.workers, use_cache=not args.no_cache)
+        sys.exit(0)
+    if not args.pcap_name:
+        parser.print_usage()
         sys.exit(1)
-        
-    pcap_name = sys.argv[1]
-    full_pcap_path = os.path.join(PROJECT_ROOT, 'captures', pcap_name)
-    full_log_path = None
-    
-    if len(sys.argv) > 2:
-        log_name = sys.argv[2]
-        case_folder = {
-            'case1': 'case1_buffer_overflow', 
-            'case2': 'case2_long_queue', 
-            'case3': 'case3_bandwidth_limit'
-        }.get(pcap_name.split('_')[0])
-        if case_folder: 
-            full_log_path = os.path.join(PROJECT_ROOT, case_folder, log_name)
-    
-    label = sys.argv[3] if len(sys.argv) > 3 else "Buffer Metric"
-    analyze_and_plot(full_pcap_path, full_log_path, label)
\ No newline at end of file
+
+    pcap_name = args.pcap_name
+    full_pcap_path = os.path.join(CAPTURE_DIR, pcap_name)
+    full_log_path = case_log_path(pcap_name, args.log_name) if args.log_name else None
+
+    analyze_and_plot(full_pcap_path, full_log_path, args.buffer_label, bin_widths,
+                     use_cache=not args.no_cache)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Load BufferLogger output (CSV text or the binary record format).
+
+Binary logs are memory-mapped and viewed as one float64 array per
+column, so even a long kHz-rate log loads without parsing. A record
+torn by a crashed writer at the end of the file is ignored.
+"""
+
+import os, sys
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from logging_util import LOG_MAGIC, LOG_HEADER, LOG_SLOT
+
+
+class LogFormatError(ValueError):
+    pass
+
+
+def is_binary_log(path):
+    with open(path, 'rb') as f:
+        return f.read(len(LOG_MAGIC)) == LOG_MAGIC
+
+
+def load_binary_log(path):
+    """Columns of a binary log as a dict of name -> float64 array (memmap views)."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(LOG_HEADER.size)
+        if len(head) < LOG_HEADER.size:
+            raise LogFormatError(f"{path}: truncated header")
+        magic, ncols, record_size, _reserved = LOG_HEADER.unpack(head)
+        if magic != LOG_MAGIC or ncols == 0 or record_size != 8 * ncols:
+            raise LogFormatError(f"{path}: not a BufferLogger binary log")
+        names = [f.read(LOG_SLOT).rstrip(b'\0').decode() for _ in range(ncols)]
+    offset = LOG_SLOT * (ncols + 1)
+    rows = max(0, size - offset) // record_size
+    if rows == 0:
+        return {n: np.empty(0) for n in names}
+    data = np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(rows, ncols))
+    return {n: data[:, i] for i, n in enumerate(names)}
+
+
+def load_log(path):
+    """DataFrame of a BufferLogger log, whichever format it was written in."""
+    import pandas as pd
+    if is_binary_log(path):
+        return pd.DataFrame(load_binary_log(path), copy=False)
+    return pd.read_csv(path)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""On-disk cache of the per-capture series the analyser derives.
+
+Each capture maps to one uncompressed ``.npz`` file (one array per
+column) in ``analysis_cache/`` next to ``analysis_output/``. An entry is
+valid while the capture's path, size, mtime and sampled content hash all
+match what was stored; the directory is trimmed least-recently-used
+first once it grows past ``MAX_CACHE_BYTES``.
+"""
+
+import os, sys, hashlib, json, tempfile, zipfile
+from array import array
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from analysis_tools.pcap_reader import PcapReader
+from analysis_tools.packet_decode import flow_tuple, format_flow
+from analysis_tools.throughput import ThroughputHistogram
+
+CACHE_DIR = os.path.join(PROJECT_ROOT, "analysis_cache")
+CACHE_VERSION = 1
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+HASH_SAMPLE = 1024 * 1024   # bytes hashed from each end of the capture
+
+
+class CaptureSeries:
+    """Everything derived from one pass over a capture."""
+
+    def __init__(self, timestamps, lengths, flow_keys, flow_packets, flow_bytes, bins=None):
+        self.timestamps = timestamps
+        self.lengths = lengths
+        self.flow_keys = flow_keys
+        self.flow_packets = flow_packets
+        self.flow_bytes = flow_bytes
+        self.bins = bins or {}   # bin width (s) -> bytes per bin
+
+    def histogram(self, bin_widths=(1.0,)):
+        """ThroughputHistogram for ``bin_widths``, reusing stored bins when possible."""
+        hist = ThroughputHistogram(bin_widths)
+        if all(w in self.bins for w in hist.bin_widths):
+            hist.start_time = float(self.timestamps[0]) if len(self.timestamps) else None
+            hist.packets = int(len(self.lengths))
+            hist.total_bytes = int(self.lengths.sum())
+            for w in hist.bin_widths:
+                hist._bins[w] = self.bins[w]
+            return hist
+        hist.add(self.timestamps, self.lengths)
+        for w in hist.bin_widths:
+            self.bins[w] = hist.bytes_per_bin(w)
+        return hist
+
+    def flows(self):
+        return sorted(zip(self.flow_keys, self.flow_packets.tolist(), self.flow_bytes.tolist()),
+                      key=lambda f: -f[2])
+
+
+def content_hash(path, size):
+    """blake2b over the size and the first/last HASH_SAMPLE bytes."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(size).encode())
+    with open(path, 'rb') as f:
+        h.update(f.read(HASH_SAMPLE))
+        if size > HASH_SAMPLE:
+            f.seek(max(HASH_SAMPLE, size - HASH_SAMPLE))
+            h.update(f.read(HASH_SAMPLE))
+    return h.hexdigest()
+
+
+def _entry_path(pcap_path, cache_dir):
+    name = hashlib.sha1(os.path.abspath(pcap_path).encode()).hexdigest()[:20]
+    return os.path.join(cache_dir, f"{name}.npz")
+
+
+def _capture_key(pcap_path):
+    st = os.stat(pcap_path)
+    return {"path": os.path.abspath(pcap_path), "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns, "version": CACHE_VERSION}
+
+
+def parse_capture(pcap_path):
+    """One streaming pass: timestamps, lengths and per-flow counters."""
+    ts, lens = array('d'), array('q')
+    flows = {}
+    with PcapReader(pcap_path) as r:
+        for t, linktype, data in r.packets():
+            n = len(data)
+            ts.append(t)
+            lens.append(n)
+            key = flow_tuple(linktype, data)
+            if key is not None:
+                c = flows.get(key)
+                if c is None:
+                    flows[key] = [1, n]
+                else:
+                    c[0] += 1
+                    c[1] += n
+    keys = list(flows)
+    return CaptureSeries(
+        np.frombuffer(ts, dtype=np.float64),
+        np.frombuffer(lens, dtype=np.int64),
+        [format_flow(k) for k in keys],
+        np.array([flows[k][0] for k in keys], dtype=np.int64),
+        np.array([flows[k][1] for k in keys], dtype=np.int64),
+    )
+
+
+def _read_entry(entry, key, pcap_path):
+    try:
+        with np.load(entry, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            stored_hash = meta.pop("content_hash", None)
+            if meta.get("key") != key:
+                return None
+            if stored_hash != content_hash(pcap_path, key["size"]):
+                return None
+            bins = {float(w): z[f"bins_{i}"] for i, w in enumerate(meta.get("bin_widths", []))}
+            series = CaptureSeries(z["timestamps"], z["lengths"], [str(k) for k in z["flow_keys"]],
+                                   z["flow_packets"], z["flow_bytes"], bins)
+    except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+        return None     # unreadable (e.g. truncated) entry: a miss, rewritten below
+    try:
+        os.utime(entry)   # mark as recently used for eviction
+    except OSError:
+        pass            # evicted concurrently; the series is already loaded
+    return series
+
+
+def _write_entry(entry, key, pcap_path, series, cache_dir):
+    meta = {"key": key, "content_hash": content_hash(pcap_path, key["size"]),
+            "bin_widths": list(series.bins)}
+    arrays = {f"bins_{i}": b for i, b in enumerate(series.bins.values())}
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)),
+                     timestamps=series.timestamps, lengths=series.lengths,
+                     flow_keys=np.array(series.flow_keys, dtype=str),
+                     flow_packets=series.flow_packets, flow_bytes=series.flow_bytes,
+                     **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, entry)  # readers see the old entry or the whole new one
+        tmp = None
+    except OSError:
+        pass
+    finally:
+        if tmp is not None:
+            try: os.unlink(tmp)
+            except OSError: pass
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """Delete least-recently-used entries until the cache fits in max_bytes."""
+    try:
+        entries = [os.path.join(cache_dir, n) for n in os.listdir(cache_dir) if n.endswith(".npz")]
+    except FileNotFoundError:
+        return
+    stats = []
+    for p in entries:
+        try:
+            st = os.stat(p)
+        except FileNotFoundError:
+            continue
+        stats.append((st.st_mtime, st.st_size, p))
+    total = sum(s for _m, s, _p in stats)
+    for _mtime, size, p in sorted(stats):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(p)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+
+def invalidate(pcap_path, cache_dir=CACHE_DIR):
+    try:
+        os.unlink(_entry_path(pcap_path, cache_dir))
+    except FileNotFoundError:
+        pass
+
+
+def load_series(pcap_path, bin_widths=(1.0,), cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """CaptureSeries for ``pcap_path``, from the cache when it is still valid.
+
+    New bin widths are computed from the cached arrays and written back,
+    so styling or resolution changes never re-read the capture.
+    """
+    key = _capture_key(pcap_path)
+    entry = _entry_path(pcap_path, cache_dir)
+    series = _read_entry(entry, key, pcap_path) if os.path.exists(entry) else None
+    dirty = series is None
+    if series is None:
+        series = parse_capture(pcap_path)
+    missing = [w for w in bin_widths if float(w) not in series.bins]
+    if missing:
+        series.histogram(missing)
+        dirty = True
+    if dirty:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_entry(entry, key, pcap_path, series, cache_dir)
+        evict(cache_dir, max_bytes)
+    return series
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""In-process packet capture for Linux, with an application-level fallback.
+
+``PacketCapture`` opens an ``AF_PACKET`` socket on an interface (``lo``
+by default) and writes what it sees to a pcap file from a background
+thread, so it starts and stops with the code that owns it instead of
+blocking a shell. Three things keep it from losing packets at high
+rates:
+
+- a classic BPF program (``port_filter``, the same program tcpdump
+  compiles for ``tcp port N``) runs in the kernel, so only the
+  scenario's traffic is queued, and on ``lo`` the duplicate outgoing
+  copy of every packet is rejected there too;
+- packets land in a ``PACKET_RX_RING`` (TPACKET_V3) shared with the
+  kernel: one wakeup hands over a whole block of packets, which are
+  written straight out of the mapping without a recv per packet;
+- ``PcapWriter`` writes through one large userspace buffer.
+
+Kernel drop counters (``PACKET_STATISTICS``) are reported by ``stop()``,
+so a lossy capture is visible rather than silent. If the ring cannot be
+set up the reader falls back to ``recv_into`` on the same filtered
+socket.
+
+Where raw sockets are not available (other platforms, no CAP_NET_RAW),
+``install_tap`` records what the process itself sends and receives: it
+swaps in a ``socket.socket`` subclass whose send/recv calls append
+synthesized Ethernet/IP/TCP frames to a pcap, so the analysers read it
+like a wire capture. Only payload-carrying segments are written (no
+handshake, ACKs or retransmissions), with sequence numbers that count
+payload bytes per direction.
+
+    cap = PacketCapture("run.pcap", port=5001).start()
+    ...
+    stats = cap.stop()      # {'packets': ..., 'kernel_drops': 0, ...}
+
+``python analysis_tools/capture_engine.py --check`` captures a loopback
+transfer through the ring and decodes it with the analysers.
+"""
+
+import os, sys, mmap, time, select, socket, struct, ctypes, threading
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from analysis_tools.packet_decode import LINKTYPE_ETHERNET, ETH_IPV4, ETH_IPV6, PROTO_TCP, TCP_PSH, TCP_ACK
+
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAP_HDR = struct.Struct('<IHHiIII')
+PCAP_REC = struct.Struct('<IIII')
+SNAPLEN = 65535 + 14
+WRITE_BUFFER = 8 * 1024 * 1024
+
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_RX_RING, PACKET_STATISTICS, PACKET_VERSION = 5, 6, 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL, TP_STATUS_USER = 0, 1
+SO_ATTACH_FILTER, SO_RCVBUFFORCE = 26, 33
+PACKET_OUTGOING = 4
+
+RING_BLOCK = 4 * 1024 * 1024      # bytes per ring block (page multiple)
+RING_BLOCKS = 16                  # 64 MiB ring by default
+RING_FRAME = 2048
+BLOCK_TIMEOUT_MS = 50             # kernel hands over a partly filled block after this
+POLL_MS = 100                     # how often the reader checks for stop()
+
+BLOCK_HDR = struct.Struct('<III4xI')      # version, offset_to_priv, block_status, offset_to_first_pkt
+BLOCK_NPKTS = struct.Struct('<I')         # num_pkts, at offset 12
+TP3_HDR = struct.Struct('<IIIIIIH')       # next_offset, sec, nsec, snaplen, len, status, mac (offset 24)
+
+
+class PcapWriter:
+    """pcap (nanosecond timestamps) written through a large buffer; thread-safe."""
+
+    def __init__(self, path, linktype=LINKTYPE_ETHERNET, snaplen=SNAPLEN, buffer_bytes=WRITE_BUFFER):
+        self.path, self.snaplen = path, snaplen
+        self.f = open(path, "wb", buffering=buffer_bytes)
+        self.f.write(PCAP_HDR.pack(PCAP_MAGIC_NS, 2, 4, 0, 0, snaplen, linktype))
+        self.lock = threading.Lock()
+        self.packets = self.bytes = 0
+
+    def write(self, ts_ns, data, orig_len=None):
+        caplen = min(len(data), self.snaplen)
+        sec, nsec = divmod(ts_ns, 1_000_000_000)
+        with self.lock:
+            self.f.write(PCAP_REC.pack(sec, nsec, caplen, orig_len or len(data)))
+            self.f.write(data[:caplen] if caplen < len(data) else data)
+            self.packets += 1
+            self.bytes += caplen
+
+    def close(self):
+        with self.lock:
+            if not self.f.closed:
+                self.f.close()
+
+
+def _insn(code, jt, jf, k):
+    return struct.pack('HBBI', code, jt, jf, k & 0xffffffff)
+
+
+def port_filter(port, snaplen=SNAPLEN, incoming_only=True):
+    """Classic BPF for ``tcp port <port>`` on Ethernet framing (IPv4 and IPv6).
+
+    With ``incoming_only`` the first two instructions drop PACKET_OUTGOING
+    copies, which on ``lo`` duplicate every packet.
+    """
+    ldh, ldb, jeq, jset, ldxb_msh, ldh_ind, ret = 0x28, 0x30, 0x15, 0x45, 0xb1, 0x48, 0x06
+    prog = [
+        (ldh, 0, 0, 12),
+        (jeq, 0, 6, ETH_IPV6),
+        (ldb, 0, 0, 20),
+        (jeq, 0, 15, PROTO_TCP),
+        (ldh, 0, 0, 54),
+        (jeq, 12, 0, port),
+        (ldh, 0, 0, 56),
+        (jeq, 10, 11, port),
+        (jeq, 0, 10, ETH_IPV4),
+        (ldb, 0, 0, 23),
+        (jeq, 0, 8, PROTO_TCP),
+        (ldh, 0, 0, 20),
+        (jset, 6, 0, 0x1fff),             # non-first fragment: no TCP header
+        (ldxb_msh, 0, 0, 14),
+        (ldh_ind, 0, 0, 14),
+        (jeq, 2, 0, port),
+        (ldh_ind, 0, 0, 16),
+        (jeq, 0, 1, port),
+        (ret, 0, 0, snaplen),
+        (ret, 0, 0, 0),
+    ]
+    if incoming_only:
+        skf_ad_pkttype = -0x1000 + 4      # SKF_AD_OFF + SKF_AD_PKTTYPE
+        prog = [(ldb, 0, 0, skf_ad_pkttype), (jeq, len(prog) - 1, 0, PACKET_OUTGOING)] + prog
+    return [_insn(*i) for i in prog]
+
+
+def attach_filter(sock, insns):
+    buf = ctypes.create_string_buffer(b"".join(insns))
+    fprog = struct.pack('HL', len(insns), ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+class PacketCapture:
+    """AF_PACKET capture of one TCP port on one interface into a pcap file."""
+
+    def __init__(self, path, port, interface="lo", snaplen=SNAPLEN,
+                 ring_blocks=RING_BLOCKS, block_size=RING_BLOCK):
+        self.path, self.port, self.interface, self.snaplen = path, port, interface, snaplen
+        self.ring_blocks, self.block_size = ring_blocks, block_size
+        self.sock = self.ring = self.writer = self.thread = None
+        self.mode = None
+        self.kernel_drops = 0
+        self._stop = threading.Event()
+
+    @staticmethod
+    def available():
+        """True if this process may open AF_PACKET sockets."""
+        if not hasattr(socket, "AF_PACKET"):
+            return False
+        try:
+            socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL)).close()
+            return True
+        except OSError:
+            return False
+
+    def start(self):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        # before bind: nothing unfiltered queues. Only lo sees each packet twice (the outgoing
+        # copy is a duplicate); on a real NIC the outgoing copies are this host's sending side
+        attach_filter(sock, port_filter(self.port, self.snaplen, incoming_only=(self.interface == "lo")))
+        try:
+            sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            frames = self.block_size * self.ring_blocks // RING_FRAME
+            sock.setsockopt(SOL_PACKET, PACKET_RX_RING, struct.pack(
+                '<7I', self.block_size, self.ring_blocks, RING_FRAME, frames, BLOCK_TIMEOUT_MS, 0, 0))
+            self.ring = mmap.mmap(sock.fileno(), self.block_size * self.ring_blocks,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            self.mode = "ring"
+        except OSError:
+            self.mode = "recv"
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, self.block_size * self.ring_blocks)
+            except OSError:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.block_size * self.ring_blocks)
+        sock.bind((self.interface, ETH_P_ALL))
+        self._read_stats(sock)      # discard counts from before bind
+        self.kernel_drops = 0
+        self.sock = sock
+        self.writer = PcapWriter(self.path, LINKTYPE_ETHERNET, self.snaplen)
+        target = self._ring_loop if self.mode == "ring" else self._recv_loop
+        self.thread = threading.Thread(target=target, name=f"capture-{self.port}", daemon=True)
+        self.thread.start()
+        return self
+
+    def _read_stats(self, sock):
+        """Add the kernel's drop count since the last call (reading resets it)."""
+        try:
+            _packets, drops, _freeze = struct.unpack('<III', sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12))
+            self.kernel_drops += drops
+        except OSError:
+            pass
+
+    def _ring_loop(self):
+        ring, write = self.ring, self.writer.write
+        view = memoryview(ring)
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN | select.POLLERR)
+        block = 0
+        try:
+            while True:
+                off = block * self.block_size
+                _ver, _priv, status, first = BLOCK_HDR.unpack_from(ring, off)
+                if not status & TP_STATUS_USER:
+                    if self._stop.is_set():
+                        break
+                    poller.poll(POLL_MS)
+                    continue
+                pkt = off + first
+                for _ in range(BLOCK_NPKTS.unpack_from(ring, off + 12)[0]):
+                    nxt, sec, nsec, caplen, length, _st, mac = TP3_HDR.unpack_from(ring, pkt)
+                    write(sec * 1_000_000_000 + nsec, view[pkt + mac:pkt + mac + caplen], length)
+                    pkt += nxt
+                struct.pack_into('<I', ring, off + 8, TP_STATUS_KERNEL)
+                block = (block + 1) % self.ring_blocks
+        finally:
+            view.release()
+
+    def _recv_loop(self):
+        buf = bytearray(self.snaplen)
+        view = memoryview(buf)
+        self.sock.settimeout(POLL_MS / 1000.0)
+        while not self._stop.is_set():
+            try:
+                n = self.sock.recv_into(buf)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.writer.write(time.time_ns(), view[:n])
+
+    def stop(self, drain=None):
+        """Stop after the kernel has handed over what it holds; returns stats."""
+        if self.thread is None:
+            return None
+        time.sleep(BLOCK_TIMEOUT_MS / 1000.0 * 2 if drain is None else drain)   # let open blocks retire
+        self._stop.set()
+        self.thread.join()
+        self._read_stats(self.sock)
+        self.writer.close()
+        if self.ring is not None:
+            self.ring.close()
+        self.sock.close()
+        self.thread = None
+        return {"path": self.path, "mode": self.mode, "interface": self.interface, "port": self.port,
+                "packets": self.writer.packets, "bytes": self.writer.bytes, "kernel_drops": self.kernel_drops}
+
+
+# ---- application-level tap ----------------------------------------
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\0"
+    s = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    while s >> 16:
+        s = (s & 0xffff) + (s >> 16)
+    return ~s & 0xffff
+
+
+class AppTap:
+    """Writes each payload a tapped socket sends or receives as a TCP segment."""
+
+    MAX_SEGMENT = 65000     # keeps synthesized IPv4 packets under 64 KiB
+
+    def __init__(self, path, port=None):
+        self.writer = PcapWriter(path, LINKTYPE_ETHERNET)
+        self.port = port
+        self.seq = {}       # (src, dst) -> next sequence number
+        self.lock = threading.Lock()
+
+    def _frame(self, src, dst, seq, ack, payload):
+        tcp = struct.pack('!HHIIBBHHH', src[1], dst[1], seq, ack, 5 << 4, TCP_PSH | TCP_ACK, 65535, 0, 0)
+        if ":" in src[0]:
+            ip = struct.pack('!IHBB16s16s', 6 << 28, len(tcp) + len(payload), PROTO_TCP, 64,
+                             socket.inet_pton(socket.AF_INET6, src[0]), socket.inet_pton(socket.AF_INET6, dst[0]))
+            etype = ETH_IPV6
+        else:
+            hdr = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp) + len(payload), 0, 0x4000, 64, PROTO_TCP, 0,
+                              socket.inet_aton(src[0]), socket.inet_aton(dst[0]))
+            ip = hdr[:10] + struct.pack('!H', _checksum(hdr)) + hdr[12:]
+            etype = ETH_IPV4
+        return b"\0" * 12 + struct.pack('!H', etype) + ip + tcp + payload
+
+    def record(self, src, dst, data):
+        if not data:
+            return
+        if self.port is not None and self.port not in (src[1], dst[1]):
+            return
+        ts = time.time_ns()
+        data = bytes(data)
+        with self.lock:
+            seq = self.seq.get((src, dst), 1)
+            ack = self.seq.get((dst, src), 1)
+            self.seq[(src, dst)] = (seq + len(data)) & 0xffffffff
+        for i in range(0, len(data), self.MAX_SEGMENT):
+            chunk = data[i:i + self.MAX_SEGMENT]
+            self.writer.write(ts, self._frame(src, dst, (seq + i) & 0xffffffff, ack, chunk))
+
+    def close(self):
+        self.writer.close()
+
+
+_tap = None
+_RealSocket = socket.socket
+
+
+class TapSocket(_RealSocket):
+    """``socket.socket`` that reports TCP payloads to the installed tap."""
+
+    def _tap_addrs(self):
+        try:
+            return self.__dict__["_addrs"]
+        except KeyError:
+            pass
+        try:
+            local, peer = self.getsockname()[:2], self.getpeername()[:2]
+        except OSError:
+            return None
+        self.__dict__["_addrs"] = addrs = (local, peer)
+        return addrs
+
+    def _tap(self, sent, data):
+        if _tap is None or self.type != socket.SOCK_STREAM:
+            return
+        addrs = self._tap_addrs()
+        if addrs:
+            _tap.record(*(addrs if sent else addrs[::-1]), data)
+
+    def send(self, data, *args):
+        n = super().send(data, *args)
+        self._tap(True, memoryview(data)[:n])
+        return n
+
+    def sendall(self, data, *args):
+        super().sendall(data, *args)
+        self._tap(True, data)
+
+    def sendmsg(self, buffers, *args):
+        n = super().sendmsg(buffers, *args)
+        self._tap(True, b"".join(bytes(b) for b in buffers)[:n])
+        return n
+
+    def recv(self, bufsize, *args):
+        data = super().recv(bufsize, *args)
+        self._tap(False, data)
+        return data
+
+    def recv_into(self, buffer, nbytes=0, *args):
+        n = super().recv_into(buffer, nbytes, *args)
+        self._tap(False, memoryview(buffer)[:n])
+        return n
+
+
+def install_tap(path, port=None):
+    """Record every TCP socket created from now on (optionally one port) to ``path``."""
+    global _tap
+    _tap = AppTap(path, port)
+    socket.socket = TapSocket
+    return _tap
+
+
+def remove_tap():
+    """Restore ``socket.socket`` and flush the tap's pcap; returns its stats or None."""
+    global _tap
+    tap, _tap = _tap, None
+    socket.socket = _RealSocket
+    if tap is None:
+        return None
+    tap.close()
+    return {"path": tap.writer.path, "mode": "tap", "port": tap.port,
+            "packets": tap.writer.packets, "bytes": tap.writer.bytes}
+
+
+def check(path="capture_check.pcap", nbytes=256 * 1024):
+    """Capture a loopback transfer through the ring and decode it back; returns (ok, stats)."""
+    from analysis_tools.simple_analyser import TcpFlowAnalyzer
+    from analysis_tools.pcap_reader import PcapReader
+    srv = _RealSocket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.bind(("127.0.0.1", 0)); srv.listen(1)
+    port = srv.getsockname()[1]
+    cap = PacketCapture(path, port, "lo").start()
+    cli = _RealSocket(socket.AF_INET, socket.SOCK_STREAM)
+    cli.connect(("127.0.0.1", port))
+    conn, _ = srv.accept()
+    cli.sendall(b"x" * nbytes); cli.close()
+    while conn.recv(65536):
+        pass
+    conn.close(); srv.close()
+    stats = cap.stop()
+    analyzer = TcpFlowAnalyzer()
+    with PcapReader(path) as r:
+        for ts, linktype, data in r.packets():
+            analyzer.feed(ts, linktype, data)
+    flows = analyzer.results()
+    sent = sum(f["client_to_server"]["payload_bytes"] for f in flows)
+    stats.update(tcp_packets=analyzer.tcp_packets, connections=len(flows), payload_bytes=sent)
+    return analyzer.tcp_packets == analyzer.packets and len(flows) == 1 and sent == nbytes, stats
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Capture one TCP port to pcap until Ctrl+C")
+    parser.add_argument("port", type=int, nargs="?")
+    parser.add_argument("--check", action="store_true",
+                        help="capture a loopback transfer and check it decodes (writes -w)")
+    parser.add_argument("-i", "--interface", default="lo")
+    parser.add_argument("-w", "--write", default="capture.pcap")
+    args = parser.parse_args()
+    if args.check:
+        ok, stats = check(args.write)
+        print(f"[CAP] check {'ok' if ok else 'FAILED'}: {stats}")
+        sys.exit(0 if ok else 1)
+    if args.port is None:
+        parser.error("port is required")
+    cap = PacketCapture(args.write, args.port, args.interface).start()
+    print(f"[CAP] {args.interface} tcp port {args.port} -> {args.write} ({cap.mode}); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    print(f"[CAP] {cap.stop()}")
@@ -1,33 +1,53 @@
 import subprocess
 import sys
 import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from analysis_tools.capture_engine import PacketCapture
 
 def start_capture(case_name, port):
-    """Start tshark capture"""
+    """Capture one case's port to captures/<case>.pcap until Ctrl+C"""
     output_dir = "captures"
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    
+
     output_file = f"{output_dir}/{case_name}.pcap"
-    
-    # Simple tshark command for macOS
-    cmd = f"tshark -i lo0 -f 'tcp port {port}' -w {output_file}"
-    
     print(f"Starting capture for {case_name} on port {port}")
     print(f"Output: {output_file}")
-    print(f"Command: {cmd}")
+
+    if PacketCapture.available():
+        # Linux: in-process AF_PACKET capture on lo (see capture_engine)
+        cap = PacketCapture(output_file, port, "lo").start()
+        print(f"Capturing on lo ({cap.mode})")
+        print("Press Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        stats = cap.stop()
+        print(f"Captured {stats['packets']} packets, {stats['kernel_drops']} dropped by the kernel")
+        return
+
+    # elsewhere (macOS lo0, or no CAP_NET_RAW): tshark
+    iface = "lo0" if sys.platform == "darwin" else "lo"
+    cmd = ["tshark", "-i", iface, "-f", f"tcp port {port}", "-w", output_file]
+    print(f"Command: {' '.join(cmd)}")
     print("Press Ctrl+C to stop")
-    
-    os.system(cmd)
+    try:
+        subprocess.run(cmd)
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python capture_helper.py case1|case2|case3")
         sys.exit(1)
-    
+
     case = sys.argv[1]
     ports = {"case1": 5000, "case2": 5001, "case3": 5002}
-    
+
     if case in ports:
         start_capture(case, ports[case])
     else:
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Minimal link/IP/transport header decoding for the streaming tools.
+
+Just enough to find the 5-tuple and the TCP header fields in the raw
+bytes handed out by ``pcap_reader``; anything richer belongs to scapy.
+"""
+
+import socket, struct
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+PROTO_TCP = 6
+PROTO_UDP = 17
+PROTO_NAMES = {PROTO_TCP: "TCP", PROTO_UDP: "UDP"}
+
+ETH_IPV4, ETH_IPV6, ETH_VLAN = 0x0800, 0x86dd, (0x8100, 0x88a8)
+
+TCP_FIN, TCP_SYN, TCP_RST, TCP_PSH, TCP_ACK = 0x01, 0x02, 0x04, 0x08, 0x10
+TCPOPT_EOL, TCPOPT_NOP, TCPOPT_WSCALE = 0, 1, 3
+
+
+def ip_offset(linktype, data):
+    """Offset of the IP header inside a link-layer frame, or None."""
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        return 4 if len(data) >= 4 else None
+    if linktype == LINKTYPE_ETHERNET:
+        off = 12
+        if len(data) < off + 2:
+            return None
+        etype = struct.unpack_from('!H', data, off)[0]
+        while etype in ETH_VLAN and len(data) >= off + 6:
+            off += 4
+            etype = struct.unpack_from('!H', data, off)[0]
+        return off + 2 if etype in (ETH_IPV4, ETH_IPV6) else None
+    if linktype in (LINKTYPE_RAW, 12, 14, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return 0
+    if linktype == LINKTYPE_LINUX_SLL:
+        return 16
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return 20
+    return None
+
+
+def decode_ip(linktype, data):
+    """Return (src, dst, proto, l4 offset, l4 length) or None."""
+    off = ip_offset(linktype, data)
+    if off is None or len(data) < off + 20:
+        return None
+    version = data[off] >> 4
+    if version == 4:
+        ihl = (data[off] & 0x0f) * 4
+        total_len, = struct.unpack_from('!H', data, off + 2)
+        proto = data[off + 9]
+        src = socket.inet_ntop(socket.AF_INET, bytes(data[off + 12:off + 16]))
+        dst = socket.inet_ntop(socket.AF_INET, bytes(data[off + 16:off + 20]))
+        # TSO/loopback captures can report total_len 0; trust the frame then
+        end = off + total_len if total_len else len(data)
+        return src, dst, proto, off + ihl, min(end, len(data)) - off - ihl
+    if version == 6 and len(data) >= off + 40:
+        payload_len, proto = struct.unpack_from('!HB', data, off + 4)
+        src = socket.inet_ntop(socket.AF_INET6, bytes(data[off + 8:off + 24]))
+        dst = socket.inet_ntop(socket.AF_INET6, bytes(data[off + 24:off + 40]))
+        # extension headers are not walked; flows behind them are skipped
+        end = off + 40 + payload_len if payload_len else len(data)
+        return src, dst, proto, off + 40, min(end, len(data)) - off - 40
+    return None
+
+
+def flow_tuple(linktype, data):
+    """(proto, src, sport, dst, dport) for TCP/UDP frames, else None."""
+    ip = decode_ip(linktype, data)
+    if ip is None:
+        return None
+    src, dst, proto, l4, l4_len = ip
+    if proto not in (PROTO_TCP, PROTO_UDP) or l4_len < 4:
+        return None
+    sport, dport = struct.unpack_from('!HH', data, l4)
+    return proto, src, sport, dst, dport
+
+
+def decode_tcp(data, l4, l4_len):
+    """Return (sport, dport, seq, ack, flags, window, payload_len, wscale).
+
+    ``wscale`` is the window-scale shift from the options (SYNs only),
+    or None when absent. Returns None for truncated headers.
+    """
+    if l4_len < 20 or len(data) < l4 + 20:
+        return None
+    sport, dport, seq, ack, off_flags, window = struct.unpack_from('!HHIIHH', data, l4)
+    hlen = (off_flags >> 12) * 4
+    flags = off_flags & 0x3f
+    if hlen < 20 or hlen > l4_len:
+        return None
+    wscale = None
+    if flags & TCP_SYN and hlen > 20:
+        i, end = l4 + 20, min(l4 + hlen, len(data))
+        while i < end:
+            kind = data[i]
+            if kind == TCPOPT_EOL:
+                break
+            if kind == TCPOPT_NOP:
+                i += 1
+                continue
+            if i + 1 >= end or data[i + 1] < 2:
+                break
+            if kind == TCPOPT_WSCALE and data[i + 1] == 3 and i + 2 < end:
+                wscale = min(data[i + 2], 14)
+            i += data[i + 1]
+    return sport, dport, seq, ack, flags, window, l4_len - hlen, wscale
+
+
+def format_flow(key):
+    proto, src, sport, dst, dport = key
+    return f"{PROTO_NAMES.get(proto, proto)} {src}:{sport} > {dst}:{dport}"
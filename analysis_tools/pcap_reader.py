@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Streaming pcap/pcapng reader.
+
+Walks the capture through a memory map and decodes only the per-record
+headers, so memory stays flat no matter how large the file is. Packet
+bytes are handed out as memoryview slices of the map when asked for;
+full protocol dissection is left to scapy (see ``dissect``).
+"""
+
+import mmap, os, struct
+from array import array
+
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_BOM = 0x1a2b3c4d
+
+# pcapng block types we care about
+BT_IDB = 0x00000001   # interface description
+BT_PB = 0x00000002    # obsolete packet block
+BT_SPB = 0x00000003   # simple packet block
+BT_EPB = 0x00000006   # enhanced packet block
+
+OPT_IF_TSRESOL = 9
+OPT_IF_TSOFFSET = 14
+
+
+class PcapFormatError(ValueError):
+    pass
+
+
+class PcapReader:
+    """Iterate over the records of a pcap or pcapng file.
+
+    ``records()`` yields ``(ts, caplen, wirelen)`` tuples and
+    ``packets()`` yields ``(ts, linktype, data)`` where ``data`` is a
+    memoryview into the mapped file (valid until the reader is closed).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, 'rb')
+        self._mm = self._view = None
+        try:
+            if os.fstat(self._f.fileno()).st_size < 4:
+                raise PcapFormatError(f"{path}: file too short")
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mm)
+            magic = struct.unpack_from('<I', self._mm, 0)[0]
+            self.is_pcapng = magic == PCAPNG_SHB
+            if not self.is_pcapng:
+                self._init_pcap()
+        except:
+            self.close()    # bad magic or truncated header: don't leak the fd and mapping
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mm is not None:
+            try: self._mm.close()
+            except BufferError: pass   # caller still holds packet views
+        self._f.close()
+
+    # ---- classic pcap -------------------------------------------------
+    def _init_pcap(self):
+        mm = self._mm
+        if len(mm) < 24:
+            raise PcapFormatError(f"{self.path}: truncated pcap header")
+        for endian in ('<', '>'):
+            magic = struct.unpack_from(endian + 'I', mm, 0)[0]
+            if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                break
+        else:
+            raise PcapFormatError(f"{self.path}: not a pcap/pcapng file")
+        self._endian = endian
+        self._ts_div = 1e9 if magic == PCAP_MAGIC_NS else 1e6
+        self.linktype = struct.unpack_from(endian + 'I', mm, 20)[0] & 0x0fffffff
+
+    def _iter_pcap(self, with_data):
+        mm, view = self._mm, self._view
+        rec = struct.Struct(self._endian + 'IIII')
+        unpack = rec.unpack_from
+        div, linktype = self._ts_div, self.linktype
+        off, end = 24, len(mm)
+        while off + 16 <= end:
+            sec, frac, caplen, wirelen = unpack(mm, off)
+            off += 16
+            if off + caplen > end:
+                break   # truncated trailing record
+            ts = sec + frac / div
+            if with_data:
+                yield ts, linktype, view[off:off + caplen]
+            else:
+                yield ts, caplen, wirelen
+            off += caplen
+
+    # ---- pcapng -------------------------------------------------------
+    def _iter_pcapng(self, with_data):
+        mm, view = self._mm, self._view
+        end = len(mm)
+        off = 0
+        endian = '<'
+        ifaces = []   # (linktype, ts_divisor, ts_offset) per interface id
+        while off + 12 <= end:
+            btype, blen = struct.unpack_from(endian + 'II', mm, off)
+            if btype == PCAPNG_SHB:
+                bom = struct.unpack_from('<I', mm, off + 8)[0]
+                if bom == PCAPNG_BOM:
+                    endian = '<'
+                elif bom == 0x4d3c2b1a:
+                    endian = '>'
+                else:
+                    raise PcapFormatError(f"{self.path}: bad byte-order magic")
+                blen = struct.unpack_from(endian + 'I', mm, off + 4)[0]
+                ifaces = []   # interface ids restart in every section
+            if blen < 12 or off + blen > end:
+                break   # truncated trailing block
+            if btype == BT_EPB:
+                iface, ts_hi, ts_lo, caplen, wirelen = struct.unpack_from(
+                    endian + 'IIIII', mm, off + 8)
+                linktype, div, tsoff = ifaces[iface]
+                ts = ((ts_hi << 32) | ts_lo) / div + tsoff
+                if with_data:
+                    yield ts, linktype, view[off + 28:off + 28 + caplen]
+                else:
+                    yield ts, caplen, wirelen
+            elif btype == BT_PB:
+                iface, _drops, ts_hi, ts_lo, caplen, wirelen = struct.unpack_from(
+                    endian + 'HHIIII', mm, off + 8)
+                linktype, div, tsoff = ifaces[iface]
+                ts = ((ts_hi << 32) | ts_lo) / div + tsoff
+                if with_data:
+                    yield ts, linktype, view[off + 28:off + 28 + caplen]
+                else:
+                    yield ts, caplen, wirelen
+            elif btype == BT_SPB:
+                # No timestamp in simple packet blocks; nothing to bin on.
+                pass
+            elif btype == BT_IDB:
+                ifaces.append(self._parse_idb(mm, off, blen, endian))
+            off += blen
+
+    @staticmethod
+    def _parse_idb(mm, off, blen, endian):
+        linktype = struct.unpack_from(endian + 'H', mm, off + 8)[0]
+        div, tsoff = 1e6, 0
+        opt, opt_end = off + 16, off + blen - 4
+        while opt + 4 <= opt_end:
+            code, olen = struct.unpack_from(endian + 'HH', mm, opt)
+            if code == 0:
+                break
+            if code == OPT_IF_TSRESOL and olen >= 1:
+                res = mm[opt + 4]
+                div = float(2 ** (res & 0x7f)) if res & 0x80 else float(10 ** res)
+            elif code == OPT_IF_TSOFFSET and olen >= 8:
+                tsoff = struct.unpack_from(endian + 'q', mm, opt + 4)[0]
+            opt += 4 + ((olen + 3) & ~3)
+        return linktype, div, tsoff
+
+    # ---- public -------------------------------------------------------
+    def records(self):
+        """Yield (timestamp, captured length, wire length) per packet."""
+        if self.is_pcapng:
+            return self._iter_pcapng(False)
+        return self._iter_pcap(False)
+
+    def packets(self):
+        """Yield (timestamp, linktype, memoryview of packet bytes)."""
+        if self.is_pcapng:
+            return self._iter_pcapng(True)
+        return self._iter_pcap(True)
+
+
+def iter_records(path):
+    """Stream (ts, caplen, wirelen) tuples from a capture file."""
+    with PcapReader(path) as r:
+        yield from r.records()
+
+
+def dissect(path):
+    """Full scapy dissection, for when protocol fields are actually needed."""
+    from scapy.all import rdpcap   # heavy import, only on demand
+    return rdpcap(path)
+
+
+def iter_chunks(path, chunk_size=65536):
+    """Stream (timestamps, caplens) in fixed-size array chunks.
+
+    Chunks are stdlib ``array`` objects ('d' and 'q'), which expose the
+    buffer protocol so NumPy can wrap them without copying.
+    """
+    ts, lens = array('d'), array('q')
+    with PcapReader(path) as r:
+        for t, caplen, _wirelen in r.records():
+            ts.append(t)
+            lens.append(caplen)
+            if len(ts) >= chunk_size:
+                yield ts, lens
+                ts, lens = array('d'), array('q')
+    if ts:
+        yield ts, lens
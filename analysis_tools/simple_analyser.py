@@ -1,22 +1,264 @@
 #!/usr/bin/env python3
-import sys
+"""One-pass TCP flow analysis over a pcap/pcapng capture.
+
+Tracks every connection in both directions and reports, per flow,
+retransmissions, out-of-order and lost (not captured) segments,
+zero-window and window-full events, and handshake / ACK based RTT
+samples. Per-flow state is capped (``MAX_UNACKED`` and ``MAX_HOLES``),
+so memory does not grow with the length of a connection.
+"""
+
+import os, sys, json, argparse
+from collections import OrderedDict
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from analysis_tools.pcap_reader import PcapReader
+from analysis_tools.packet_decode import (decode_ip, decode_tcp, PROTO_TCP,
+                                          TCP_SYN, TCP_FIN, TCP_RST, TCP_ACK)
+
+MAX_UNACKED = 1024        # in-flight segments remembered for RTT sampling
+MAX_HOLES = 64            # sequence gaps remembered to tell reordering from loss
+REORDER_WINDOW = 0.003    # a gap filled within max(this, srtt) counts as out-of-order
+SEQ_MOD = 1 << 32
+
+
+class Direction:
+    """State for one direction (sender -> receiver) of a connection."""
+
+    __slots__ = ("isn", "next_seq", "wscale", "window", "last_ack", "packets", "bytes",
+                 "payload_bytes", "retransmissions", "out_of_order", "lost_segments",
+                 "zero_window", "window_full", "dup_acks", "keepalives", "holes", "unacked",
+                 "rtt_count", "rtt_sum", "rtt_min", "rtt_max", "srtt", "syn_ts")
+
+    def __init__(self):
+        self.isn = None
+        self.next_seq = 0            # relative sequence just past the highest byte seen
+        self.wscale = None
+        self.window = None           # last advertised window, scaled
+        self.last_ack = None         # relative to the *peer's* ISN
+        self.packets = self.bytes = self.payload_bytes = 0
+        self.retransmissions = self.out_of_order = self.lost_segments = 0
+        self.zero_window = self.window_full = self.dup_acks = self.keepalives = 0
+        self.holes = []              # [start, end, first_seen_ts]
+        self.unacked = OrderedDict() # end seq -> send ts, oldest first
+        self.rtt_count = 0
+        self.rtt_sum = 0.0
+        self.rtt_min = self.rtt_max = self.srtt = None
+        self.syn_ts = None
+
+    def rel(self, seq):
+        # relative to ISN, modulo 2**32 (fine for flows under 4 GiB)
+        return (seq - self.isn) % SEQ_MOD
+
+    def add_rtt(self, sample):
+        self.rtt_count += 1
+        self.rtt_sum += sample
+        self.rtt_min = sample if self.rtt_min is None else min(self.rtt_min, sample)
+        self.rtt_max = sample if self.rtt_max is None else max(self.rtt_max, sample)
+        self.srtt = sample if self.srtt is None else 0.875 * self.srtt + 0.125 * sample
+
+    def summary(self):
+        return {
+            "packets": self.packets, "bytes": self.bytes, "payload_bytes": self.payload_bytes,
+            "retransmissions": self.retransmissions, "out_of_order": self.out_of_order,
+            "lost_segments": self.lost_segments, "zero_window": self.zero_window,
+            "window_full": self.window_full, "dup_acks": self.dup_acks,
+            "rtt_samples": self.rtt_count,
+            "rtt_min_ms": _ms(self.rtt_min), "rtt_avg_ms": _ms(self.rtt_sum / self.rtt_count) if self.rtt_count else None,
+            "rtt_max_ms": _ms(self.rtt_max),
+        }
+
+
+def _ms(v):
+    return None if v is None else round(v * 1000, 3)
+
+
+class Connection:
+    def __init__(self, client, server, ts):
+        self.client, self.server = client, server   # (addr, port); client = first sender seen
+        self.first_ts = self.last_ts = ts
+        self.fwd, self.rev = Direction(), Direction()   # client->server, server->client
+        self.handshake_rtt = None
+        self.syn_ack_ts = None
+        self.resets = 0
+
+    def summary(self):
+        return {
+            "client": f"{self.client[0]}:{self.client[1]}",
+            "server": f"{self.server[0]}:{self.server[1]}",
+            "duration_s": round(self.last_ts - self.first_ts, 6),
+            "handshake_rtt_ms": _ms(self.handshake_rtt),
+            "resets": self.resets,
+            "client_to_server": self.fwd.summary(),
+            "server_to_client": self.rev.summary(),
+        }
+
+
+class TcpFlowAnalyzer:
+    """Feed packets in capture order with ``feed``, then call ``results``."""
+
+    def __init__(self):
+        self.connections = {}
+        self.packets = self.tcp_packets = 0
+
+    def feed(self, ts, linktype, data):
+        self.packets += 1
+        ip = decode_ip(linktype, data)
+        if ip is None or ip[2] != PROTO_TCP:
+            return
+        src, dst, _proto, l4, l4_len = ip
+        tcp = decode_tcp(data, l4, l4_len)
+        if tcp is None:
+            return
+        self.tcp_packets += 1
+        sport, dport, seq, ack, flags, window, plen, wscale = tcp
+        a, b = (src, sport), (dst, dport)
+        key = (a, b) if a <= b else (b, a)
+        conn = self.connections.get(key)
+        if conn is None or (flags & TCP_SYN and not flags & TCP_ACK and conn.fwd.isn is not None
+                            and conn.client == a and seq != conn.fwd.isn):
+            # first sighting, or a new SYN reusing the 4-tuple
+            conn = self.connections[key] = Connection(a, b, ts)
+        conn.last_ts = ts
+        if a == conn.client:
+            me, peer = conn.fwd, conn.rev
+        else:
+            me, peer = conn.rev, conn.fwd
+        self._segment(conn, me, peer, ts, seq, ack, flags, window, plen, wscale, len(data))
+
+    def _segment(self, conn, me, peer, ts, seq, ack, flags, window, plen, wscale, wirelen):
+        me.packets += 1
+        me.bytes += wirelen
+        syn, fin, rst = flags & TCP_SYN, flags & TCP_FIN, flags & TCP_RST
+        if rst:
+            conn.resets += 1
+
+        # ---- handshake ----
+        if syn:
+            me.wscale = wscale
+            if not flags & TCP_ACK:
+                me.syn_ts = ts
+            elif conn.fwd.syn_ts is not None:
+                conn.syn_ack_ts = ts
+        elif (flags & TCP_ACK and conn.handshake_rtt is None and conn.syn_ack_ts is not None
+              and me is conn.fwd and conn.fwd.syn_ts is not None):
+            conn.handshake_rtt = ts - conn.fwd.syn_ts
+        if me.isn is None:
+            me.isn = seq   # SYN seq if we saw the handshake, else first seq seen
+
+        # ---- window ----
+        scaled = window
+        if not syn and me.wscale is not None and peer.wscale is not None:
+            scaled = window << me.wscale
+        if window == 0 and not (syn or fin or rst):
+            me.zero_window += 1
+
+        # ---- sequence space ----
+        seg_len = plen + (1 if syn else 0) + (1 if fin else 0)
+        rel_seq = me.rel(seq)
+        end = rel_seq + seg_len
+        if seg_len:
+            me.payload_bytes += plen
+            fresh = rel_seq >= me.next_seq
+            if rel_seq > me.next_seq:
+                me.lost_segments += 1
+                if len(me.holes) >= MAX_HOLES:
+                    me.holes.pop(0)
+                me.holes.append([me.next_seq, rel_seq, ts])
+                me.next_seq = end
+            elif rel_seq == me.next_seq:
+                me.next_seq = end
+            elif plen <= 1 and end == me.next_seq and not (syn or fin):
+                me.keepalives += 1
+            else:
+                self._fill_hole(me, rel_seq, end, ts)
+                me.next_seq = max(me.next_seq, end)
+            # window full: this segment used up the receiver's whole window
+            if plen and peer.window is not None and peer.last_ack is not None \
+                    and end == peer.last_ack + peer.window:
+                me.window_full += 1
+            if fresh:   # only never-sent data gives unambiguous RTT samples (Karn)
+                if len(me.unacked) >= MAX_UNACKED:
+                    me.unacked.popitem(last=False)
+                me.unacked[end] = ts
+
+        # ---- ACKs / RTT (our ACK acknowledges the peer's data) ----
+        if flags & TCP_ACK and peer.isn is not None:
+            rel_ack = peer.rel(ack)
+            if (me.last_ack is not None and rel_ack == me.last_ack and plen == 0
+                    and not (syn or fin or rst) and scaled == me.window):
+                me.dup_acks += 1
+            if me.last_ack is None or rel_ack > me.last_ack:
+                sample = None
+                while peer.unacked:
+                    seg_end, sent = next(iter(peer.unacked.items()))
+                    if seg_end > rel_ack:
+                        break
+                    peer.unacked.popitem(last=False)
+                    sample = ts - sent   # newest segment covered by this ACK
+                if sample is not None and sample >= 0:
+                    peer.add_rtt(sample)
+                me.last_ack = rel_ack
+        me.window = scaled
+
+    @staticmethod
+    def _fill_hole(me, start, end, ts):
+        """Segment below the highest seq: reordering if it fills a fresh gap."""
+        # anything in flight past this point is now ambiguous for RTT (Karn)
+        for k in [k for k in me.unacked if k > start]:
+            del me.unacked[k]
+        threshold = max(REORDER_WINDOW, me.srtt or 0.0)
+        for i, (h_start, h_end, h_ts) in enumerate(me.holes):
+            if start < h_end and end > h_start:
+                if ts - h_ts <= threshold:
+                    me.out_of_order += 1
+                else:
+                    me.retransmissions += 1
+                if start <= h_start and end >= h_end:
+                    me.holes.pop(i)
+                elif start <= h_start:
+                    me.holes[i][0] = end
+                elif end >= h_end:
+                    me.holes[i][1] = start
+                return
+        me.retransmissions += 1
+
+    def results(self):
+        return [c.summary() for c in sorted(self.connections.values(), key=lambda c: c.first_ts)]
+
+
+def analyze_pcap(pcap_file, as_json=False):
+    """Analyse every TCP connection in ``pcap_file`` and print a report."""
+    analyzer = TcpFlowAnalyzer()
+    with PcapReader(pcap_file) as r:
+        for ts, linktype, data in r.packets():
+            analyzer.feed(ts, linktype, data)
+    results = analyzer.results()
+    if as_json:
+        print(json.dumps(results, indent=2))
+        return results
 
-def analyze_pcap(pcap_file):
-    """Simple PCAP analysis without scapy"""
     print(f"Analyzing: {pcap_file}")
-    print("For detailed analysis, use: wireshark " + pcap_file)
-    print("\nBasic Wireshark filters to use:")
-    print("- tcp.analysis.retransmission (find retransmissions)")
-    print("- tcp.analysis.lost_segment (find lost packets)")
-    print("- io,stat,1 (I/O graph with 1-second intervals)")
-    print("\nLook for:")
-    print("- High retransmission rates (indicates problems)")
-    print("- Uneven throughput (indicates bottlenecks)")
-    print("- Connection resets (indicates failures)")
+    print(f"Packets: {analyzer.packets} (TCP: {analyzer.tcp_packets}), connections: {len(results)}")
+    for c in results:
+        hs = f"{c['handshake_rtt_ms']} ms" if c['handshake_rtt_ms'] is not None else "not captured"
+        print(f"\n{c['client']} -> {c['server']}  duration={c['duration_s']}s  handshake RTT={hs}  resets={c['resets']}")
+        for label, d in (("  c->s", c["client_to_server"]), ("  s->c", c["server_to_client"])):
+            rtt = (f"rtt min/avg/max={d['rtt_min_ms']}/{d['rtt_avg_ms']}/{d['rtt_max_ms']} ms ({d['rtt_samples']})"
+                   if d["rtt_samples"] else "rtt n/a")
+            print(f"{label} pkts={d['packets']} payload={d['payload_bytes']}B retrans={d['retransmissions']} "
+                  f"ooo={d['out_of_order']} lost={d['lost_segments']} zero_win={d['zero_window']} "
+                  f"win_full={d['window_full']} dup_ack={d['dup_acks']} {rtt}")
+    return results
+
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python simple_analyzer.py <pcap_file>")
-        sys.exit(1)
-    
-    analyze_pcap(sys.argv[1])
+    parser = argparse.ArgumentParser(description="One-pass TCP flow analysis of a capture")
+    parser.add_argument("pcap_file")
+    parser.add_argument("--json", action="store_true", help="print per-flow results as JSON")
+    args = parser.parse_args()
+    analyze_pcap(args.pcap_file, args.json)
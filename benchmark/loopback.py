@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Loopback benchmark: each case's simple and fixed pair, before/after.
+
+Every receiver/sender pair runs in-process, on threads, in a fresh
+spawned child (so metrics and leftover threads never leak between
+pairs) on an ephemeral port. The child reads the pair's own metrics
+from ``common.metrics.REGISTRY`` and samples ``rx_level`` while it runs:
+
+    goodput_bps     bytes delivered to the application per second
+                    (case2: records processed x mean record size)
+    drop_rate       dropped / offered, in the receiver's own unit
+                    (chunks, records, or bytes for fixed case3)
+    queue_mean/max  the receiver's level: buffer fill, queue length or
+                    bytes used this interval
+    latency_*_ms    send-stamp to processing, fixed receivers only
+
+A pair ends when its receiver does, or ``DRAIN_SEC`` after its sender
+finishes, or at the hard limit. Results go to a JSON file that
+``compare`` checks against a saved baseline, exiting 1 on a regression:
+
+    python -m benchmark.loopback run --out baseline.json
+    python -m benchmark.loopback run --out new.json --baseline baseline.json
+    python -m benchmark.loopback compare baseline.json new.json --tolerance 0.1
+"""
+
+import os, sys, json, time, socket, platform, tempfile, threading, argparse, multiprocessing, queue
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_OUT = os.path.join(PROJECT_ROOT, "analysis_output", "benchmark.json")
+SAMPLE_SEC = 0.02       # rx_level sampling period
+DRAIN_SEC = 1.0         # time the receiver gets after the sender finishes
+STARTUP_SEC = 0.3       # receiver bind/listen before the sender connects
+CASES = ("case1", "case2", "case3")
+VARIANTS = ("simple", "fixed")
+
+# metric -> (direction, absolute floor): a change only counts past the
+# relative tolerance and the floor, so near-zero values do not flap
+CHECKS = {
+    "goodput_bps": ("higher", 0.0),
+    "drop_rate": ("lower", 0.01),
+    "latency_p50_ms": ("lower", 1.0),
+    "latency_p99_ms": ("lower", 1.0),
+}
+
+
+def free_port(host="localhost"):
+    """An unused TCP port (released again, so a receiver can bind it)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+# ---- pairs ---------------------------------------------------------
+# build(port, logger, seconds) -> (serve, run, receiver object or None)
+
+def _case1_simple(port, logger, seconds):
+    from case1_buffer_overflow import simple_receiver, simple_sender
+    return (lambda: simple_receiver.start_receiver(port, logger),
+            lambda: simple_sender.start_sender(port, overload=True), None)
+
+def _case1_fixed(port, logger, seconds):
+    from case1_buffer_overflow.fixed_receiver_case1 import ReceiverFixed
+    from case1_buffer_overflow.fixed_sender_case1 import SenderFixed
+    rx, tx = ReceiverFixed(logger=logger, port=port), SenderFixed(port=port)
+    return rx.serve, lambda: tx.run(total_packets=sys.maxsize, seconds=seconds), rx
+
+def _case2_simple(port, logger, seconds):
+    from case2_long_queue import case2_receiver, case2_sender
+    return (lambda: case2_receiver.start_receiver(port, logger),
+            lambda: case2_sender.start_sender(port, burst_mode=True), None)
+
+def _case2_fixed(port, logger, seconds):
+    from case2_long_queue.fixed_receiver_case2 import FixedReceiverCase2
+    from case2_long_queue.fixed_sender_case2 import FixedSenderCase2
+    rx, tx = FixedReceiverCase2(logger=logger, seed=0, port=port), FixedSenderCase2(port=port)
+    return rx.serve, lambda: tx.run(seconds=seconds), rx
+
+def _case3_simple(port, logger, seconds):
+    from case3_bandwidth_limit import case3_receiver, case3_sender
+    return (lambda: case3_receiver.start_receiver(port, logger),
+            lambda: case3_sender.start_sender(port, high_rate=True), None)
+
+def _case3_fixed(port, logger, seconds):
+    from case3_bandwidth_limit.fixed_receiver_case3 import FixedReceiverCase3
+    from case3_bandwidth_limit.fixed_sender_case3 import FixedSenderCase3
+    rx, tx = FixedReceiverCase3(logger=logger, port=port), FixedSenderCase3(port=port)
+    return rx.serve, lambda: tx.run(seconds=seconds), rx
+
+PAIRS = {
+    ("case1", "simple"): _case1_simple, ("case1", "fixed"): _case1_fixed,
+    ("case2", "simple"): _case2_simple, ("case2", "fixed"): _case2_fixed,
+    ("case3", "simple"): _case3_simple, ("case3", "fixed"): _case3_fixed,
+}
+
+
+def _delivered_bytes(case, v):
+    if case == "case2":
+        frames = v("tx_frames_total") or 0
+        return (v("rx_processed_total") or 0) * ((v("tx_bytes_total") or 0) / frames if frames else 0)
+    return v("rx_bytes_total") or 0
+
+def _drop_rate(case, v):
+    dropped_bytes = v("rx_dropped_bytes_total")
+    if dropped_bytes is not None:
+        total = dropped_bytes + (v("rx_bytes_total") or 0)
+        return dropped_bytes / total if total else 0.0
+    dropped = v("rx_dropped_total") or 0
+    offered = v("rx_frames_total") or 0
+    if v("rx_dropped_total", reason="tail") is None:
+        offered += dropped   # only the fixed case2 receiver counts dropped arrivals as frames
+    return dropped / offered if offered else 0.0
+
+
+def run_pair(case, variant, seconds=10.0, verbose=False):
+    """Run one pair in this process and return its result dict."""
+    from common.metrics import REGISTRY
+    from logging_util import BufferLogger
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+    tmp = tempfile.mkdtemp(prefix="bench_")
+    port = free_port()
+    serve, run, rx = PAIRS[case, variant](port, BufferLogger(os.path.join(tmp, "level_log.txt")), seconds)
+
+    rx_thread = threading.Thread(target=serve, daemon=True)
+    tx_thread = threading.Thread(target=run, daemon=True)
+    rx_thread.start()
+    time.sleep(STARTUP_SEC)
+    t0 = time.monotonic()
+    tx_thread.start()
+
+    levels, tx_done = [], None
+    limit = t0 + max(3 * seconds, seconds + 30)
+    while rx_thread.is_alive() and time.monotonic() < limit:
+        level = REGISTRY.value("rx_level", case=case)
+        if level is not None:
+            levels.append(level)
+        if tx_done is None and not tx_thread.is_alive():
+            tx_done = time.monotonic()
+        if tx_done is not None and time.monotonic() - tx_done >= DRAIN_SEC:
+            break
+        time.sleep(SAMPLE_SEC)
+    elapsed = time.monotonic() - t0
+    completed = tx_done is not None or not tx_thread.is_alive()
+
+    v = lambda name, **labels: REGISTRY.value(name, case=case, **labels)
+    delivered = _delivered_bytes(case, v)
+    result = {
+        "case": case, "variant": variant, "elapsed_s": round(elapsed, 3),
+        "completed": completed,
+        "sent_bytes": v("tx_bytes_total") or 0,
+        "delivered_bytes": round(delivered),
+        "goodput_bps": round(delivered * 8 / elapsed, 1) if elapsed else 0.0,
+        "drop_rate": round(_drop_rate(case, v), 5),
+        "queue_mean": round(sum(levels) / len(levels), 2) if levels else None,
+        "queue_max": max(levels) if levels else None,
+        "latency_p50_ms": None, "latency_p99_ms": None, "latency_p999_ms": None,
+    }
+    hist = getattr(rx, "latency", None)
+    if hist is not None and hist.count:
+        s = hist.summary()
+        result.update(latency_p50_ms=s["p50_ms"], latency_p99_ms=s["p99_ms"], latency_p999_ms=s["p999_ms"])
+    return result
+
+
+def _child(case, variant, seconds, verbose, out):
+    try:
+        out.put(run_pair(case, variant, seconds, verbose))
+    except Exception as e:
+        out.put({"case": case, "variant": variant, "error": repr(e)})
+    out.close()
+    out.join_thread()   # flush the result before exiting hard
+    os._exit(0)         # receiver threads may still be blocked in recv
+
+
+def run_all(cases=CASES, variants=VARIANTS, seconds=10.0, verbose=False):
+    """Run every requested pair, one spawned child at a time."""
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for case in cases:
+        for variant in variants:
+            out = ctx.Queue()
+            p = ctx.Process(target=_child, args=(case, variant, seconds, verbose, out))
+            p.start()
+            try:
+                r = out.get(timeout=max(3 * seconds, seconds + 30) + 30)
+            except queue.Empty:
+                r = {"case": case, "variant": variant, "error": "timed out"}
+            p.join(5)
+            if p.is_alive():
+                p.terminate()
+            results[f"{case}/{variant}"] = r
+            print(f"[BENCH] {case}/{variant}: " + (r.get("error") or
+                  f"goodput={r['goodput_bps'] / 1e3:.1f} kbps drop={r['drop_rate']:.3f} "
+                  f"queue={r['queue_mean']}/{r['queue_max']} p99_ms={r['latency_p99_ms']}"))
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": platform.node(),
+            "python": platform.python_version(), "seconds": seconds, "results": results}
+
+
+def compare(base, new, tolerance=0.1):
+    """Rows of (pair, metric, base, new, change, regressed) for the CHECKS metrics
+    of every pair in ``new`` that the baseline also ran successfully."""
+    rows = []
+    for key, n in sorted(new["results"].items()):
+        b = base["results"].get(key)
+        if b is None or "error" in b:
+            continue
+        if "error" in n:
+            rows.append((key, "run", "ok", n["error"], None, True))
+            continue
+        for metric, (direction, floor) in CHECKS.items():
+            bv, nv = b.get(metric), n.get(metric)
+            if bv is None or nv is None:
+                continue
+            diff = nv - bv if direction == "lower" else bv - nv   # > 0 means worse
+            regressed = diff > max(tolerance * abs(bv), floor)
+            change = (nv - bv) / bv if bv else None
+            rows.append((key, metric, bv, nv, change, regressed))
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'pair':<14}{'metric':<16}{'baseline':>14}{'new':>14}{'change':>9}")
+    for key, metric, bv, nv, change, regressed in rows:
+        ch = f"{change * 100:+.1f}%" if change is not None else ""
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{key:<14}{metric:<16}{str(bv):>14}{str(nv):>14}{ch:>9}{flag}")
+    bad = sum(1 for r in rows if r[5])
+    print(f"[BENCH] {bad} regression(s)" if bad else "[BENCH] no regressions")
+    return bad
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Loopback benchmark of the simple and fixed pairs")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run", help="run the pairs and write JSON results")
+    p_run.add_argument("--cases", default=",".join(CASES))
+    p_run.add_argument("--variants", default=",".join(VARIANTS))
+    p_run.add_argument("--seconds", type=float, default=10.0, help="fixed senders' run time")
+    p_run.add_argument("--out", default=DEFAULT_OUT)
+    p_run.add_argument("--baseline", help="compare against this results file afterwards")
+    p_run.add_argument("--tolerance", type=float, default=0.1, help="relative change allowed")
+    p_run.add_argument("--verbose", action="store_true", help="keep the pairs' own output")
+    p_cmp = sub.add_parser("compare", help="flag regressions of NEW against BASELINE")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.cmd == "run":
+        report = run_all(args.cases.split(","), args.variants.split(","), args.seconds, args.verbose)
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] Saved: {args.out}")
+        if args.baseline:
+            sys.exit(1 if print_comparison(compare(_load(args.baseline), report, args.tolerance)) else 0)
+    else:
+        sys.exit(1 if print_comparison(compare(_load(args.baseline), _load(args.new), args.tolerance)) else 0)
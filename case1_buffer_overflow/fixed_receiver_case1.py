@@ -1,35 +1,75 @@
 #!/usr/bin/env python3
 # File: case1_buffer_overflow/fixed_receiver_case1.py (REPLACE YOUR EXISTING FILE)
 
-import socket, time, threading, json
-from logging_util import BufferLogger  # NEW LINE ADDED
+import socket, time, threading, sys
+from collections import deque
+from logging_util import BufferLogger, make_logger  # NEW LINE ADDED
+from common.async_receiver import AsyncReceiver, ReceiverPolicy
+from common.wire import FT_DATA, LEVELS, encode_control
+from common.recv_buffer import RecvBuffer
+from common.metrics import REGISTRY, serve_from_argv
+from common.latency import LatencyHistogram, export, read_stamp
 
 HOST, PORT = 'localhost', 5000
 APP_BUFFER_LIMIT = 1024 * 200  # 200 KB (was tiny before)
 LOW_WATERMARK = int(APP_BUFFER_LIMIT * 0.5)
 HIGH_WATERMARK = int(APP_BUFFER_LIMIT * 0.9)
+# recomputed by common.settings.apply_settings when APP_BUFFER_LIMIT is overridden
+DERIVED = {"LOW_WATERMARK": lambda: int(APP_BUFFER_LIMIT * 0.5),
+           "HIGH_WATERMARK": lambda: int(APP_BUFFER_LIMIT * 0.9)}
+STAMP_OFFSET = 9   # sender's send time follows "PKTnnnnnn"
+
+RX_BYTES = REGISTRY.counter("rx_bytes_total", "Application bytes accepted", case="case1")
+RX_LEVEL = REGISTRY.gauge("rx_level", "Case level: buffer fill (B), queue length (items) or bytes used this interval", case="case1")
+CONTROL_SENT = {lv: REGISTRY.counter("rx_control_sent_total", "Control messages sent", case="case1", level=lv)
+                for lv in LEVELS}
+
+def buffer_level(app_buffer, low=None, high=None):
+    """Feedback level for the sender given the current app buffer fill."""
+    low = LOW_WATERMARK if low is None else low
+    high = HIGH_WATERMARK if high is None else high
+    if app_buffer >= high:
+        return "SLOW"   # ask sender to slow down
+    if app_buffer <= low:
+        return "FAST"   # sender can speed up (within reason)
+    return "OK"
+
+def drain_frames(frames, nbytes, latency, now):
+    """Take nbytes off the front of the buffered [bytes, send_time] frames,
+    recording send-to-process latency for each frame fully drained."""
+    while nbytes and frames:
+        head = frames[0]
+        if head[0] > nbytes:
+            head[0] -= nbytes
+            return
+        nbytes -= head[0]
+        frames.popleft()
+        if head[1] is not None:
+            latency.record(now - head[1])
 
 class ReceiverFixed:
-    def __init__(self):
+    def __init__(self, legacy=False, logger=None, port=PORT):
+        self.legacy = legacy        # True: "#CTRL#" JSON lines instead of binary frames
+        self.port = port
         self.app_buffer = 0
         self.conn = None
         self.lock = threading.Lock()
-        self.logger = BufferLogger('case1_buffer_overflow/buffer_log.txt')  # NEW LINE ADDED
+        self.logger = logger or BufferLogger('case1_buffer_overflow/buffer_log.txt')  # NEW LINE ADDED
+        self.frames = deque()       # [bytes left, send time] per buffered frame, oldest first
+        self.latency = LatencyHistogram()   # send -> drained from the app buffer
+        export(self.latency, "rx_latency_seconds", "One-way send-to-process latency", case="case1")
 
     def control_sender(self):
         """Periodically send buffer status as control messages."""
         while self.conn:
             with self.lock:
-                level = "OK"
-                if self.app_buffer >= HIGH_WATERMARK:
-                    level = "SLOW"   # ask sender to slow down
-                elif self.app_buffer <= LOW_WATERMARK:
-                    level = "FAST"   # sender can speed up (within reason)
+                level = buffer_level(self.app_buffer)
                 msg = {"type":"buffer_status","buffer":self.app_buffer,"level":level}
             try:
-                self.conn.sendall(("#CTRL#" + json.dumps(msg) + "\n").encode())
+                self.conn.sendall(encode_control(msg, self.legacy))
             except:
                 break
+            CONTROL_SENT[level].inc()
             time.sleep(0.2)
 
     def process(self):
@@ -38,54 +78,45 @@ class ReceiverFixed:
             with self.lock:
                 drain = min(4096, self.app_buffer)  # drain 4 KB per tick
                 self.app_buffer -= drain
+                drain_frames(self.frames, drain, self.latency, time.time())
             time.sleep(0.01)
 
     def serve(self):
         self.logger.start()  # NEW LINE ADDED
+        RX_LEVEL.set_function(lambda: self.app_buffer)
         try:  # NEW TRY BLOCK ADDED
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind((HOST, PORT)); s.listen(1)
-            print(f"[RX] Fixed receiver on {HOST}:{PORT} (buffer={APP_BUFFER_LIMIT}B)")
+            s.bind((HOST, self.port)); s.listen(1)
+            print(f"[RX] Fixed receiver on {HOST}:{self.port} (buffer={APP_BUFFER_LIMIT}B)")
             self.conn, addr = s.accept()
             print(f"[RX] Client {addr} connected")
 
             threading.Thread(target=self.process, daemon=True).start()
             threading.Thread(target=self.control_sender, daemon=True).start()
 
-            buf = b""
+            rb = RecvBuffer(legacy=self.legacy)
             while True:
                 try:
-                    data = self.conn.recv(8192)
-                    if not data: break
-                    buf += data
-                    # Strip control lines from data buffer (sender never embeds "#CTRL#" in data)
-                    while b"#CTRL#" in buf:
-                        i = buf.find(b"#CTRL#")
-                        if i > 0:
-                            # count preceding app-data bytes into buffer
-                            with self.lock:
-                                self.app_buffer += i
-                            buf = buf[i:]
-                        # remove control line
-                        nl = buf.find(b"\n")
-                        if nl == -1: break
-                        ctrl_line = buf[:nl+1]
-                        buf = buf[nl+1:]
-                    # Remaining pure app data
-                    if buf:
-                        with self.lock:
-                            self.app_buffer += len(buf)
-                        buf = b""
-                    
-                    # Log current buffer size for analysis
+                    if not rb.recv_from(self.conn): break
+                    # Count app-data bytes only; control frames/lines are skipped.
+                    # Legacy chunks do not line up with the sender's frames: no stamps.
+                    n = 0
                     with self.lock:
+                        for ftype, payload in rb.events():
+                            if ftype == FT_DATA:
+                                n += len(payload)
+                                self.frames.append([len(payload), None if self.legacy else read_stamp(payload, STAMP_OFFSET)])
+                        RX_BYTES.inc(n)
+                        self.app_buffer += n
+                        # Log current buffer size for analysis
                         self.logger.update_buffer_size(self.app_buffer)  # NEW LINE ADDED
                         
                 except Exception as e:
                     print(f"[RX] Error: {e}"); break
 
             print("[RX] Closing")
+            print(f"[RX] latency send->process: {self.latency.format()}")
             try: self.conn.close()
             except: pass
             s.close()
@@ -93,5 +124,63 @@ class ReceiverFixed:
         finally:  # NEW FINALLY BLOCK ADDED
             self.logger.stop()  # NEW LINE ADDED
 
+class Case1Policy(ReceiverPolicy):
+    """ReceiverFixed's buffer and watermark feedback, one app buffer per sender."""
+    name = "RX"
+    control_interval = 0.2
+    tick_interval = 0.01        # drain 4 KB per connection per tick
+
+    class State:
+        __slots__ = ("app_buffer", "frames")
+        def __init__(self):
+            self.app_buffer = 0
+            self.frames = deque()
+
+    def __init__(self):
+        self.states = set()
+        self.latency = LatencyHistogram()
+        RX_LEVEL.set_function(self.level)
+        export(self.latency, "rx_latency_seconds", "One-way send-to-process latency", case="case1")
+
+    def open(self, conn):
+        print(f"[RX] Client {conn.peer} connected")
+        st = self.State()
+        self.states.add(st)
+        return st
+
+    def data(self, conn, data):
+        st = conn.state
+        st.app_buffer += len(data)
+        st.frames.append([len(data), None if conn.server.legacy else read_stamp(data, STAMP_OFFSET)])
+        RX_BYTES.inc(len(data))
+
+    def tick(self, now):
+        wall = time.time()
+        for st in self.states:
+            drain = min(4096, st.app_buffer)
+            st.app_buffer -= drain
+            drain_frames(st.frames, drain, self.latency, wall)
+
+    def control(self, conn):
+        st = conn.state
+        level = buffer_level(st.app_buffer)
+        CONTROL_SENT[level].inc()
+        return {"type":"buffer_status","buffer":st.app_buffer,"level":level}
+
+    def close(self, conn):
+        self.states.discard(conn.state)
+
+    def level(self):
+        return sum(st.app_buffer for st in self.states)
+
+    def report(self):
+        print(f"[RX] latency send->process: {self.latency.format()}")
+
 if __name__ == "__main__":
-    ReceiverFixed().serve()
\ No newline at end of file
+    legacy = "--legacy" in sys.argv
+    serve_from_argv()
+    if "--async" in sys.argv:
+        AsyncReceiver(Case1Policy(), HOST, PORT, legacy=legacy,
+                      logger=make_logger('case1_buffer_overflow/buffer_log.txt')).serve()
+    else:
+        ReceiverFixed(legacy=legacy, logger=make_logger('case1_buffer_overflow/buffer_log.txt')).serve()
\ No newline at end of file
@@ -1,18 +1,48 @@
 #!/usr/bin/env python3
-import socket, time, json, threading, sys
+import socket, time, threading, sys
+from common.wire import FT_CTRL, ProtocolError, make_decoder
+from common.sender_engine import SenderEngine, SizedFrames
+from common.pacing import Pacer
+from common.metrics import REGISTRY, serve_from_argv
+from common.latency import STAMP_LEN, make_stamp
 
 HOST, PORT = 'localhost', 5000
+STAMP_OFFSET = 9   # send time follows "PKTnnnnnn"
+
+TX_FRAMES = REGISTRY.counter("tx_frames_total", "Data frames (chunks) sent", case="case1")
+TX_BYTES = REGISTRY.counter("tx_bytes_total", "Payload bytes sent", case="case1")
+TX_RATE = REGISTRY.gauge("tx_rate_bps", "Current pacing target (bits/s)", case="case1")
 
 class SenderFixed:
-    def __init__(self):
+    def __init__(self, legacy=False, nodelay=None, cork=False, port=PORT):
+        self.legacy = legacy        # True: raw frames + "#CTRL#" lines instead of binary frames
+        self.nodelay, self.cork = nodelay, cork
+        self.port = port
         self.rate_delay = 0.01     # start with 10 ms between chunks
         self.chunk_size = 1024      # 1 KB chunks (smaller than before)
         self.ctrl_level = "OK"
         self.sock = None
 
+    @property
+    def rate_bps(self):
+        # one chunk per rate_delay
+        return self.chunk_size * 8 / self.rate_delay
+
+    def on_buffer_status(self, level):
+        self.ctrl_level = level
+        REGISTRY.counter("tx_control_received_total", "Control messages received", case="case1", level=level).inc()
+        if level == "SLOW":
+            # increase delay and reduce chunk size
+            self.rate_delay = min(0.05, self.rate_delay + 0.005)
+            self.chunk_size = max(512, self.chunk_size - 128)
+        elif level == "FAST":
+            # cautiously speed up
+            self.rate_delay = max(0.005, self.rate_delay - 0.002)
+            self.chunk_size = min(2048, self.chunk_size + 128)
+
     def listen_control(self):
-        """Read control lines prefixed with #CTRL# and adjust sending."""
-        buf = b""
+        """Read control messages from the receiver and adjust sending."""
+        decoder = make_decoder(self.legacy)
         while self.sock:
             try:
                 self.sock.settimeout(0.05)
@@ -21,47 +51,46 @@ class SenderFixed:
                 data = b""
             if not data:
                 time.sleep(0.02); continue
-            buf += data
-            while b"#CTRL#" in buf:
-                i = buf.find(b"#CTRL#")
-                if i > 0:
-                    buf = buf[i:]
-                nl = buf.find(b"\n")
-                if nl == -1: break
-                line = buf[len("#CTRL#"):nl].decode(errors="ignore")
-                buf = buf[nl+1:]
+            try:
+                events = decoder.feed(data)
+            except ProtocolError as e:
+                print(f"[TX] bad control stream: {e}"); break
+            for ftype, msg in events:
+                if ftype != FT_CTRL:
+                    continue
                 try:
-                    msg = json.loads(line)
                     if msg.get("type") == "buffer_status":
-                        level = msg.get("level","OK")
-                        self.ctrl_level = level
-                        if level == "SLOW":
-                            # increase delay and reduce chunk size
-                            self.rate_delay = min(0.05, self.rate_delay + 0.005)
-                            self.chunk_size = max(512, self.chunk_size - 128)
-                        elif level == "FAST":
-                            # cautiously speed up
-                            self.rate_delay = max(0.005, self.rate_delay - 0.002)
-                            self.chunk_size = min(2048, self.chunk_size + 128)
+                        self.on_buffer_status(msg.get("level","OK"))
                 except:
                     pass
 
-    def run(self, total_packets=2000):
+    def run(self, total_packets=2000, seconds=None):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((HOST, PORT))
-        print(f"[TX] Connected to {HOST}:{PORT}")
+        self.sock.connect((HOST, self.port))
+        print(f"[TX] Connected to {HOST}:{self.port}")
         threading.Thread(target=self.listen_control, daemon=True).start()
 
+        engine = SenderEngine(self.sock, nodelay=self.nodelay, cork=self.cork)
+        # one prebuilt "PKTnnnnnn<send time>DDD..." frame per chunk size; only seq and time change
+        frames = SizedFrames(lambda size: b"PKT000000" + b"0" * STAMP_LEN + b"D" * (size - 12 - STAMP_LEN),
+                             self.legacy)
+        pacer = Pacer(self.rate_bps)
+        TX_RATE.set_function(lambda: self.rate_bps)
+        t_end = None if seconds is None else time.monotonic() + seconds
         sent = 0
-        while sent < total_packets:
-            payload = ("D"* (self.chunk_size-12)).encode()
-            frame = f"PKT{sent:06d}".encode() + payload
+        while sent < total_packets and (t_end is None or time.monotonic() < t_end):
+            pool = frames.get(self.chunk_size)
+            pool.patch(0, 3, b"%06d" % (sent % 1000000))
+            pacer.rate_bps = self.rate_bps
+            pacer.pace(self.chunk_size)
+            pool.patch(0, STAMP_OFFSET, make_stamp())
             try:
-                self.sock.sendall(frame)
+                engine.send(pool.views[0])
                 sent += 1
+                TX_FRAMES.inc()
+                TX_BYTES.inc(self.chunk_size - 3)
                 if sent % 200 == 0:
                     print(f"[TX] sent={sent}, delay={self.rate_delay*1000:.1f}ms, chunk={self.chunk_size}B, ctrl={self.ctrl_level}")
-                time.sleep(self.rate_delay)
             except Exception as e:
                 print(f"[TX] send error: {e}"); break
 
@@ -70,4 +99,6 @@ class SenderFixed:
         except: pass
 
 if __name__ == "__main__":
-    SenderFixed().run()
+    serve_from_argv()
+    SenderFixed(legacy="--legacy" in sys.argv, nodelay=True if "--nodelay" in sys.argv else None,
+                cork="--cork" in sys.argv).run()
@@ -5,13 +5,19 @@ import socket
 import time
 import sys
 from logging_util import BufferLogger  # NEW LINE ADDED
+from common.metrics import REGISTRY, serve_from_argv
 
-def start_receiver():
-    logger = BufferLogger('case1_buffer_overflow/buffer_log.txt')  # NEW LINE ADDED
+RX_FRAMES = REGISTRY.counter("rx_frames_total", "Data frames (chunks) received", case="case1")
+RX_BYTES = REGISTRY.counter("rx_bytes_total", "Application bytes accepted", case="case1")
+RX_DROPPED = REGISTRY.counter("rx_dropped_total", "Items dropped", case="case1", reason="overflow")
+RX_LEVEL = REGISTRY.gauge("rx_level", "Case level: buffer fill (B), queue length (items) or bytes used this interval", case="case1")
+
+def start_receiver(port=5000, logger=None):
+    logger = logger or BufferLogger('case1_buffer_overflow/buffer_log.txt')  # NEW LINE ADDED
     logger.start()  # NEW LINE ADDED
     
     HOST = 'localhost'
-    PORT = 5000
+    PORT = port
     BUFFER_LIMIT = 1024 * 10  # 10KB buffer (very small to force overflow)
     
     try:  # NEW TRY BLOCK ADDED
@@ -26,6 +32,7 @@ def start_receiver():
         packets_received = 0
         packets_dropped = 0
         current_buffer = 0
+        RX_LEVEL.set_function(lambda: current_buffer)
         
         conn, addr = sock.accept()
         print(f"Connected to {addr}")
@@ -39,10 +46,13 @@ def start_receiver():
                 # Check buffer overflow
                 if current_buffer + len(data) > BUFFER_LIMIT:
                     packets_dropped += 1
+                    RX_DROPPED.inc()
                     print(f"BUFFER OVERFLOW! Dropped packet {packets_dropped}")
                 else:
                     packets_received += 1
                     current_buffer += len(data)
+                    RX_FRAMES.inc()
+                    RX_BYTES.inc(len(data))
                     if packets_received % 10 == 0:
                         print(f"Received: {packets_received}, Buffer: {current_buffer}/{BUFFER_LIMIT}")
                 
@@ -64,4 +74,5 @@ def start_receiver():
         logger.stop()  # NEW LINE ADDED
 
 if __name__ == "__main__":
+    serve_from_argv()
     start_receiver()
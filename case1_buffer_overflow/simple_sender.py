@@ -2,13 +2,18 @@
 import socket
 import time
 import sys
+from common.metrics import REGISTRY, serve_from_argv
 
-def start_sender():
+TX_FRAMES = REGISTRY.counter("tx_frames_total", "Data frames (chunks) sent", case="case1")
+TX_BYTES = REGISTRY.counter("tx_bytes_total", "Payload bytes sent", case="case1")
+
+def start_sender(port=5000, overload=None):
     HOST = 'localhost'
-    PORT = 5000
+    PORT = port
     
     # Check for overload mode
-    overload = "--overload" in sys.argv
+    if overload is None:
+        overload = "--overload" in sys.argv
     
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.connect((HOST, PORT))
@@ -23,6 +28,8 @@ def start_sender():
         for i in range(1000):
             data = f"PACKET_{i}_" + "X" * 500
             sock.send(data.encode())
+            TX_FRAMES.inc()
+            TX_BYTES.inc(len(data))
             packets_sent += 1
             
             if packets_sent % 100 == 0:
@@ -34,6 +41,8 @@ def start_sender():
         for i in range(100):
             data = f"PACKET_{i}_" + "X" * 500
             sock.send(data.encode())
+            TX_FRAMES.inc()
+            TX_BYTES.inc(len(data))
             packets_sent += 1
             
             if packets_sent % 10 == 0:
@@ -45,4 +54,5 @@ def start_sender():
     sock.close()
 
 if __name__ == "__main__":
+    serve_from_argv()
     start_sender()
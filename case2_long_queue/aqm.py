@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Active queue management policies for the case2 work queue.
+
+A policy sees every record twice: ``enqueue(qlen, now)`` on arrival and
+``dequeue(sojourn, qlen, now)`` when a worker takes it, ``sojourn``
+being how long that record waited (from its enqueue timestamp). Either
+hook returns True to drop the record. ``level(qlen, now)`` gives the
+OK/SLOW/FAST feedback sent to the sender.
+
+    red    length-based RED between Q_MIN_TH and Q_MAX_TH (the original policy)
+    codel  CoDel (RFC 8289): drops at dequeue while sojourn stays above target
+    pie    PIE (RFC 8033): enqueue drop probability steered by queueing delay
+
+Random decisions use a ``random.Random`` seeded at construction, so runs
+are repeatable. ``make_aqm("codel:target=0.02,interval=0.2")`` builds a
+policy from a command-line spec.
+"""
+
+import math, random, threading
+
+from case2_long_queue import fixed_receiver_case2 as rx2
+from case2_long_queue.fixed_receiver_case2 import red_drop_probability, queue_level
+
+
+class AQM:
+    name = "none"
+
+    def __init__(self, seed=None, rng=None):
+        self.rng = rng or random.Random(seed)
+        self.drops = 0
+
+    def enqueue(self, qlen, now):
+        return False
+
+    def dequeue(self, sojourn, qlen, now):
+        return False
+
+    def level(self, qlen, now):
+        return queue_level(qlen)
+
+
+class RED(AQM):
+    """Instantaneous queue length against fixed thresholds."""
+    name = "red"
+
+    def __init__(self, min_th=None, max_th=None, seed=None, rng=None):
+        super().__init__(seed, rng)
+        # defaults read at construction, so overridden receiver settings apply
+        self.min_th = rx2.Q_MIN_TH if min_th is None else min_th
+        self.max_th = rx2.Q_MAX_TH if max_th is None else max_th
+
+    def enqueue(self, qlen, now):
+        p = red_drop_probability(qlen, self.min_th, self.max_th)
+        if p >= 1.0 or (p > 0.0 and self.rng.random() < p):
+            self.drops += 1
+            return True
+        return False
+
+    def level(self, qlen, now):
+        return queue_level(qlen, self.min_th, self.max_th)
+
+
+class CoDel(AQM):
+    """Controlled Delay: once sojourn has exceeded ``target`` for a whole
+    ``interval``, drop at dequeue with the gap shrinking as 1/sqrt(count)."""
+    name = "codel"
+
+    def __init__(self, target=0.005, interval=0.1, seed=None, rng=None):
+        super().__init__(seed, rng)
+        self.target, self.interval = target, interval
+        self.first_above = 0.0
+        self.dropping = False
+        self.drop_next = 0.0
+        self.count = self.lastcount = 0
+        self.last_sojourn = 0.0
+        self.lock = threading.Lock()   # workers dequeue concurrently
+
+    def _control_law(self, t):
+        return t + self.interval / math.sqrt(self.count)
+
+    def _ok_to_drop(self, sojourn, qlen, now):
+        if sojourn < self.target or qlen < 1:
+            self.first_above = 0.0
+            return False
+        if not self.first_above:
+            self.first_above = now + self.interval
+            return False
+        return now >= self.first_above
+
+    def dequeue(self, sojourn, qlen, now):
+        with self.lock:
+            self.last_sojourn = sojourn
+            ok = self._ok_to_drop(sojourn, qlen, now)
+            if self.dropping:
+                if not ok:
+                    self.dropping = False
+                    return False
+                if now >= self.drop_next:
+                    self.count += 1
+                    self.drop_next = self._control_law(self.drop_next)
+                    self.drops += 1
+                    return True
+                return False
+            if ok:
+                self.dropping = True
+                # resume near the previous drop rate if we left dropping recently
+                delta = self.count - self.lastcount
+                self.count = delta if delta > 1 and now - self.drop_next < 16 * self.interval else 1
+                self.lastcount = self.count
+                self.drop_next = self._control_law(now)
+                self.drops += 1
+                return True
+            return False
+
+    def level(self, qlen, now):
+        if self.dropping or self.last_sojourn > self.target:
+            return "SLOW"
+        if self.last_sojourn < self.target / 2:
+            return "FAST"
+        return "OK"
+
+
+class PIE(AQM):
+    """Proportional Integral controller Enhanced: every ``t_update`` the drop
+    probability moves by alpha*(qdelay - target) + beta*(qdelay - previous),
+    qdelay being the latest dequeued record's sojourn."""
+    name = "pie"
+
+    def __init__(self, target=0.015, t_update=0.015, alpha=0.125, beta=1.25,
+                 max_burst=0.15, seed=None, rng=None):
+        super().__init__(seed, rng)
+        self.target, self.t_update = target, t_update
+        # RFC gains are per second of delay error
+        self.alpha, self.beta = alpha, beta
+        self.max_burst = max_burst
+        self.burst_allowance = max_burst
+        self.p = 0.0
+        self.qdelay = self.qdelay_old = 0.0
+        self.next_update = None
+
+    def dequeue(self, sojourn, qlen, now):
+        self.qdelay = sojourn if qlen else 0.0
+        return False
+
+    def _update(self, now):
+        qdelay, old = self.qdelay, self.qdelay_old
+        delta = self.alpha * (qdelay - self.target) + self.beta * (qdelay - old)
+        # scale small-probability steps down (RFC 8033 section 4.2)
+        p = self.p
+        for bound, div in ((0.000001, 2048), (0.00001, 512), (0.0001, 128), (0.001, 32), (0.01, 8), (0.1, 2)):
+            if p < bound:
+                delta /= div
+                break
+        if p >= 0.1 and delta > 0.02:
+            delta = 0.02
+        p += delta
+        if qdelay == 0 and old == 0:
+            p *= 0.98   # decay when idle
+        self.p = min(1.0, max(0.0, p))
+        if self.burst_allowance > 0:
+            self.burst_allowance = max(0.0, self.burst_allowance - self.t_update)
+        elif self.p == 0 and qdelay < self.target / 2 and old < self.target / 2:
+            self.burst_allowance = self.max_burst
+        self.qdelay_old = qdelay
+
+    def enqueue(self, qlen, now):
+        if self.next_update is None:
+            self.next_update = now + self.t_update
+        while now >= self.next_update:
+            self._update(self.next_update)
+            self.next_update += self.t_update
+        if self.burst_allowance > 0 or qlen < 2:
+            return False
+        if self.qdelay_old < self.target / 2 and self.p < 0.2:
+            return False
+        if self.rng.random() < self.p:
+            self.drops += 1
+            return True
+        return False
+
+    def level(self, qlen, now):
+        if self.p > 0 and self.qdelay > self.target:
+            return "SLOW"
+        if self.p == 0 and self.qdelay < self.target / 2:
+            return "FAST"
+        return "OK"
+
+
+AQMS = {"red": RED, "codel": CoDel, "pie": PIE}
+
+
+def make_aqm(spec="red", seed=None, rng=None):
+    """Policy from ``name`` or ``name:key=value,...`` (values are floats)."""
+    name, _, args = (spec or "red").partition(":")
+    params = {}
+    for item in filter(None, args.split(",")):
+        k, _, v = item.partition("=")
+        params[k.strip()] = float(v)
+    cls = AQMS.get(name.strip().lower())
+    if cls is None:
+        raise ValueError(f"unknown AQM {name!r}; choose from {', '.join(AQMS)}")
+    return cls(seed=seed, rng=rng, **params)
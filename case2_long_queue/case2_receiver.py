@@ -5,13 +5,19 @@ import time
 import threading
 from queue import Queue
 from logging_util import BufferLogger  # NEW LINE ADDED
+from common.metrics import REGISTRY, serve_from_argv
 
-def start_receiver():
-    logger = BufferLogger('case2_long_queue/queue_log.txt')  # NEW LINE ADDED
+RX_FRAMES = REGISTRY.counter("rx_frames_total", "Data frames (chunks) received", case="case2")
+RX_BYTES = REGISTRY.counter("rx_bytes_total", "Application bytes accepted", case="case2")
+RX_PROCESSED = REGISTRY.counter("rx_processed_total", "Items processed by workers", case="case2")
+RX_LEVEL = REGISTRY.gauge("rx_level", "Case level: buffer fill (B), queue length (items) or bytes used this interval", case="case2")
+
+def start_receiver(port=5001, logger=None):
+    logger = logger or BufferLogger('case2_long_queue/queue_log.txt')  # NEW LINE ADDED
     logger.start()  # NEW LINE ADDED
     
     HOST = 'localhost'
-    PORT = 5001
+    PORT = port
     
     try:  # NEW TRY BLOCK ADDED
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -24,6 +30,7 @@ def start_receiver():
         packet_queue = Queue()
         packets_received = 0
         packets_processed = 0
+        RX_LEVEL.set_function(packet_queue.qsize)
         
         def process_queue():
             nonlocal packets_processed
@@ -32,6 +39,7 @@ def start_receiver():
                     data = packet_queue.get()
                     time.sleep(0.2)  # Slow processing (200ms per packet)
                     packets_processed += 1
+                    RX_PROCESSED.inc()
                     if packets_processed % 5 == 0:
                         print(f"Processed: {packets_processed}, Queue size: {packet_queue.qsize()}")
                 else:
@@ -51,6 +59,8 @@ def start_receiver():
                 
                 packets_received += 1
                 packet_queue.put(data)
+                RX_FRAMES.inc()
+                RX_BYTES.inc(len(data))
                 
                 # Log current queue size for analysis
                 logger.update_buffer_size(packet_queue.qsize())  # NEW LINE ADDED
@@ -71,4 +81,5 @@ def start_receiver():
         logger.stop()  # NEW LINE ADDED
 
 if __name__ == "__main__":
+    serve_from_argv()
     start_receiver()
\ No newline at end of file
@@ -2,12 +2,17 @@
 import socket
 import time
 import sys
+from common.metrics import REGISTRY, serve_from_argv
 
-def start_sender():
+TX_FRAMES = REGISTRY.counter("tx_frames_total", "Data frames (chunks) sent", case="case2")
+TX_BYTES = REGISTRY.counter("tx_bytes_total", "Payload bytes sent", case="case2")
+
+def start_sender(port=5001, burst_mode=None):
     HOST = 'localhost'
-    PORT = 5001
+    PORT = port
     
-    burst_mode = "--burst" in sys.argv
+    if burst_mode is None:
+        burst_mode = "--burst" in sys.argv
     
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.connect((HOST, PORT))
@@ -24,6 +29,8 @@ def start_sender():
             for i in range(20):
                 data = f"BURST_{burst}_PACKET_{i}_" + "Y" * 300
                 sock.send(data.encode())
+                TX_FRAMES.inc()
+                TX_BYTES.inc(len(data))
                 packets_sent += 1
                 time.sleep(0.02)  # Fast within burst
             
@@ -34,6 +41,8 @@ def start_sender():
         for i in range(50):
             data = f"NORMAL_PACKET_{i}_" + "Y" * 300
             sock.send(data.encode())
+            TX_FRAMES.inc()
+            TX_BYTES.inc(len(data))
             packets_sent += 1
             
             if packets_sent % 10 == 0:
@@ -45,4 +54,5 @@ def start_sender():
     sock.close()
 
 if __name__ == "__main__":
+    serve_from_argv()
     start_sender()
@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 
-import socket, time, threading, queue, json, random
-from logging_util import BufferLogger  # NEW LINE ADDED
+import socket, time, threading, sys, asyncio, multiprocessing, signal, queue
+from logging_util import BufferLogger, make_logger  # NEW LINE ADDED
+from common.async_receiver import AsyncReceiver, ReceiverPolicy
+from common.wire import FT_DATA, LEVELS, RecordSplitter, encode_control
+from common.recv_buffer import RecvBuffer
+from common.metrics import REGISTRY, serve_from_argv
+from common.latency import LatencyHistogram, export, read_stamp, STAMP_LEN
+from common.batch_queue import BatchQueue, get_batch_async
+from common.shm_ring import ShmRing
 
 HOST, PORT = 'localhost', 5001
 
@@ -11,82 +18,279 @@ Q_MIN_TH = 250              # RED min threshold
 Q_MAX_TH = 600              # RED max threshold
 WORKERS = 6                 # more workers to drain faster
 PROC_DELAY_SEC = 0.01       # per-item processing time
+BATCH_MAX = 8               # records a worker takes per queue access
+BATCH_WAIT_SEC = 0.0        # how long a worker lingers for a batch to fill
+RECORD_SIZE = STAMP_LEN + 1 + 512   # sender's "<time>|" + body; splits the legacy stream
+RING_SLOTS = 64             # records handed ahead to worker processes (--processes)
+RING_SLOT_BYTES = 2048      # largest record the ring carries
+
+RX_ITEMS = REGISTRY.counter("rx_frames_total", "Data frames (chunks) received", case="case2")
+RX_PROCESSED = REGISTRY.counter("rx_processed_total", "Items processed by workers", case="case2")
+RX_DROPPED = {r: REGISTRY.counter("rx_dropped_total", "Items dropped", case="case2", reason=r)
+              for r in ("red", "codel", "pie", "tail")}
+RX_LEVEL = REGISTRY.gauge("rx_level", "Case level: buffer fill (B), queue length (items) or bytes used this interval", case="case2")
+QLEN_AT_ARRIVAL = REGISTRY.histogram("rx_queue_length_at_arrival", "Queue length seen by each arriving record",
+                                     buckets=(0, 25, 50, 100, 250, 400, 600, 800), case="case2")
+CONTROL_SENT = {lv: REGISTRY.counter("rx_control_sent_total", "Control messages sent", case="case2", level=lv)
+                for lv in LEVELS}
+
+def red_drop_probability(ql, min_th=None, max_th=None):
+    """RED drop probability for a queue of length ql."""
+    min_th = Q_MIN_TH if min_th is None else min_th
+    max_th = Q_MAX_TH if max_th is None else max_th
+    if ql <= min_th:   # accept
+        return 0.0
+    if ql >= max_th:   # drop aggressively
+        return 1.0
+    # Linear probability between thresholds
+    return (ql - min_th) / float(max_th - min_th)
+
+def queue_level(ql, min_th=None, max_th=None):
+    """3-level feedback for sender."""
+    min_th = Q_MIN_TH if min_th is None else min_th
+    max_th = Q_MAX_TH if max_th is None else max_th
+    if ql >= max_th:
+        return "SLOW"
+    if ql <= min_th // 2:
+        return "FAST"
+    return "OK"
+
+def aqm_from_argv(argv=None):
+    """(spec, seed) from ``--aqm=red|codel|pie[:k=v,...]`` and ``--seed=N``."""
+    spec, seed = "red", None
+    for arg in sys.argv if argv is None else argv:
+        if arg.startswith("--aqm="):
+            spec = arg.split("=", 1)[1]
+        elif arg.startswith("--seed="):
+            seed = int(arg.split("=", 1)[1])
+    return spec, seed
+
+def batch_from_argv(argv=None):
+    """(batch size, max wait s) from ``--batch=N`` and ``--batch-wait-ms=N``."""
+    size, wait = BATCH_MAX, BATCH_WAIT_SEC
+    for arg in sys.argv if argv is None else argv:
+        if arg.startswith("--batch="):
+            size = max(1, int(arg.split("=", 1)[1]))
+        elif arg.startswith("--batch-wait-ms="):
+            wait = float(arg.split("=", 1)[1]) / 1000.0
+    return size, wait
+
+_cpu_rounds = None
+
+def do_work(data, work="sleep"):
+    """Process one record: sleep PROC_DELAY_SEC, or (work="cpu") spend about
+    that long on one core in GIL-holding Python work."""
+    global _cpu_rounds
+    if work != "cpu":
+        time.sleep(PROC_DELAY_SEC)
+        return 0
+    if _cpu_rounds is None:
+        # calibrate once per process on this thread's CPU time, so other
+        # busy threads do not make the rounds look slower than they are
+        t0, rounds, h = time.thread_time(), 0, 0
+        while time.thread_time() - t0 < 0.05:
+            for _ in range(100):
+                h = (h * 31 + sum(data)) & 0xffffffff
+            rounds += 100
+        _cpu_rounds = max(1, int(rounds * PROC_DELAY_SEC / (time.thread_time() - t0)))
+    h = 0
+    for _ in range(_cpu_rounds):
+        h = (h * 31 + sum(data)) & 0xffffffff
+    return h
+
+def process_worker(wid, ring, done, results, batch_size, work):
+    """Worker process for --processes: drain the shared ring, count processed
+    records in ``done[wid]`` and ship latency histograms back about once a second."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the receiver stops us
+    hist, n, last = LatencyHistogram(), 0, time.monotonic()
+    while True:
+        batch = ring.get_batch(batch_size, timeout=0.5)
+        if not batch and ring.stopped:
+            break
+        for _enq, sent, data in batch:
+            do_work(data, work)
+            if sent is not None:
+                hist.record(time.time() - sent)
+                n += 1
+            done[wid] += 1
+        if n and time.monotonic() - last >= 1.0:
+            results.put(hist)
+            hist, n, last = LatencyHistogram(), 0, time.monotonic()
+    if n:
+        results.put(hist)
+    ring.close()
+
+def _make_aqm(aqm, seed):
+    from case2_long_queue.aqm import make_aqm   # aqm.py imports this module
+    return make_aqm(aqm, seed) if aqm is None or isinstance(aqm, str) else aqm
 
 class FixedReceiverCase2:
-    def __init__(self):
-        self.q = queue.Queue(maxsize=Q_MAX)
+    def __init__(self, legacy=False, logger=None, aqm=None, seed=None,
+                 batch_size=BATCH_MAX, batch_wait=BATCH_WAIT_SEC, processes=False, work="sleep", port=PORT):
+        self.legacy = legacy        # True: raw chunks + "#CTRL#" lines instead of frames
+        self.port = port
+        self.aqm = _make_aqm(aqm, seed)   # drop policy: spec string or AQM instance (default RED)
+        self.batch_size, self.batch_wait = batch_size, batch_wait
+        self.processes = processes  # True: WORKERS processes fed through a ShmRing
+        self.work = work            # "sleep" or "cpu", see do_work
+        self.q = BatchQueue(maxsize=Q_MAX)
+        self.held = [0] * WORKERS   # per worker (or the feeder, slot 0): taken from q, not yet started
+        self.ring = None
+        self.procs = []
+        self._collect_lock = threading.Lock()
+        self._collected = 0
         self.conn = None
         self.running = True
-        self.logger = BufferLogger('case2_long_queue/queue_log.txt')  # NEW LINE ADDED
+        self.logger = logger or BufferLogger('case2_long_queue/queue_log.txt')  # NEW LINE ADDED
+        self.sojourn = LatencyHistogram()   # enqueue -> dequeue
+        self.latency = LatencyHistogram()   # sender's stamp -> processing done
+        export(self.sojourn, "rx_sojourn_seconds", "Queue sojourn time (enqueue to dequeue)", case="case2")
+        export(self.latency, "rx_latency_seconds", "One-way send-to-process latency", case="case2")
 
     def worker(self, wid):
         while self.running:
+            batch = self.q.get_batch(self.batch_size, self.batch_wait, timeout=0.5, share=WORKERS)
+            self.held[wid] = len(batch)
+            for enq, sent, data in batch:
+                self.held[wid] -= 1
+                now = time.monotonic()   # this record's turn, after the batch's earlier ones
+                self.sojourn.record(now - enq)
+                if self.aqm.dequeue(now - enq, self.qlen(), now):
+                    RX_DROPPED[self.aqm.name].inc()
+                    continue
+                # Simulate work
+                do_work(data, self.work)
+                if sent is not None:
+                    self.latency.record(time.time() - sent)
+                RX_PROCESSED.inc()
+
+    def qlen(self):
+        """Records waiting, including those held in worker batches or handed to worker processes."""
+        return self.q.qsize() + sum(self.held) + (self.ring.qsize() if self.ring else 0)
+
+    def start_processes(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.ring = ShmRing(RING_SLOTS, RING_SLOT_BYTES, ctx)
+        self.done = ctx.Array('q', WORKERS, lock=False)
+        self.results = ctx.Queue()
+        self.procs = [ctx.Process(target=process_worker, daemon=True,
+                                  args=(i, self.ring, self.done, self.results, self.batch_size, self.work))
+                      for i in range(WORKERS)]
+        for p in self.procs:
+            p.start()
+        threading.Thread(target=self.feeder, daemon=True).start()
+        threading.Thread(target=self.collector, daemon=True).start()
+
+    def feeder(self):
+        # the dequeue side of the AQM runs here, so it sees one queue rather than one per process
+        while self.running:
+            batch = self.q.get_batch(self.batch_size, self.batch_wait, timeout=0.5)
+            keep = []
+            self.held[0] = len(batch)
+            for item in batch:
+                self.held[0] -= 1
+                now = time.monotonic()
+                self.sojourn.record(now - item[0])
+                if self.aqm.dequeue(now - item[0], self.qlen() + len(keep), now):
+                    RX_DROPPED[self.aqm.name].inc()
+                    continue
+                keep.append(item)
+            self.held[0] = len(keep)
+            while keep and self.running:
+                keep = keep[self.ring.put_many(keep, timeout=0.5):]
+                self.held[0] = len(keep)
+
+    def collect(self, timeout=0.0):
+        """Fold worker processes' latency and processed counts into ours."""
+        with self._collect_lock:
             try:
-                data = self.q.get(timeout=0.5)
+                while True:
+                    self.latency.merge(self.results.get(timeout=timeout) if timeout else self.results.get_nowait())
             except queue.Empty:
-                continue
-            # Simulate work
-            time.sleep(PROC_DELAY_SEC)
-            self.q.task_done()
-
-    def red_drop(self):
-        ql = self.q.qsize()
-        if ql <= Q_MIN_TH:   # accept
-            return False
-        if ql >= Q_MAX_TH:   # drop aggressively
-            return True
-        # Linear probability between thresholds
-        p = (ql - Q_MIN_TH) / float(Q_MAX_TH - Q_MIN_TH)
-        return random.random() < p
+                pass
+            total = sum(self.done)
+            RX_PROCESSED.inc(total - self._collected)
+            self._collected = total
+
+    def collector(self):
+        while self.running:
+            self.collect(timeout=0.5)
+
+    def stop_processes(self):
+        self.ring.stop()
+        deadline = time.monotonic() + 5.0
+        while any(p.is_alive() for p in self.procs) and time.monotonic() < deadline:
+            self.collect(timeout=0.1)   # keep the result pipe drained so workers can exit
+        for p in self.procs:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+        self.collect()
+        self.ring.close()
 
     def control_sender(self):
         while self.running and self.conn:
-            ql = self.q.qsize()
-            # 3-level feedback for sender
-            if ql >= Q_MAX_TH:
-                level = "SLOW"
-            elif ql <= Q_MIN_TH // 2:
-                level = "FAST"
-            else:
-                level = "OK"
+            ql = self.qlen()
+            level = self.aqm.level(ql, time.monotonic())
             msg = {"type":"queue","qlen":ql,"level":level}
             try:
-                self.conn.sendall(("#CTRL#" + json.dumps(msg) + "\n").encode())
+                self.conn.sendall(encode_control(msg, self.legacy))
             except:
                 break
+            CONTROL_SENT[level].inc()
             time.sleep(0.2)
 
     def serve(self):
         self.logger.start()  # NEW LINE ADDED
+        RX_LEVEL.set_function(self.qlen)
         try:  # NEW TRY BLOCK ADDED
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind((HOST, PORT)); s.listen(1)
-            print(f"[RX2] Fixed receiver on {HOST}:{PORT} Qmax={Q_MAX}, workers={WORKERS}")
+            s.bind((HOST, self.port)); s.listen(1)
+            print(f"[RX2] Fixed receiver on {HOST}:{self.port} Qmax={Q_MAX}, "
+                  f"workers={WORKERS} {'processes' if self.processes else 'threads'} ({self.work}), "
+                  f"batch={self.batch_size}/{self.batch_wait * 1000:g}ms, aqm={self.aqm.name}")
             self.conn, addr = s.accept()
             print(f"[RX2] Client {addr} connected")
 
             # Start workers and control loop
-            for i in range(WORKERS):
-                threading.Thread(target=self.worker, args=(i,), daemon=True).start()
+            if self.processes:
+                self.start_processes()
+            else:
+                for i in range(WORKERS):
+                    threading.Thread(target=self.worker, args=(i,), daemon=True).start()
             threading.Thread(target=self.control_sender, daemon=True).start()
 
+            rb = RecvBuffer(legacy=self.legacy)
+            splitter = RecordSplitter(RECORD_SIZE) if self.legacy else None
             while True:
                 try:
-                    data = self.conn.recv(4096)
-                    if not data:
+                    if not rb.recv_from(self.conn):
                         break
-                    # RED/tail-drop
-                    if self.red_drop():
-                        continue
-                    try:
-                        self.q.put_nowait(data)
-                    except queue.Full:
-                        # Hard tail drop
-                        pass
+                    # One queue item per record: a DATA frame, or a RECORD_SIZE slice in legacy mode
+                    records = []
+                    for ftype, payload in rb.events():
+                        if ftype != FT_DATA:
+                            continue
+                        # copy: the view is reused by the next recv
+                        records.extend(splitter.feed(payload) if splitter else (bytes(payload),))
+                    pending, now = [], time.monotonic()
+                    ql = self.qlen()
+                    for rec in records:
+                        RX_ITEMS.inc()
+                        QLEN_AT_ARRIVAL.observe(ql + len(pending))
+                        # AQM/tail-drop
+                        if self.aqm.enqueue(ql + len(pending), now):
+                            RX_DROPPED[self.aqm.name].inc()
+                            continue
+                        pending.append((now, read_stamp(rec), rec))
+                    # one lock hold for the whole receive; what does not fit is a hard tail drop
+                    tail = len(pending) - self.q.put_many(pending)
+                    if tail:
+                        RX_DROPPED["tail"].inc(tail)
                     
                     # Log current queue size for analysis
-                    self.logger.update_buffer_size(self.q.qsize())  # NEW LINE ADDED
+                    self.logger.update_buffer_size(self.qlen())  # NEW LINE ADDED
                     
                 except Exception as e:
                     print(f"[RX2] recv error: {e}")
@@ -96,10 +300,106 @@ class FixedReceiverCase2:
             try: self.conn.close()
             except: pass
             s.close()
+            if self.procs:
+                self.stop_processes()
             print("[RX2] Closed")
+            print(f"[RX2] sojourn: {self.sojourn.format()}")
+            print(f"[RX2] latency send->process: {self.latency.format()}")
             
         finally:  # NEW  BLOCK ADDED
             self.logger.stop()  # NEW LINE ADDED
 
+class Case2Policy(ReceiverPolicy):
+    """FixedReceiverCase2's AQM-managed queue and worker pool, shared by all senders."""
+    name = "RX2"
+    control_interval = 0.2
+    tick_interval = 0.1         # only used to feed the logger
+
+    class State:
+        __slots__ = ("received", "dropped", "splitter")
+        def __init__(self, legacy=False):
+            self.received = self.dropped = 0
+            self.splitter = RecordSplitter(RECORD_SIZE) if legacy else None
+
+    def __init__(self, aqm=None, seed=None, batch_size=BATCH_MAX, batch_wait=BATCH_WAIT_SEC):
+        self.q = None           # created on the receiver's event loop
+        self.held = [0] * WORKERS   # per worker: taken from q, not yet started
+        self.aqm = _make_aqm(aqm, seed)
+        self.batch_size, self.batch_wait = batch_size, batch_wait
+        self.sojourn = LatencyHistogram()
+        self.latency = LatencyHistogram()
+        RX_LEVEL.set_function(self.level)
+        export(self.sojourn, "rx_sojourn_seconds", "Queue sojourn time (enqueue to dequeue)", case="case2")
+        export(self.latency, "rx_latency_seconds", "One-way send-to-process latency", case="case2")
+
+    def tasks(self):
+        self.q = asyncio.Queue(maxsize=Q_MAX)
+        return [self.worker(i) for i in range(WORKERS)]
+
+    async def worker(self, wid):
+        while True:
+            batch = await get_batch_async(self.q, self.batch_size, self.batch_wait, share=WORKERS)
+            self.held[wid] = len(batch)
+            for enq, sent, _data in batch:
+                self.q.task_done()
+                self.held[wid] -= 1
+                now = time.monotonic()   # this record's turn, after the batch's earlier ones
+                self.sojourn.record(now - enq)
+                if self.aqm.dequeue(now - enq, self.level(), now):
+                    RX_DROPPED[self.aqm.name].inc()
+                    continue
+                # Simulate work
+                await asyncio.sleep(PROC_DELAY_SEC)
+                if sent is not None:
+                    self.latency.record(time.time() - sent)
+                RX_PROCESSED.inc()
+
+    def open(self, conn):
+        print(f"[RX2] Client {conn.peer} connected")
+        return self.State(conn.server.legacy)
+
+    def data(self, conn, data):
+        st = conn.state
+        # copy: data is a view into the receive buffer
+        for rec in st.splitter.feed(data) if st.splitter else (bytes(data),):
+            st.received += 1
+            RX_ITEMS.inc()
+            ql = self.level()
+            QLEN_AT_ARRIVAL.observe(ql)
+            if self.aqm.enqueue(ql, time.monotonic()):
+                st.dropped += 1
+                RX_DROPPED[self.aqm.name].inc()
+                continue
+            try:
+                self.q.put_nowait((time.monotonic(), read_stamp(rec), rec))
+            except asyncio.QueueFull:
+                st.dropped += 1   # Hard tail drop
+                RX_DROPPED["tail"].inc()
+
+    def control(self, conn):
+        ql = self.level()
+        level = self.aqm.level(ql, time.monotonic())
+        CONTROL_SENT[level].inc()
+        return {"type":"queue","qlen":ql,"level":level}
+
+    def level(self):
+        """Records waiting, including those held in worker batches."""
+        return self.q.qsize() + sum(self.held) if self.q else 0
+
+    def report(self):
+        print(f"[RX2] sojourn: {self.sojourn.format()}")
+        print(f"[RX2] latency send->process: {self.latency.format()}")
+
 if __name__ == "__main__":
-    FixedReceiverCase2().serve()
\ No newline at end of file
+    legacy = "--legacy" in sys.argv
+    aqm, seed = aqm_from_argv()
+    batch_size, batch_wait = batch_from_argv()
+    serve_from_argv()
+    if "--async" in sys.argv:
+        AsyncReceiver(Case2Policy(aqm, seed, batch_size, batch_wait), HOST, PORT, legacy=legacy,
+                      logger=make_logger('case2_long_queue/queue_log.txt')).serve()
+    else:
+        work = "cpu" if "--work=cpu" in sys.argv else "sleep"
+        FixedReceiverCase2(legacy=legacy, logger=make_logger('case2_long_queue/queue_log.txt'),
+                           aqm=aqm, seed=seed, batch_size=batch_size, batch_wait=batch_wait,
+                           processes="--processes" in sys.argv, work=work).serve()
\ No newline at end of file
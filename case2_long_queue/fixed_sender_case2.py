@@ -1,10 +1,27 @@
 #!/usr/bin/env python3
-import socket, time, json, threading, statistics
+import socket, time, threading, statistics, sys
+from collections import deque
+from common.wire import FT_CTRL, ProtocolError, make_decoder
+from common.sender_engine import FramePool, SenderEngine
+from common.pacing import Pacer
+from common.metrics import REGISTRY, serve_from_argv
+from common.latency import make_stamp
 
 HOST, PORT = 'localhost', 5001
+RECORD_BODY = b"0000000000.000000|" + b"A"*512   # send time (patched per record) | payload
+
+TX_FRAMES = REGISTRY.counter("tx_frames_total", "Data frames (chunks) sent", case="case2")
+TX_BYTES = REGISTRY.counter("tx_bytes_total", "Payload bytes sent", case="case2")
+TX_BATCH = REGISTRY.gauge("tx_batch", "Records per cycle", case="case2")
+TX_DELAY = REGISTRY.gauge("tx_delay_seconds", "Cycle period", case="case2")
+TX_SEND_TIME = REGISTRY.histogram("tx_send_seconds", "Time one batch write blocked",
+                                  buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1), case="case2")
 
 class FixedSenderCase2:
-    def __init__(self):
+    def __init__(self, legacy=False, nodelay=None, cork=False, port=PORT):
+        self.legacy = legacy        # True: raw records + "#CTRL#" lines instead of binary frames
+        self.nodelay, self.cork = nodelay, cork
+        self.port = port
         # Pacing knobs
         self.batch = 12              # items per cycle (small bursts)
         self.delay = 0.012           # delay between cycles (12 ms)
@@ -13,13 +30,36 @@ class FixedSenderCase2:
         self.min_batch = 4
         self.max_batch = 24
 
-        # RTT trend estimate (optional)
-        self.rtt = []
+        # RTT trend estimate (optional): per-record send blocking time, last 40 records
+        self.rtt = deque(maxlen=40)
         self.sock = None
         self.level = "OK"
 
+    def on_queue_status(self, level):
+        self.level = level
+        REGISTRY.counter("tx_control_received_total", "Control messages received", case="case2", level=level).inc()
+        # Queue-aware pacing adjustments
+        if self.level == "SLOW":
+            self.delay = min(self.max_delay, self.delay + 0.004)
+            self.batch = max(self.min_batch, self.batch - 2)
+        elif self.level == "FAST":
+            self.delay = max(self.min_delay, self.delay - 0.003)
+            self.batch = min(self.max_batch, self.batch + 1)
+        else:
+            # gentle AIMD toward stability
+            self.delay = min(self.max_delay, self.delay + 0.001)
+
+    def on_send_time(self, blocked, n):
+        """RTT trend guard: ``blocked`` is how long a batch of ``n`` records' write blocked."""
+        self.rtt.extend([blocked / n] * n)   # per-record share of the blocking time
+        # if recent average rises, slow a bit. It never speeds up: a write that does not
+        # block says nothing about the receiver's queue, and speeding up on it every
+        # batch would override the queue feedback (on loopback writes never block)
+        if len(self.rtt) == self.rtt.maxlen and statistics.mean(self.rtt) > 0.025:
+            self.delay = min(self.max_delay, self.delay + 0.003)
+
     def listen_control(self):
-        buf = b""
+        decoder = make_decoder(self.legacy)
         while self.sock:
             try:
                 self.sock.settimeout(0.05)
@@ -28,71 +68,61 @@ class FixedSenderCase2:
                 data = b""
             if not data:
                 time.sleep(0.02); continue
-            buf += data
-            while b"#CTRL#" in buf:
-                i = buf.find(b"#CTRL#")
-                if i > 0:
-                    buf = buf[i:]
-                nl = buf.find(b"\n")
-                if nl == -1: break
-                line = buf[len("#CTRL#"):nl].decode(errors="ignore")
-                buf = buf[nl+1:]
+            try:
+                events = decoder.feed(data)
+            except ProtocolError as e:
+                print(f"[TX2] bad control stream: {e}"); break
+            for ftype, msg in events:
+                if ftype != FT_CTRL:
+                    continue
                 try:
-                    msg = json.loads(line)
                     if msg.get("type") == "queue":
-                        self.level = msg.get("level","OK")
-                        # Queue-aware pacing adjustments
-                        if self.level == "SLOW":
-                            self.delay = min(self.max_delay, self.delay + 0.004)
-                            self.batch = max(self.min_batch, self.batch - 2)
-                        elif self.level == "FAST":
-                            self.delay = max(self.min_delay, self.delay - 0.003)
-                            self.batch = min(self.max_batch, self.batch + 1)
-                        else:
-                            # gentle AIMD toward stability
-                            self.delay = min(self.max_delay, self.delay + 0.001)
+                        self.on_queue_status(msg.get("level","OK"))
                 except:
                     pass
 
     def run(self, seconds=12):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((HOST, PORT))
-        print(f"[TX2] Connected to {HOST}:{PORT}")
+        self.sock.connect((HOST, self.port))
+        print(f"[TX2] Connected to {HOST}:{self.port}")
         threading.Thread(target=self.listen_control, daemon=True).start()
 
+        engine = SenderEngine(self.sock, nodelay=self.nodelay, cork=self.cork)
+        pool = FramePool(RECORD_BODY, self.max_batch, self.legacy)
+        frame_len = len(pool.frames[0])
+        pacer = Pacer(self.batch * frame_len * 8 / self.delay)
+        TX_BATCH.set_function(lambda: self.batch)
+        TX_DELAY.set_function(lambda: self.delay)
         t_end = time.time() + seconds
         sent = 0
         while time.time() < t_end:
-            t_cycle_start = time.time()
-            # Send small records to reduce queue spikes
-            for _ in range(self.batch):
-                payload = f"{time.time():.6f}".encode() + b"|" + b"A"*512
-                t0 = time.time()
-                try:
-                    self.sock.sendall(payload)
-                except Exception as e:
-                    print(f"[TX2] send error: {e}")
-                    t_end = 0; break
-                t1 = time.time()
-                self.rtt.append(t1 - t0)
-                sent += 1
-
-            # RTT trend guard: if recent average rises, slow a bit
-            if len(self.rtt) >= 40:
-                avg = statistics.mean(self.rtt[-40:])
-                if avg > 0.025:
-                    self.delay = min(self.max_delay, self.delay + 0.003)
-                elif avg < 0.010:
-                    self.delay = max(self.min_delay, self.delay - 0.001)
+            # Send small records to reduce queue spikes, one gather write per batch
+            # every `delay` seconds, i.e. batch*frame_len bytes per delay
+            n = self.batch
+            pacer.rate_bps = n * frame_len * 8 / self.delay
+            pacer.pace(n * frame_len)
+            for i in range(n):
+                pool.patch(i, 0, make_stamp())
+            t0 = time.time()
+            try:
+                engine.send_batch(pool.views[:n])
+            except Exception as e:
+                print(f"[TX2] send error: {e}")
+                t_end = 0; break
+            t1 = time.time()
+            TX_SEND_TIME.observe(t1 - t0)
+            TX_FRAMES.inc(n)
+            TX_BYTES.inc(n * len(RECORD_BODY))
+            sent += n
+            self.on_send_time(t1 - t0, n)
 
-            elapsed = time.time() - t_cycle_start
-            sleep_for = max(0.0, self.delay - elapsed)
             print(f"[TX2] level={self.level} batch={self.batch} delay={self.delay*1000:.1f}ms sent={sent}")
-            time.sleep(sleep_for)
 
         try: self.sock.close()
         except: pass
         print(f"[TX2] done, sent={sent}")
 
 if __name__ == "__main__":
-    FixedSenderCase2().run()
+    serve_from_argv()
+    FixedSenderCase2(legacy="--legacy" in sys.argv, nodelay=True if "--nodelay" in sys.argv else None,
+                     cork="--cork" in sys.argv).run()
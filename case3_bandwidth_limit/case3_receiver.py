@@ -4,13 +4,19 @@
 import socket
 import time
 from logging_util import BufferLogger  # NEW LINE ADDED
+from common.metrics import REGISTRY, serve_from_argv
 
-def start_receiver():
-    logger = BufferLogger('case3_bandwidth_limit/bandwidth_log.txt')  # NEW LINE ADDED
+RX_FRAMES = REGISTRY.counter("rx_frames_total", "Data frames (chunks) received", case="case3")
+RX_BYTES = REGISTRY.counter("rx_bytes_total", "Application bytes accepted", case="case3")
+RX_DROPPED = REGISTRY.counter("rx_dropped_total", "Items dropped", case="case3", reason="bandwidth")
+RX_LEVEL = REGISTRY.gauge("rx_level", "Case level: buffer fill (B), queue length (items) or bytes used this interval", case="case3")
+
+def start_receiver(port=5002, logger=None):
+    logger = logger or BufferLogger('case3_bandwidth_limit/bandwidth_log.txt')  # NEW LINE ADDED
     logger.start()  # NEW LINE ADDED
     
     HOST = 'localhost'
-    PORT = 5002
+    PORT = port
     BANDWIDTH_LIMIT = 1024 * 10  # 10KB/sec limit (very low)
     
     try:  # NEW TRY BLOCK ADDED
@@ -28,6 +34,7 @@ def start_receiver():
         start_time = time.time()
         last_log_time = start_time
         bytes_this_second = 0
+        RX_LEVEL.set_function(lambda: bytes_this_second)
         
         conn, addr = sock.accept()
         print(f"Connected to {addr}")
@@ -53,10 +60,13 @@ def start_receiver():
                 # Drop packets if exceeding bandwidth
                 if current_rate > BANDWIDTH_LIMIT:
                     packets_dropped += 1
+                    RX_DROPPED.inc()
                     print(f"BANDWIDTH EXCEEDED! Dropped packet {packets_dropped}")
                 else:
                     packets_received += 1
                     bytes_received += len(data)
+                    RX_FRAMES.inc()
+                    RX_BYTES.inc(len(data))
                     
                     if packets_received % 10 == 0:
                         print(f"Received: {packets_received}, Rate: {current_rate:.0f} B/s")
@@ -72,4 +82,5 @@ def start_receiver():
         logger.stop()  # NEW LINE ADDED
 
 if __name__ == "__main__":
+    serve_from_argv()
     start_receiver()
\ No newline at end of file
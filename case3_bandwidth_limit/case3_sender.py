@@ -2,12 +2,17 @@
 import socket
 import time
 import sys
+from common.metrics import REGISTRY, serve_from_argv
 
-def start_sender():
+TX_FRAMES = REGISTRY.counter("tx_frames_total", "Data frames (chunks) sent", case="case3")
+TX_BYTES = REGISTRY.counter("tx_bytes_total", "Payload bytes sent", case="case3")
+
+def start_sender(port=5002, high_rate=None):
     HOST = 'localhost'
-    PORT = 5002
+    PORT = port
     
-    high_rate = "--fast" in sys.argv
+    if high_rate is None:
+        high_rate = "--fast" in sys.argv
     
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.connect((HOST, PORT))
@@ -22,6 +27,8 @@ def start_sender():
         for i in range(200):
             data = f"FAST_PACKET_{i}_" + "Z" * 800
             sock.send(data.encode())
+            TX_FRAMES.inc()
+            TX_BYTES.inc(len(data))
             packets_sent += 1
             
             if packets_sent % 20 == 0:
@@ -33,6 +40,8 @@ def start_sender():
         for i in range(50):
             data = f"NORMAL_PACKET_{i}_" + "Z" * 800
             sock.send(data.encode())
+            TX_FRAMES.inc()
+            TX_BYTES.inc(len(data))
             packets_sent += 1
             
             if packets_sent % 10 == 0:
@@ -44,4 +53,5 @@ def start_sender():
     sock.close()
 
 if __name__ == "__main__":
+    serve_from_argv()
     start_sender()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""Per-flow fair sharing of the case3 bandwidth cap across many senders.
+
+One global budget lets the most aggressive sender take the whole cap.
+``FairScheduler`` gives every connection (a *flow*) its own share:
+
+- flows belong to classes; each class has a weight and an optional
+  ``limit_bps`` ceiling, and each flow a weight within its class;
+- every control interval ``rebalance`` splits the cap by weighted
+  max-min fairness (water-filling), first across classes (capped by
+  their limits), then across each class's flows, using what each flow
+  offered in the last interval as its demand (a flow that used nearly
+  all of its share counts as wanting more). The result is the flow's
+  *share*, advertised to that sender as its budget on the control channel;
+- a per-flow token bucket (token_bucket.py) refilled at the share admits conforming bytes
+  on arrival. Bytes beyond it wait in a bounded per-flow queue, and
+  ``drain`` serves those queues with weighted deficit round robin out of
+  whatever cap the conforming traffic left unused, so the link stays
+  busy while no flow can crowd out another. A full flow queue drops
+  only that flow's bytes.
+
+Everything accepted is charged to a root bucket at the cap (and the
+class bucket), so the aggregate stays at or below ``BW_LIMIT_BPS``.
+
+    fq = FairScheduler(300_000, 0.1, parse_classes("gold:weight=3;bronze:limit=100000"))
+    flow = fq.add_flow(peer, "gold")
+    fq.offer(flow, len(data), sent, time.monotonic())   # ACCEPTED, QUEUED or DROPPED
+"""
+
+import math, time
+from collections import deque
+
+from case3_bandwidth_limit.token_bucket import TokenBucket
+
+QUANTUM = 1500              # DRR bytes per turn for a flow of weight 1 alone in a weight-1 class
+FLOW_QUEUE_BYTES = 64 * 1024
+BUSY_FRACTION = 0.9         # a flow using this much of its share is treated as wanting more
+HEADROOM = 1.25             # budget slack over the measured rate of flows below their share
+
+ACCEPTED, QUEUED, DROPPED = "accepted", "queued", "dropped"
+
+
+def _covers(bucket, n):
+    """Tokens for ``n`` bytes; a frame larger than the bucket needs it full
+    (it then runs into debt), so no frame size can stall a queue forever."""
+    return bucket.depth > 0 and bucket.tokens >= min(n, bucket.depth)
+
+
+class FlowClass:
+    def __init__(self, name, weight=1.0, limit_bps=None):
+        self.name, self.weight, self.limit_bps = name, float(weight), limit_bps
+        self.bucket = None          # set by FairScheduler when there is a limit
+        self.flows = set()
+        self.active_weight = 0.0    # sum of weights of this class's backlogged flows
+
+
+class Flow:
+    __slots__ = ("key", "cls", "weight", "bucket", "queue", "queued", "deficit", "turn",
+                 "active", "share", "demand", "arrived", "accepted", "dropped")
+
+    def __init__(self, key, cls, weight, bucket):
+        self.key, self.cls, self.weight, self.bucket = key, cls, float(weight), bucket
+        self.queue = deque()        # (bytes, sender timestamp or None)
+        self.queued = 0
+        self.deficit = 0.0
+        self.turn = False           # has its DRR quantum for the current turn
+        self.active = False         # in the DRR list
+        self.share = 0.0            # bytes/s, from rebalance
+        self.demand = math.inf      # bytes/s wanted, as of the last full interval
+        self.arrived = 0            # bytes offered since the last rebalance
+        self.accepted = self.dropped = 0
+
+
+def water_fill(capacity, demands, weights):
+    """Weighted max-min fair split of ``capacity``: {key: allocation}."""
+    alloc = dict.fromkeys(demands, 0.0)
+    active = {k for k in demands if weights[k] > 0}
+    while active and capacity > 1e-9:
+        wsum = sum(weights[k] for k in active)
+        done = [k for k in active if demands[k] - alloc[k] <= capacity * weights[k] / wsum]
+        if not done:
+            for k in active:
+                alloc[k] += capacity * weights[k] / wsum
+            break
+        for k in done:
+            capacity -= demands[k] - alloc[k]
+            alloc[k] = demands[k]
+            active.discard(k)
+    return alloc
+
+
+def parse_classes(spec):
+    """``"gold:weight=3,limit=200000;bronze"`` -> {name: FlowClass}; limit in bit/s."""
+    classes = {}
+    for item in filter(None, (spec or "").split(";")):
+        name, _, args = item.partition(":")
+        params = {}
+        for kv in filter(None, args.split(",")):
+            k, _, v = kv.partition("=")
+            params[k.strip()] = float(v)
+        classes[name.strip()] = FlowClass(name.strip(), params.get("weight", 1.0), params.get("limit"))
+    return classes
+
+
+class FairScheduler:
+    def __init__(self, rate_bps, interval, classes=None, queue_bytes=FLOW_QUEUE_BYTES,
+                 quantum=QUANTUM, on_accept=None, clock=time.monotonic):
+        now = clock()
+        self.rate = rate_bps / 8.0
+        self.interval = interval
+        self.queue_bytes, self.quantum = queue_bytes, quantum
+        self.on_accept = on_accept  # (flow, nbytes, sender timestamp or None)
+        self.root = TokenBucket(self.rate, self.rate * interval, now)
+        if isinstance(classes, str):
+            classes = parse_classes(classes)
+        self.classes = {"default": FlowClass("default")}
+        self.classes.update(classes or {})
+        for c in self.classes.values():
+            if c.limit_bps:
+                # deep enough for a full frame, so accrual isn't capped while one waits for the root
+                c.bucket = TokenBucket(c.limit_bps / 8.0, max(c.limit_bps / 8.0 * interval, quantum), now)
+        self.flows = set()
+        self.active = deque()       # DRR list of flows with queued bytes
+        self.parked = []            # flows held back by their class limit, keeping their turn
+        self.clock = clock
+
+    # ---- flows ----
+
+    def _class(self, name):
+        if name not in self.classes:
+            self.classes[name] = FlowClass(name)
+        return self.classes[name]
+
+    def add_flow(self, key, cls="default", weight=1.0):
+        now = self.clock()
+        flow = Flow(key, self._class(cls), weight, TokenBucket(0.0, 0.0, now))
+        flow.cls.flows.add(flow)
+        self.flows.add(flow)
+        self.rebalance(now, reset=False)   # a newcomer gets a share before the next interval
+        return flow
+
+    def set_flow(self, flow, cls=None, weight=None):
+        """Move ``flow`` to another class and/or weight (e.g. from the sender's hello)."""
+        if flow.active:
+            flow.cls.active_weight -= flow.weight
+        flow.cls.flows.discard(flow)
+        if cls is not None:
+            flow.cls = self._class(cls)
+        if weight is not None:
+            flow.weight = float(weight)
+        flow.cls.flows.add(flow)
+        if flow.active:
+            flow.cls.active_weight += flow.weight
+        self.rebalance(self.clock(), reset=False)
+
+    def remove_flow(self, flow):
+        if flow.active:
+            if flow in self.parked:
+                self.parked.remove(flow)
+            else:
+                self.active.remove(flow)
+            flow.cls.active_weight -= flow.weight
+            flow.active = False
+        flow.cls.flows.discard(flow)
+        self.flows.discard(flow)
+        self.rebalance(self.clock(), reset=False)
+
+    # ---- data path ----
+
+    def _accept(self, flow, n, sent, cls_bucket):
+        self.root.tokens -= n
+        if cls_bucket is not None:
+            cls_bucket.tokens -= n
+        flow.bucket.tokens -= n
+        flow.accepted += n
+        if self.on_accept is not None:
+            self.on_accept(flow, n, sent)
+
+    def offer(self, flow, n, sent=None, now=None):
+        """Admit ``n`` bytes from ``flow`` now, queue them behind its backlog, or drop them."""
+        now = self.clock() if now is None else now
+        flow.arrived += n
+        cls_bucket = flow.cls.bucket
+        flow.bucket.refill(now)
+        self.root.refill(now)
+        if cls_bucket is not None:
+            cls_bucket.refill(now)
+        if (not flow.queue and _covers(flow.bucket, n) and _covers(self.root, n)
+                and (cls_bucket is None or _covers(cls_bucket, n))):
+            self._accept(flow, n, sent, cls_bucket)
+            return ACCEPTED
+        if flow.queued + n > self.queue_bytes:
+            flow.dropped += n
+            return DROPPED
+        flow.queue.append((n, sent))
+        flow.queued += n
+        if not flow.active:
+            flow.turn, flow.active = False, True
+            flow.cls.active_weight += flow.weight
+            self.active.append(flow)
+        return QUEUED
+
+    def drain(self, now=None):
+        """Serve queued bytes by weighted DRR from the unused cap; returns bytes served."""
+        now = self.clock() if now is None else now
+        root, active = self.root, self.active
+        root.refill(now)
+        for flow in list(self.parked):
+            cls_bucket = flow.cls.bucket
+            cls_bucket.refill(now)
+            if _covers(cls_bucket, flow.queue[0][0]):
+                self.parked.remove(flow)
+                active.appendleft(flow)     # resumes its turn ahead of the round
+        served = 0
+        while active:
+            flow = active[0]
+            cls = flow.cls
+            cls_bucket = cls.bucket
+            if cls_bucket is not None:
+                cls_bucket.refill(now)
+            if not flow.turn:
+                q = self.quantum * cls.weight * flow.weight / max(cls.active_weight, flow.weight)
+                flow.deficit = min(flow.deficit + q, q + flow.queue[0][0])
+                flow.turn = True
+            while flow.queue:
+                n, sent = flow.queue[0]
+                if n > flow.deficit:
+                    break
+                if not _covers(root, n):
+                    return served           # cap used up; this flow keeps its turn
+                if cls_bucket is not None and not _covers(cls_bucket, n):
+                    break
+                flow.queue.popleft()
+                flow.queued -= n
+                flow.deficit -= n
+                self._accept(flow, n, sent, cls_bucket)
+                served += n
+            active.popleft()
+            if flow.queue and flow.deficit >= flow.queue[0][0]:
+                self.parked.append(flow)    # class limit, not the round, held it back
+            elif flow.queue:
+                flow.turn = False
+                active.append(flow)
+            else:
+                flow.turn = False
+                flow.deficit = 0.0
+                flow.active = False
+                cls.active_weight -= flow.weight
+        return served
+
+    # ---- shares ----
+
+    def _demand(self, flow, elapsed):
+        rate = flow.arrived / elapsed if elapsed > 0 else 0.0
+        if flow.queue or not flow.share or rate >= BUSY_FRACTION * flow.share:
+            return math.inf
+        return rate * HEADROOM
+
+    def rebalance(self, now=None, reset=True):
+        """Recompute every flow's share; ``reset`` starts a new demand interval."""
+        now = self.clock() if now is None else now
+        if reset:
+            for f in self.flows:
+                f.demand = self._demand(f, self.interval)
+        demand = {f: f.demand for f in self.flows}
+        classes = [c for c in self.classes.values() if c.flows]
+        cls_demand = {c: min(sum(demand[f] for f in c.flows),
+                             c.limit_bps / 8.0 if c.limit_bps else math.inf) for c in classes}
+        cls_alloc = water_fill(self.rate, cls_demand, {c: c.weight for c in classes})
+        for c in classes:
+            alloc = water_fill(cls_alloc[c], {f: demand[f] for f in c.flows}, {f: f.weight for f in c.flows})
+            for f, share in alloc.items():
+                f.share = share
+                f.bucket.refill(now)
+                f.bucket.rate, f.bucket.depth = share, share * self.interval
+                f.bucket.tokens = min(f.bucket.tokens, f.bucket.depth)
+        if reset:
+            for f in self.flows:
+                f.arrived = 0
+
+    def budget(self, flow):
+        """Bytes per interval to advertise to ``flow``'s sender."""
+        return int(flow.share * self.interval)
+
+    def stats(self):
+        return {str(f.key): {"class": f.cls.name, "weight": f.weight, "share_bps": round(f.share * 8),
+                             "accepted": f.accepted, "dropped": f.dropped, "queued": f.queued}
+                for f in self.flows}
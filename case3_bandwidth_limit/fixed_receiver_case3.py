@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
 # File: case3_bandwidth_limit/fixed_receiver_case3.py (REPLACE YOUR EXISTING FILE)
 
-import socket, time, json, threading
-from logging_util import BufferLogger  # NEW LINE ADDED
+import socket, time, threading, sys, asyncio
+from collections import deque
+from logging_util import BufferLogger, make_logger  # NEW LINE ADDED
+from common.async_receiver import AsyncReceiver, ReceiverPolicy
+from common.wire import FT_DATA, encode_control
+from common.recv_buffer import RecvBuffer
+from common.metrics import REGISTRY, serve_from_argv
+from common.latency import STAMP_LEN, LatencyHistogram, export, read_stamp
+from case3_bandwidth_limit.fair_queue import FairScheduler, FLOW_QUEUE_BYTES, DROPPED
+from case3_bandwidth_limit.token_bucket import TokenBucket, POLICE, SHAPE
 
 HOST, PORT = 'localhost', 5002
 
@@ -11,15 +19,65 @@ HOST, PORT = 'localhost', 5002
 BW_LIMIT_BPS   = 300_000
 INTERVAL_MS    = 100                 # update every 100 ms
 BYTES_PER_INT  = (BW_LIMIT_BPS // 8) * INTERVAL_MS // 1000
+# token bucket (token_bucket.py): "police" accepts what the tokens cover and drops the
+# rest, "shape" stops reading until the tokens catch up, "interval" is the original
+# reset-every-interval budget that drops whole chunks
+POLICY_MODE    = "police"
+POLICY_MODES   = (POLICE, SHAPE, "interval")
+BUCKET_DEPTH   = BYTES_PER_INT       # largest burst accepted at once, bytes
+# recomputed by common.settings.apply_settings when the cap or interval is overridden
+DERIVED = {"BYTES_PER_INT": lambda: (BW_LIMIT_BPS // 8) * INTERVAL_MS // 1000,
+           "BUCKET_DEPTH": lambda: (BW_LIMIT_BPS // 8) * INTERVAL_MS // 1000}
+
+RX_BYTES = REGISTRY.counter("rx_bytes_total", "Application bytes accepted", case="case3")
+RX_DROPPED_BYTES = REGISTRY.counter("rx_dropped_bytes_total", "Bytes policed (over budget)",
+                                    case="case3", reason="policed")
+RX_LEVEL = REGISTRY.gauge("rx_level", "Case level: buffer fill (B), queue length (items) or bytes used this interval", case="case3")
+RX_TOKENS = REGISTRY.gauge("rx_tokens", "Tokens (bytes) left in the bucket or interval budget", case="case3")
+CONTROL_SENT = REGISTRY.counter("rx_control_sent_total", "Control messages sent", case="case3", level="OK")
+RX_QUEUE_DROPPED_BYTES = REGISTRY.counter("rx_dropped_bytes_total", "Bytes dropped (per-flow queue full)",
+                                          case="case3", reason="flow_queue")
+RX_FLOWS = REGISTRY.gauge("rx_flows", "Flows known to the fair scheduler", case="case3")
+
+RX_SHAPED_SECONDS = REGISTRY.counter("rx_shaping_delay_seconds_total", "Time reads were held back by shaping",
+                                     case="case3")
+
+FQ_DRAIN_MS = 10                    # fair scheduler: how often queued bytes are served
+
+def check_mode(mode):
+    """Return ``mode`` (default POLICY_MODE) or raise ValueError if it isn't a POLICY_MODE."""
+    mode = mode or POLICY_MODE
+    if mode not in POLICY_MODES:
+        raise ValueError(f"unknown mode {mode!r}; choose from {', '.join(POLICY_MODES)}")
+    return mode
+
 
 class FixedReceiverCase3:
-    def __init__(self):
+    def __init__(self, legacy=False, logger=None, port=PORT, mode=None, depth=None):
+        self.legacy = legacy        # True: raw chunks + "#CTRL#" lines instead of frames
+        self.port = port
         self.conn = None
+        self.mode = check_mode(mode)
+        self.bucket = TokenBucket(BW_LIMIT_BPS / 8, depth or BUCKET_DEPTH)
         self.tokens = BYTES_PER_INT
         self.last_refill = time.time()
         self.running = True
-        self.logger = BufferLogger('case3_bandwidth_limit/bandwidth_log.txt')  # NEW LINE ADDED
+        self.logger = logger or BufferLogger('case3_bandwidth_limit/bandwidth_log.txt')  # NEW LINE ADDED
         self.bytes_used_this_interval = 0  # NEW LINE ADDED
+        self.latency = LatencyHistogram()   # sender's stamp -> accepted by the policer
+        export(self.latency, "rx_latency_seconds", "One-way send-to-accept latency", case="case3")
+
+    def record_latency(self, payload):
+        # chunks longer than the stamp start with the sender's "<time>|"
+        if not self.legacy and len(payload) > STAMP_LEN:
+            sent = read_stamp(payload)
+            if sent is not None:
+                self.latency.record(time.time() - sent)
+
+    def accept(self, payload, n):
+        self.bytes_used_this_interval += n
+        RX_BYTES.inc(n)
+        self.record_latency(payload)
 
     def refill_and_signal(self):
         """Refill bucket each INTERVAL and tell sender the allowed budget."""
@@ -31,39 +89,65 @@ class FixedReceiverCase3:
             self.logger.update_buffer_size(self.bytes_used_this_interval)  # NEW LINE ADDED
             self.bytes_used_this_interval = 0  # NEW LINE ADDED
             
-            self.tokens = BYTES_PER_INT  # reset budget each interval
+            if self.mode not in (POLICE, SHAPE):
+                self.tokens = BYTES_PER_INT  # reset budget each interval
             msg = {"type": "bw", "budget": BYTES_PER_INT, "interval_ms": INTERVAL_MS}
             try:
-                self.conn.sendall(("#CTRL#" + json.dumps(msg) + "\n").encode())
+                self.conn.sendall(encode_control(msg, self.legacy))
             except:
                 break
+            CONTROL_SENT.inc()
 
     def serve(self):
         self.logger.start()  # NEW LINE ADDED
+        RX_LEVEL.set_function(lambda: self.bytes_used_this_interval)
+        RX_TOKENS.set_function(lambda: self.bucket.tokens if self.mode in (POLICE, SHAPE) else self.tokens)
         try:  # NEW TRY BLOCK ADDED
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind((HOST, PORT)); s.listen(1)
-            print(f"[RX3] Fixed receiver on {HOST}:{PORT} cap≈{BW_LIMIT_BPS/1000:.0f} kbps; interval={INTERVAL_MS} ms; budget={BYTES_PER_INT} B")
+            s.bind((HOST, self.port)); s.listen(1)
+            print(f"[RX3] Fixed receiver on {HOST}:{self.port} cap≈{BW_LIMIT_BPS/1000:.0f} kbps; interval={INTERVAL_MS} ms; budget={BYTES_PER_INT} B; "
+                  f"mode={self.mode}" + (f" depth={self.bucket.depth:.0f} B" if self.mode in (POLICE, SHAPE) else ""))
 
             self.conn, addr = s.accept()
             print(f"[RX3] Client {addr} connected")
 
             threading.Thread(target=self.refill_and_signal, daemon=True).start()
 
+            rb = RecvBuffer(legacy=self.legacy)
             while True:
                 try:
-                    data = self.conn.recv(4096)
-                    if not data:
+                    if not rb.recv_from(self.conn):
                         break
-                    # Enforce the cap (police): consume budget, drop if over
-                    if len(data) <= self.tokens:
-                        self.tokens -= len(data)
-                        self.bytes_used_this_interval += len(data)  # NEW LINE ADDED
-                        # Data accepted (do nothing else; we only emulate a sink)
-                    else:
-                        # Over budget this interval -> drop
-                        pass
+                    for ftype, payload in rb.events():
+                        if ftype != FT_DATA:
+                            continue
+                        n = len(payload)
+                        if self.mode == SHAPE:
+                            # never drop: hold off reading until the bucket has caught up,
+                            # so TCP flow control slows the sender to the cap
+                            wait = self.bucket.reserve(n)
+                            if wait > 0:
+                                RX_SHAPED_SECONDS.inc(wait)
+                                time.sleep(wait)
+                            self.accept(payload, n)
+                        elif self.mode == POLICE:
+                            # partial acceptance: keep the bytes the tokens cover
+                            ok = self.bucket.take(n)
+                            if ok:
+                                self.accept(payload, ok)
+                            if ok < n:
+                                RX_DROPPED_BYTES.inc(n - ok)
+                        # Enforce the cap (police): consume budget, drop if over
+                        elif len(payload) <= self.tokens:
+                            self.tokens -= len(payload)
+                            self.bytes_used_this_interval += len(payload)  # NEW LINE ADDED
+                            RX_BYTES.inc(len(payload))
+                            self.record_latency(payload)
+                            # Data accepted (do nothing else; we only emulate a sink)
+                        else:
+                            # Over budget this interval -> drop
+                            RX_DROPPED_BYTES.inc(len(payload))
                 except Exception as e:
                     print(f"[RX3] recv error: {e}")
                     break
@@ -73,9 +157,196 @@ class FixedReceiverCase3:
             except: pass
             s.close()
             print("[RX3] Closed")
+            print(f"[RX3] latency send->accept: {self.latency.format()}")
+            if self.mode in (POLICE, SHAPE):
+                print(f"[RX3] bucket: {self.bucket.stats()}")
             
         finally:  # NEW FINALLY BLOCK ADDED
             self.logger.stop()  # NEW LINE ADDED
 
+class Case3Policy(ReceiverPolicy):
+    """FixedReceiverCase3's cap: one token bucket policing (or shaping) all senders.
+
+    With ``fair=True`` a FairScheduler (fair_queue.py) gives each sender
+    its own share of the cap instead: per-flow budgets on the control
+    channel, per-flow buckets and DRR over per-flow queues. ``classes``
+    is a FlowClass dict or a ``"gold:weight=3,limit=200000;..."`` spec;
+    senders pick a class and weight with a hello control message.
+    """
+    name = "RX3"
+    control_interval = INTERVAL_MS / 1000.0
+    tick_interval = INTERVAL_MS / 1000.0
+
+    class State:
+        __slots__ = ("accepted", "dropped", "flow", "held", "resume")
+        def __init__(self):
+            self.accepted = self.dropped = 0
+            self.flow = None
+            self.held = deque()     # shaping: (bytes, sender timestamp) read but not yet accepted
+            self.resume = None      # shaping: pending _release timer
+
+    def __init__(self, fair=False, classes=None, queue_bytes=None, mode=None, depth=None):
+        # per instance as well, in case INTERVAL_MS was overridden after import
+        self.control_interval = self.tick_interval = INTERVAL_MS / 1000.0
+        self.tokens = BYTES_PER_INT
+        self.bytes_used_this_interval = 0
+        self.last_interval_bytes = 0
+        self.latency = LatencyHistogram()
+        export(self.latency, "rx_latency_seconds", "One-way send-to-accept latency", case="case3")
+        self.mode = check_mode(mode)
+        self.bucket = TokenBucket(BW_LIMIT_BPS / 8, depth or BUCKET_DEPTH)
+        self.fq = None
+        if fair:
+            self.fq = FairScheduler(BW_LIMIT_BPS, self.control_interval, classes,
+                                    queue_bytes or FLOW_QUEUE_BYTES, on_accept=self._fq_accept)
+            RX_FLOWS.set_function(lambda: len(self.fq.flows))
+        RX_LEVEL.set_function(lambda: self.bytes_used_this_interval)
+        RX_TOKENS.set_function(lambda: self.fq.root.tokens if self.fq else
+                               self.bucket.tokens if self.mode in (POLICE, SHAPE) else self.tokens)
+
+    def open(self, conn):
+        print(f"[RX3] Client {conn.peer} connected")
+        state = self.State()
+        if self.fq:
+            state.flow = self.fq.add_flow(conn.peer)
+        return state
+
+    def message(self, conn, msg):
+        if self.fq and msg.get("type") == "hello":
+            self.fq.set_flow(conn.state.flow, msg.get("class"), msg.get("weight"))
+            print(f"[RX3] {conn.peer}: class={conn.state.flow.cls.name} weight={conn.state.flow.weight:g}")
+
+    def close(self, conn):
+        if conn.state is not None and conn.state.resume is not None:
+            conn.state.resume.cancel()
+        if self.fq and conn.state is not None:
+            self.fq.remove_flow(conn.state.flow)
+
+    def _fq_accept(self, flow, n, sent):
+        self.bytes_used_this_interval += n
+        RX_BYTES.inc(n)
+        if sent is not None:
+            self.latency.record(time.time() - sent)
+
+    async def _fq_drain(self):
+        while True:
+            await asyncio.sleep(FQ_DRAIN_MS / 1000.0)
+            self.fq.drain(time.monotonic())
+
+    def tasks(self):
+        return [self._fq_drain()] if self.fq else []
+
+    def data(self, conn, data):
+        if self.fq:
+            sent = None
+            if not conn.server.legacy and len(data) > STAMP_LEN:
+                sent = read_stamp(data)
+            verdict = self.fq.offer(conn.state.flow, len(data), sent, time.monotonic())
+            if verdict == DROPPED:
+                conn.state.dropped += len(data)
+                RX_QUEUE_DROPPED_BYTES.inc(len(data))
+            else:
+                conn.state.accepted += len(data)
+            return
+        if self.mode in (POLICE, SHAPE):
+            self._bucket_data(conn, data)
+            return
+        # Enforce the cap (police): consume budget, drop if over
+        if len(data) <= self.tokens:
+            self.tokens -= len(data)
+            self.bytes_used_this_interval += len(data)
+            conn.state.accepted += len(data)
+            RX_BYTES.inc(len(data))
+            if not conn.server.legacy and len(data) > STAMP_LEN:
+                sent = read_stamp(data)
+                if sent is not None:
+                    self.latency.record(time.time() - sent)
+        else:
+            conn.state.dropped += len(data)
+            RX_DROPPED_BYTES.inc(len(data))
+
+    def _bucket_data(self, conn, data):
+        n, now = len(data), time.monotonic()
+        sent = read_stamp(data) if not conn.server.legacy and n > STAMP_LEN else None
+        state = conn.state
+        if self.mode == SHAPE:
+            # frames already read wait their turn; reading stops until they are through
+            state.held.append((n, sent))
+            if state.resume is None:
+                conn.transport.pause_reading()
+                self._release(conn)
+            return
+        ok = self.bucket.take(n, now)
+        if ok:
+            self._bucket_accept(state, ok, sent)
+        if ok < n:
+            state.dropped += n - ok
+            RX_DROPPED_BYTES.inc(n - ok)
+
+    def _bucket_accept(self, state, n, sent):
+        self.bytes_used_this_interval += n
+        state.accepted += n
+        RX_BYTES.inc(n)
+        if sent is not None:
+            self.latency.record(time.time() - sent)
+
+    def _release(self, conn):
+        """Shaping: accept held frames as the bucket allows, then resume reading."""
+        state, t = conn.state, conn.transport
+        state.resume = None
+        while state.held:
+            n, sent = state.held[0]
+            wait = self.bucket.wait_time(min(n, self.bucket.depth))
+            if wait > 0:
+                self.bucket.delayed_s += wait
+                RX_SHAPED_SECONDS.inc(wait)
+                state.resume = asyncio.get_running_loop().call_later(wait, self._release, conn)
+                return
+            state.held.popleft()
+            self.bucket.reserve(n)
+            self._bucket_accept(state, n, sent)
+        if not t.is_closing():
+            t.resume_reading()
+
+    def tick(self, now):
+        self.last_interval_bytes = self.bytes_used_this_interval
+        self.bytes_used_this_interval = 0
+        if self.mode not in (POLICE, SHAPE):
+            self.tokens = BYTES_PER_INT  # reset budget each interval
+        if self.fq:
+            self.fq.rebalance(time.monotonic())
+
+    def control(self, conn):
+        CONTROL_SENT.inc()
+        budget = self.fq.budget(conn.state.flow) if self.fq else BYTES_PER_INT
+        return {"type": "bw", "budget": budget, "interval_ms": INTERVAL_MS}
+
+    def level(self):
+        return self.last_interval_bytes
+
+    def report(self):
+        print(f"[RX3] latency send->accept: {self.latency.format()}")
+        if self.mode in (POLICE, SHAPE) and not self.fq:
+            print(f"[RX3] bucket: {self.bucket.stats()}")
+        if self.fq:
+            for key, st in self.fq.stats().items():
+                print(f"[RX3] flow {key}: {st}")
+
 if __name__ == "__main__":
-    FixedReceiverCase3().serve()
\ No newline at end of file
+    legacy = "--legacy" in sys.argv
+    serve_from_argv()
+    fair = "--fair" in sys.argv
+    opts = {a[2:].split("=", 1)[0]: a.split("=", 1)[1] for a in sys.argv if a.startswith("--") and "=" in a}
+    classes, mode = opts.get("classes"), opts.get("mode")
+    try:
+        check_mode(mode)
+    except ValueError as e:
+        print(f"[RX3] {e}")
+        sys.exit(2)
+    depth = int(opts["depth"]) if "depth" in opts else None
+    if fair or "--async" in sys.argv:   # fair queuing needs the multi-connection receiver
+        AsyncReceiver(Case3Policy(fair, classes, mode=mode, depth=depth), HOST, PORT, legacy=legacy,
+                      logger=make_logger('case3_bandwidth_limit/bandwidth_log.txt')).serve()
+    else:
+        FixedReceiverCase3(legacy=legacy, logger=make_logger('case3_bandwidth_limit/bandwidth_log.txt'),
+                           mode=mode, depth=depth).serve()
\ No newline at end of file
@@ -1,19 +1,49 @@
 #!/usr/bin/env python3
-import socket, time, json, threading
+import socket, time, threading, sys
+from common.wire import FT_CTRL, ProtocolError, encode_control, make_decoder
+from common.sender_engine import SenderEngine, SizedFrames
+from common.pacing import Pacer, sleep_until
+from common.metrics import REGISTRY, serve_from_argv
+from common.latency import STAMP_LEN, make_stamp
 
 HOST, PORT = 'localhost', 5002
 
+TX_FRAMES = REGISTRY.counter("tx_frames_total", "Data frames (chunks) sent", case="case3")
+TX_BYTES = REGISTRY.counter("tx_bytes_total", "Payload bytes sent", case="case3")
+TX_BUDGET = REGISTRY.gauge("tx_budget_bytes", "Budget per interval from the receiver", case="case3")
+TX_CWND = REGISTRY.gauge("tx_cwnd_bytes", "App-level window", case="case3")
+TX_CONTROL = REGISTRY.counter("tx_control_received_total", "Control messages received", case="case3", level="OK")
+
 class FixedSenderCase3:
-    def __init__(self):
+    def __init__(self, legacy=False, nodelay=None, cork=False, port=PORT):
+        self.legacy = legacy        # True: raw bytes + "#CTRL#" lines instead of binary frames
+        self.nodelay, self.cork = nodelay, cork
+        self.port = port
         self.sock = None
         self.interval = 0.1        # seconds (100 ms)
         self.budget  = 4096         # bytes per interval (updated by RX)
         self.cwnd    = 4096         # app-level window to avoid spikes
         self.chunk   = 512          # send chunk size
+        self.flow_class = None      # fair-queuing receivers: class and weight to ask for
+        self.weight = None
         self.running = True
 
+    def on_budget(self, budget, interval_ms):
+        TX_CONTROL.inc()
+        self.budget = budget
+        self.interval = interval_ms / 1000.0
+        # Keep cwnd within 2x budget to smooth bursts
+        self.cwnd = min(max(self.cwnd, self.budget), self.budget * 2)
+
+    def after_interval(self, sent):
+        # Conservative AIMD adjust
+        if sent >= self.budget:
+            self.cwnd = max(self.budget, int(self.cwnd * 0.95))
+        else:
+            self.cwnd = min(self.budget * 2, int(self.cwnd + self.chunk))
+
     def ctrl_listener(self):
-        buf = b""
+        decoder = make_decoder(self.legacy)
         while self.running and self.sock:
             try:
                 self.sock.settimeout(0.05)
@@ -22,57 +52,69 @@ class FixedSenderCase3:
                 data = b""
             if not data:
                 time.sleep(0.02); continue
-            buf += data
-            while b"#CTRL#" in buf:
-                i = buf.find(b"#CTRL#")
-                if i > 0:
-                    buf = buf[i:]
-                nl = buf.find(b"\n")
-                if nl == -1: break
-                line = buf[len("#CTRL#"):nl].decode(errors="ignore")
-                buf = buf[nl+1:]
+            try:
+                events = decoder.feed(data)
+            except ProtocolError as e:
+                print(f"[TX3] bad control stream: {e}"); break
+            for ftype, msg in events:
+                if ftype != FT_CTRL:
+                    continue
                 try:
-                    msg = json.loads(line)
                     if msg.get("type") == "bw":
-                        self.budget = int(msg.get("budget", self.budget))
-                        self.interval = int(msg.get("interval_ms", int(self.interval*1000))) / 1000.0
-                        # Keep cwnd within 2x budget to smooth bursts
-                        self.cwnd = min(max(self.cwnd, self.budget), self.budget * 2)
+                        self.on_budget(int(msg.get("budget", self.budget)),
+                                       int(msg.get("interval_ms", int(self.interval*1000))))
                 except:
                     pass
 
     def run(self, seconds=12):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((HOST, PORT))
-        print(f"[TX3] Connected to {HOST}:{PORT}")
+        self.sock.connect((HOST, self.port))
+        print(f"[TX3] Connected to {HOST}:{self.port}")
+        if self.flow_class is not None or self.weight is not None:
+            hello = {"type": "hello", "class": self.flow_class, "weight": self.weight}
+            self.sock.sendall(encode_control({k: v for k, v in hello.items() if v is not None}, self.legacy))
         threading.Thread(target=self.ctrl_listener, daemon=True).start()
 
+        engine = SenderEngine(self.sock, nodelay=self.nodelay, cork=self.cork)
+        # chunks long enough carry "<send time>|" in front of the filler
+        frames = SizedFrames(lambda n: b'0' * STAMP_LEN + b'|' + b'Z' * (n - STAMP_LEN - 1)
+                             if n > STAMP_LEN else b'Z' * n, self.legacy)
+        pacer = Pacer(self.budget * 8 / self.interval)
+        TX_BUDGET.set_function(lambda: self.budget)
+        TX_CWND.set_function(lambda: self.cwnd)
         end = time.time() + seconds
+        tick = time.monotonic()
         while time.time() < end:
             allowed = min(self.budget, self.cwnd)
             sent = 0
-            # Shape transmission: spread allowed bytes into small chunks
+            # Shape transmission: spread allowed bytes evenly over the interval
+            pacer.rate_bps = max(allowed, 1) * 8 / self.interval
+            pacer.reset()
             while sent < allowed:
                 n = min(self.chunk, allowed - sent)
+                pacer.pace(n)
+                pool = frames.get(n)
+                if n > STAMP_LEN:
+                    pool.patch(0, 0, make_stamp())
                 try:
-                    self.sock.sendall(b'Z' * n)
+                    engine.send(pool.views[0])
                 except Exception as e:
                     print(f"[TX3] send error: {e}")
                     end = 0; break
                 sent += n
-                # tiny pacing gap to avoid micro-bursts
-                time.sleep(0.002)
+                TX_FRAMES.inc()
+                TX_BYTES.inc(n)
             print(f"[TX3] interval={int(self.interval*1000)}ms budget={self.budget}B cwnd={self.cwnd}B sent={sent}B")
-            # Conservative AIMD adjust
-            if sent >= self.budget:
-                self.cwnd = max(self.budget, int(self.cwnd * 0.95))
-            else:
-                self.cwnd = min(self.budget * 2, int(self.cwnd + self.chunk))
-            time.sleep(self.interval)
+            self.after_interval(sent)
+            # next interval starts on the deadline, not `interval` after the last chunk
+            tick = max(tick + self.interval, time.monotonic() - self.interval)
+            sleep_until(tick)
 
         try: self.sock.close()
         except: pass
         print("[TX3] Done")
 
 if __name__ == "__main__":
-    FixedSenderCase3().run()
+    serve_from_argv()
+    FixedSenderCase3(legacy="--legacy" in sys.argv, nodelay=True if "--nodelay" in sys.argv else None,
+                     cork="--cork" in sys.argv).run()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Continuous token bucket for the case3 bandwidth cap.
+
+The original policer reset its budget to BYTES_PER_INT every interval
+and dropped any chunk larger than what was left, so part-fitting chunks
+were lost whole and goodput swung from one interval to the next. Here
+tokens accrue continuously at ``rate`` bytes/s from a monotonic clock,
+up to ``depth`` bytes (the largest burst let through at once):
+
+    take(n)      police with partial acceptance: accept as many of the
+                 ``n`` bytes as there are tokens and return that count
+    consume(n)   all or nothing, for callers that cannot split
+    reserve(n)   shape: always accept, running into debt, and return how
+                 long the caller should hold off so the long-run rate
+                 never exceeds ``rate``
+
+Counters (``accepted``, ``dropped``, ``delayed_s``) are in whole bytes
+and seconds; fractional tokens carry over rather than being rounded
+away, so accepted bytes over any period stay within ``depth`` of
+``rate * elapsed``. Times are passed in (``now``) or read from ``clock``,
+so the simulator can drive a bucket on virtual time.
+"""
+
+import time
+
+POLICE, SHAPE = "police", "shape"
+
+
+class TokenBucket:
+    def __init__(self, rate, depth, now=None, clock=time.monotonic):
+        self.rate, self.depth = float(rate), float(depth)
+        self.clock = clock
+        self.tokens = self.depth
+        self.stamp = clock() if now is None else now
+        self.accepted = self.dropped = 0
+        self.delayed_s = 0.0
+
+    def refill(self, now=None):
+        """Add the tokens earned since the last call; returns the level."""
+        now = self.clock() if now is None else now
+        if now > self.stamp:
+            self.tokens = min(self.depth, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+        return self.tokens
+
+    def take(self, n, now=None):
+        """Accept up to ``n`` bytes; returns how many (the rest are dropped)."""
+        ok = min(n, max(0, int(self.refill(now))))
+        self.tokens -= ok
+        self.accepted += ok
+        self.dropped += n - ok
+        return ok
+
+    def consume(self, n, now=None):
+        """Accept all ``n`` bytes if the tokens cover them, else none."""
+        if self.refill(now) >= n:
+            self.tokens -= n
+            self.accepted += n
+            return True
+        self.dropped += n
+        return False
+
+    def reserve(self, n, now=None):
+        """Accept ``n`` bytes against future tokens; returns the seconds of debt to wait out."""
+        self.refill(now)
+        self.tokens -= n
+        self.accepted += n
+        if self.tokens >= 0 or not self.rate:
+            return 0.0
+        wait = -self.tokens / self.rate
+        self.delayed_s += wait
+        return wait
+
+    def wait_time(self, n, now=None):
+        """Seconds until ``n`` tokens are available (0 if they are now)."""
+        short = n - self.refill(now)
+        return max(0.0, short / self.rate) if self.rate else (0.0 if short <= 0 else float("inf"))
+
+    def stats(self):
+        return {"rate_Bps": self.rate, "depth": self.depth, "accepted": self.accepted,
+                "dropped": self.dropped, "delayed_s": round(self.delayed_s, 3)}
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""asyncio receiver core: one event loop serving many sender connections.
+
+The socket handling lives here; what a case does with the bytes lives in
+a ``ReceiverPolicy``. Each connection gets its own state object from
+``policy.open``, data is fed through ``policy.data``, and a single timer
+asks the policy for a control message per connection every
+``control_interval`` seconds.
+"""
+
+import asyncio
+
+from common.wire import FT_CTRL, FT_DATA, encode_control
+from common.recv_buffer import RecvBuffer
+from common.metrics import REGISTRY
+
+CONTROL_HIGH_WATER = 64 * 1024   # skip control to clients that stopped reading
+
+
+class ReceiverPolicy:
+    """Per-case behaviour plugged into AsyncReceiver. Override what you need."""
+
+    name = "RX"
+    control_interval = 0.2      # seconds between control messages, None = never
+    tick_interval = None        # seconds between tick() calls, None = never
+
+    def open(self, conn):
+        """Return the per-connection state object."""
+        return None
+
+    def data(self, conn, data):
+        """Called once per DATA frame (or per raw chunk in legacy mode).
+
+        ``data`` is a memoryview into the connection's receive buffer and
+        is overwritten by the next read; copy it to keep it.
+        """
+        pass
+
+    def message(self, conn, msg):
+        """Called with each control message dict the sender sends (e.g. a hello)."""
+        pass
+
+    def control(self, conn):
+        """Control message dict for ``conn``, or None to send nothing."""
+        return None
+
+    def tick(self, now):
+        pass
+
+    def close(self, conn):
+        pass
+
+    def level(self):
+        """Value logged by the BufferLogger (buffer, queue or bandwidth)."""
+        return 0
+
+    def tasks(self):
+        """Extra coroutines to run for the receiver's lifetime (e.g. workers)."""
+        return []
+
+    def report(self):
+        """Print final statistics when the receiver shuts down."""
+        pass
+
+
+class ReceiverConnection(asyncio.BufferedProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.peer = None
+        self.state = None
+        self.bytes_in = 0
+        self.rbuf = RecvBuffer(legacy=server.legacy)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peer = transport.get_extra_info('peername')
+        self.state = self.server.policy.open(self)
+        self.server.connections.add(self)
+
+    def get_buffer(self, sizehint):
+        return self.rbuf.writable()
+
+    def buffer_updated(self, nbytes):
+        self.bytes_in += nbytes
+        self.rbuf.commit(nbytes)
+        policy = self.server.policy
+        for ftype, payload in self.rbuf.events():
+            if ftype == FT_DATA:
+                policy.data(self, payload)
+            elif ftype == FT_CTRL:
+                policy.message(self, payload)
+
+    def connection_lost(self, exc):
+        self.server.connections.discard(self)
+        self.server.policy.close(self)
+
+    def send_control(self, msg):
+        t = self.transport
+        if t is None or t.is_closing() or t.get_write_buffer_size() > CONTROL_HIGH_WATER:
+            return False
+        t.write(encode_control(msg, self.server.legacy))
+        return True
+
+
+class AsyncReceiver:
+    """Serve ``policy`` on host:port for any number of concurrent senders."""
+
+    def __init__(self, policy, host='localhost', port=0, logger=None, backlog=1024, legacy=False):
+        self.policy = policy
+        self.legacy = legacy
+        self.host, self.port = host, port
+        self.logger = logger
+        self.backlog = backlog
+        self.connections = set()
+        self._server = None
+        REGISTRY.gauge("rx_connections", "Open sender connections",
+                       receiver=policy.name).set_function(lambda: len(self.connections))
+
+    async def _control_loop(self):
+        interval = self.policy.control_interval
+        while True:
+            await asyncio.sleep(interval)
+            for conn in list(self.connections):
+                msg = self.policy.control(conn)
+                if msg is not None:
+                    conn.send_control(msg)
+
+    async def _tick_loop(self):
+        loop = asyncio.get_running_loop()
+        interval = self.policy.tick_interval
+        while True:
+            await asyncio.sleep(interval)
+            self.policy.tick(loop.time())
+            if self.logger:
+                self.logger.update_buffer_size(self.policy.level())
+
+    async def serve_async(self, ready=None):
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(
+            lambda: ReceiverConnection(self), self.host, self.port,
+            backlog=self.backlog, reuse_address=True)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"[{self.policy.name}] async receiver on {self.host}:{self.port}")
+        tasks = [asyncio.ensure_future(c) for c in self.policy.tasks()]
+        if self.policy.control_interval:
+            tasks.append(asyncio.ensure_future(self._control_loop()))
+        if self.policy.tick_interval:
+            tasks.append(asyncio.ensure_future(self._tick_loop()))
+        if ready is not None:
+            ready.set()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    def serve(self):
+        if self.logger:
+            self.logger.start()
+        try:
+            asyncio.run(self.serve_async())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.logger:
+                self.logger.stop()
+            print(f"[{self.policy.name}] Closed")
+            self.policy.report()
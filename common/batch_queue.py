@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Bounded record queue that workers drain in batches.
+
+``queue.Queue`` takes its lock and signals a condition once per item on
+both sides. ``BatchQueue`` lets the reader put every record from one
+receive under a single lock hold (``put_many``) and lets a worker take
+up to ``max_items`` at once (``get_batch``), lingering at most
+``max_wait`` after the first record for the batch to fill. Per record
+that leaves a deque append and popleft, however many workers share it.
+
+``get_batch_async`` does the same for an ``asyncio.Queue``, saving one
+task wakeup per record.
+"""
+
+import asyncio, queue, threading, time
+from collections import deque
+
+
+class BatchQueue:
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize          # 0 = unbounded
+        self._items = deque()
+        self._not_empty = threading.Condition(threading.Lock())
+
+    def qsize(self):
+        return len(self._items)
+
+    def put_nowait(self, item):
+        with self._not_empty:
+            if self.maxsize and len(self._items) >= self.maxsize:
+                raise queue.Full
+            self._items.append(item)
+            self._not_empty.notify()
+
+    def put_many(self, items):
+        """Append as many of ``items`` (a list) as fit; returns how many were taken."""
+        if not items:
+            return 0
+        with self._not_empty:
+            n = len(items)
+            if self.maxsize:
+                n = max(0, min(n, self.maxsize - len(self._items)))
+            if n:
+                self._items.extend(items[:n] if n < len(items) else items)
+                self._not_empty.notify(n)
+        return n
+
+    def get_batch(self, max_items=1, max_wait=0.0, timeout=None, share=1):
+        """Up to ``max_items`` records, oldest first; [] if none came within ``timeout``.
+
+        After the first record, waits up to ``max_wait`` more seconds for
+        the batch to fill. ``share`` caps a batch at 1/share of what is
+        queued (rounded up), so a pool of ``share`` workers splits a short
+        queue instead of one worker taking all of it.
+        """
+        items, cond = self._items, self._not_empty
+        with cond:
+            if not items and not cond.wait_for(lambda: items, timeout):
+                return []
+            if max_wait > 0 and len(items) < max_items:
+                deadline = time.monotonic() + max_wait
+                while len(items) < max_items:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    cond.wait(left)
+            n = min(max_items, len(items))
+            if share > 1:
+                n = min(n, -(-len(items) // share))
+            return [items.popleft() for _ in range(n)]
+
+
+async def get_batch_async(q, max_items=1, max_wait=0.0, share=1):
+    """``BatchQueue.get_batch`` for an ``asyncio.Queue``: waits for one record,
+    then takes what is queued up to ``max_items``, lingering ``max_wait``.
+    ``share`` caps the batch at 1/share of what is queued, as in ``get_batch``."""
+    batch = [await q.get()]
+    if share > 1:
+        max_items = min(max_items, -(-(q.qsize() + 1) // share))
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_wait
+    while len(batch) < max_items:
+        try:
+            batch.append(q.get_nowait())
+            continue
+        except asyncio.QueueEmpty:
+            pass
+        left = deadline - loop.time()
+        if left <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(q.get(), left))
+        except asyncio.TimeoutError:
+            break
+    return batch
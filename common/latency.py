@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""One-way latency measurement: send-time stamps and a log-bucketed histogram.
+
+Senders write their ``time.time()`` into each payload as a fixed-width
+ASCII stamp (``STAMP_FMT``, 17 bytes plus a ``|``); receivers read it
+back with ``read_stamp`` and record ``now - stamp``. Sender and receiver
+share the host clock in these experiments, so the difference is the
+one-way delay.
+
+``LatencyHistogram`` is HDR-style: values are counted in integer
+microseconds, exactly below ``2**sub_bits`` and above that in buckets
+whose width doubles every power of two, each power split into the same
+number of linear sub-buckets. Relative error stays under
+``2**-(sub_bits-1)`` (0.8% for the default) from 1 us to ``highest``
+seconds with a few thousand counters, however many samples are recorded.
+Each thread records into its own counter array, so workers never
+contend or lose updates.
+"""
+
+import threading, time
+from array import array
+
+STAMP_FMT = b"%017.6f"
+STAMP_LEN = 17
+UNIT = 1e-6   # histogram resolution: 1 us
+_INF = float("inf")
+
+_get_ident = threading.get_ident
+
+
+def make_stamp(t=None):
+    return STAMP_FMT % (time.time() if t is None else t)
+
+
+def read_stamp(payload, offset=0):
+    """Send time stamped at ``offset`` of ``payload`` (bytes or view), or None."""
+    raw = payload[offset:offset + STAMP_LEN]
+    if len(raw) < STAMP_LEN:
+        return None
+    try:
+        return float(bytes(raw))
+    except ValueError:
+        return None
+
+
+class LatencyHistogram:
+    def __init__(self, highest=100.0, sub_bits=8):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.half = self.sub_count >> 1
+        self.highest_units = int(highest / UNIT)
+        self.size = self._index(self.highest_units) + 1
+        self._cells = {}   # thread id -> [counts array, sum, min, max, negatives]
+
+    def _index(self, v):
+        if v < self.sub_count:
+            return v
+        shift = v.bit_length() - self.sub_bits
+        return self.sub_count + (shift - 1) * self.half + (v >> shift) - self.half
+
+    def _bucket_upper(self, i):
+        """Highest value (units) counted in bucket i."""
+        if i < self.sub_count:
+            return i
+        shift = (i - self.sub_count) // self.half + 1
+        m = (i - self.sub_count) % self.half + self.half
+        return ((m + 1) << shift) - 1
+
+    def _cell(self):
+        cell = self._cells.get(_get_ident())
+        if cell is None:
+            cell = self._cells[_get_ident()] = [array('q', bytes(8 * self.size)), 0.0, _INF, -_INF, 0]
+        return cell
+
+    def record(self, seconds):
+        try:
+            cell = self._cells[_get_ident()]
+        except KeyError:
+            cell = self._cell()
+        if seconds < 0:
+            cell[4] += 1   # clock step or bad stamp: counted, not binned
+            return
+        v = int(seconds * 1e6)
+        if v < self.sub_count:
+            i = v
+        elif v <= self.highest_units:
+            shift = v.bit_length() - self.sub_bits
+            i = self.sub_count + (shift - 1) * self.half + (v >> shift) - self.half
+        else:
+            i = self.size - 1
+        cell[0][i] += 1
+        cell[1] += seconds
+        if seconds < cell[2]:
+            cell[2] = seconds
+        if seconds > cell[3]:
+            cell[3] = seconds
+
+    def since(self, t0, now=None):
+        """Record ``now - t0`` (``now`` defaults to ``time.time()``)."""
+        self.record((time.time() if now is None else now) - t0)
+
+    def _merged(self):
+        counts = array('q', bytes(8 * self.size))
+        total, lo, hi, neg = 0.0, _INF, -_INF, 0
+        for c, s, mn, mx, ng in list(self._cells.values()):
+            for i, n in enumerate(c):
+                if n:
+                    counts[i] += n
+            total += s
+            neg += ng
+            lo, hi = min(lo, mn), max(hi, mx)
+        if lo == _INF:
+            lo = hi = None
+        return counts, total, lo, hi, neg
+
+    def merge(self, other):
+        """Add ``other``'s samples into this histogram (same layout)."""
+        counts, total, lo, hi, neg = other._merged()
+        cell = self._cell()
+        for i, n in enumerate(counts):
+            if n:
+                cell[0][i] += n
+        cell[1] += total
+        cell[4] += neg
+        if lo is not None:
+            cell[2], cell[3] = min(cell[2], lo), max(cell[3], hi)
+
+    @property
+    def count(self):
+        return sum(sum(c[0]) for c in list(self._cells.values()))
+
+    def percentiles(self, qs=(0.5, 0.99, 0.999)):
+        """Values (seconds) at the given quantiles, None when empty."""
+        counts, _total, _lo, hi, _neg = self._merged()
+        n = sum(counts)
+        if not n:
+            return [None] * len(qs)
+        out = []
+        for q in qs:
+            rank = max(1, int(q * n + 0.999999999))   # ceil, at least the first sample
+            acc = 0
+            for i, c in enumerate(counts):
+                acc += c
+                if acc >= rank:
+                    out.append(min(self._bucket_upper(i) * UNIT + UNIT, hi))
+                    break
+        return out
+
+    def summary(self):
+        counts, total, lo, hi, neg = self._merged()
+        n = sum(counts)
+        p50, p99, p999 = self.percentiles()
+        return {"count": n, "negative": neg, "min_ms": _ms(lo), "mean_ms": _ms(total / n) if n else None,
+                "p50_ms": _ms(p50), "p99_ms": _ms(p99), "p999_ms": _ms(p999), "max_ms": _ms(hi)}
+
+    def format(self):
+        s = self.summary()
+        if not s["count"]:
+            return "no samples"
+        return (f"n={s['count']} p50={s['p50_ms']}ms p99={s['p99_ms']}ms "
+                f"p999={s['p999_ms']}ms max={s['max_ms']}ms")
+
+
+def _ms(v):
+    return None if v is None else round(v * 1000, 3)
+
+
+def export(hist, name, help="", registry=None, **labels):
+    """Publish ``hist``'s p50/p99/p999 (seconds) and count as scrape-time gauges."""
+    if registry is None:
+        from common.metrics import REGISTRY as registry
+    for q in (0.5, 0.99, 0.999):
+        registry.gauge(name, help, quantile=str(q), **labels).set_function(
+            lambda q=q: hist.percentiles((q,))[0] or 0.0)
+    registry.gauge(name + "_count", "Samples in " + name, **labels).set_function(lambda: hist.count)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Process-wide counters, gauges and histograms with a text scrape endpoint.
+
+Updates take no lock: counters and histograms keep one cell per thread
+(only that thread writes it) and a scrape sums the cells, so concurrent
+increments are never lost and the hot path is a dict lookup and an add.
+Gauges are a plain attribute store, or a function evaluated at scrape
+time (``set_function``), which costs nothing until someone looks.
+
+Metrics are created get-or-create style on a ``Registry``:
+
+    DROPS = REGISTRY.counter("rx_dropped_total", "Items dropped", case="case2", reason="red")
+    DROPS.inc()
+
+and rendered in the Prometheus text format by ``REGISTRY.render()`` or
+over HTTP by ``start_http_server(port)`` (``GET /metrics``).
+"""
+
+import sys, threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_get_ident = threading.get_ident
+
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                    for k, v in labels)
+    return "{" + body + "}"
+
+
+def _fmt(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, labels=()):
+        self.name, self.labels = name, labels
+        self._cells = {}   # thread id -> [value]
+
+    def inc(self, n=1):
+        try:
+            self._cells[_get_ident()][0] += n
+        except KeyError:
+            self._cells[_get_ident()] = [n]
+
+    @property
+    def value(self):
+        return sum(c[0] for c in list(self._cells.values()))
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, labels=()):
+        self.name, self.labels = name, labels
+        self._value = 0
+        self._fn = None
+
+    def set(self, v):
+        self._value = v
+
+    def set_function(self, fn):
+        """Read the value from ``fn()`` at scrape time instead."""
+        self._fn = fn
+
+    @property
+    def value(self):
+        if self._fn is not None:
+            try:
+                return self._fn()
+            except Exception:
+                return float("nan")
+        return self._value
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Histogram:
+    """Fixed upper-bound buckets (``le``), cumulative on output."""
+    kind = "histogram"
+
+    def __init__(self, name, labels=(), buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)):
+        self.name, self.labels = name, labels
+        self.bounds = tuple(sorted(buckets))
+        self._cells = {}   # thread id -> [count per bucket (+Inf last)..., sum]
+
+    def observe(self, v):
+        try:
+            cell = self._cells[_get_ident()]
+        except KeyError:
+            cell = self._cells[_get_ident()] = [0] * (len(self.bounds) + 1) + [0.0]
+        cell[bisect_left(self.bounds, v)] += 1
+        cell[-1] += v
+
+    def totals(self):
+        n = len(self.bounds) + 1
+        counts, total = [0] * n, 0.0
+        for cell in list(self._cells.values()):
+            for i in range(n):
+                counts[i] += cell[i]
+            total += cell[-1]
+        return counts, total
+
+    def samples(self):
+        counts, total = self.totals()
+        acc = 0
+        for bound, c in zip(self.bounds + (float("inf"),), counts):
+            acc += c
+            yield self.name + "_bucket", self.labels + (("le", _fmt(bound)),), acc
+        yield self.name + "_sum", self.labels, total
+        yield self.name + "_count", self.labels, acc
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()   # creation only, never on update
+        self._metrics = {}              # (name, labels) -> metric
+        self._help = {}                 # name -> (kind, help)
+
+    def _get(self, cls, name, help, labels, **kw):
+        key = (name, tuple(sorted(labels.items())))
+        m = self._metrics.get(key)
+        if m is None:
+            with self._lock:
+                m = self._metrics.get(key)
+                if m is None:
+                    kind, _ = self._help.setdefault(name, (cls.kind, help))
+                    if kind != cls.kind:
+                        raise ValueError(f"metric {name} already registered as a {kind}")
+                    m = self._metrics[key] = cls(name, key[1], **kw)
+        return m
+
+    def counter(self, name, help="", **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", **labels):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help="", buckets=None, **labels):
+        kw = {"buckets": buckets} if buckets is not None else {}
+        return self._get(Histogram, name, help, labels, **kw)
+
+    def value(self, name, **labels):
+        """Sum of the counters/gauges called ``name`` whose labels include ``labels``;
+        None if there are none."""
+        want = set(labels.items())
+        found = [m.value for (n, key), m in list(self._metrics.items())
+                 if n == name and want <= set(key) and m.kind != "histogram"]
+        return sum(found) if found else None
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        by_name = {}
+        for (name, _labels), m in sorted(self._metrics.items()):
+            by_name.setdefault(name, []).append(m)
+        out = []
+        for name, metrics in by_name.items():
+            kind, help = self._help[name]
+            if help:
+                out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind}")
+            for m in metrics:
+                for sname, labels, value in m.samples():
+                    out.append(f"{sname}{_label_str(labels)} {_fmt(value)}")
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port=0, host="127.0.0.1", registry=REGISTRY):
+    """Serve ``registry`` at http://host:port/metrics from a daemon thread."""
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[METRICS] http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def serve_from_argv(argv=None):
+    """Start the endpoint if ``--metrics-port=N`` was given; returns the server or None."""
+    for arg in sys.argv if argv is None else argv:
+        if arg.startswith("--metrics-port="):
+            return start_http_server(int(arg.split("=", 1)[1]))
+    return None
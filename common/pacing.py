@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Deadline-based pacing for the senders.
+
+``time.sleep(gap)`` after every send loses the send time and the timer
+overshoot on each iteration, so the achieved rate always falls short
+and jitters with the OS timer. ``Pacer`` instead keeps an absolute
+monotonic-clock deadline for the next byte and advances it by exactly
+``nbytes * 8 / rate_bps`` per send:
+
+* falling behind (a slow send, a descheduled thread) is caught up by
+  sending without waiting, but never by more than ``max_lag`` seconds,
+  so a long stall does not turn into a line-rate burst;
+* ``burst_bytes`` lets a send go out that far ahead of schedule;
+* waits end with a short spin (``sleep_until``) so sub-millisecond gaps
+  are honoured instead of rounded up to the timer resolution.
+"""
+
+import sys, time
+
+# sleep() overshoots by ~50-100 us on Linux and up to a timer tick elsewhere;
+# the last SPIN_MARGIN seconds of a wait are spun instead.
+SPIN_MARGIN = 0.0002 if sys.platform.startswith("linux") else 0.002
+MAX_LAG = 0.05
+
+
+def sleep_until(deadline, clock=time.monotonic, spin=SPIN_MARGIN):
+    """Block until ``clock() >= deadline``: sleep most of the way, spin the rest."""
+    while True:
+        remaining = deadline - clock()
+        if remaining <= 0:
+            return
+        if remaining > spin:
+            time.sleep(remaining - spin)
+        else:
+            time.sleep(0)   # yield, keep spinning
+
+
+class Pacer:
+    """Release bytes at ``rate_bps`` bits per second on monotonic deadlines."""
+
+    def __init__(self, rate_bps, burst_bytes=0, max_lag=MAX_LAG, clock=time.monotonic, spin=SPIN_MARGIN):
+        self.rate_bps = rate_bps
+        self.burst_bytes = burst_bytes
+        self.max_lag = max_lag
+        self.clock = clock
+        self.spin = spin
+        self.next = None   # time at which the schedule reaches the next byte
+
+    def reset(self):
+        """Forget the schedule; the next send goes out immediately."""
+        self.next = None
+
+    def delay(self, nbytes):
+        """Seconds until ``nbytes`` may be sent (0 if allowed now); does not advance."""
+        now = self.clock()
+        if self.next is None or self.next < now - self.max_lag:
+            return 0.0
+        return max(0.0, self.next - self.burst_bytes * 8 / self.rate_bps - now)
+
+    def pace(self, nbytes):
+        """Wait until ``nbytes`` may be sent, then book them on the schedule."""
+        now = self.clock()
+        if self.next is None or self.next < now - self.max_lag:
+            self.next = now if self.next is None else now - self.max_lag   # bounded catch-up
+        ready = self.next - self.burst_bytes * 8 / self.rate_bps
+        if ready > now:
+            sleep_until(ready, self.clock, self.spin)
+        self.next += nbytes * 8 / self.rate_bps
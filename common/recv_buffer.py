@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Zero-copy receive path: recv_into a preallocated buffer, parse in place.
+
+``RecvBuffer`` owns one ``bytearray`` and a ``memoryview`` over it.
+Socket reads land directly in its free tail (``sock.recv_into`` or an
+``asyncio.BufferedProtocol``) and frames are decoded with
+``struct.unpack_from`` at an offset, so a DATA payload is handed out as
+a memoryview slice, never a copy. Consumed space is reclaimed by moving
+the (small) unparsed remainder to the front when the tail runs out, the
+linear equivalent of a ring that never has to wrap a frame.
+
+Payload views are only valid until the next read into the buffer;
+callers that keep data (e.g. the case2 queue) must copy it.
+"""
+
+import json
+
+from common.wire import (FRAME_HDR, FT_CTRL, FT_DATA, MAX_FRAME, CTRL_MARKER,
+                         ProtocolError, decode_control)
+
+DEFAULT_CAPACITY = 256 * 1024
+_HDR = FRAME_HDR.size
+_unpack_hdr = FRAME_HDR.unpack_from
+
+
+class RecvBuffer:
+    def __init__(self, capacity=DEFAULT_CAPACITY, legacy=False):
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.start = 0   # first unparsed byte
+        self.end = 0     # one past the last received byte
+        self.legacy = legacy
+
+    def writable(self, min_free=4096):
+        """Memoryview of the free tail, compacting or growing if it is short."""
+        if len(self.buf) - self.end < min_free:
+            pending = self.end - self.start
+            if pending + min_free > len(self.buf):
+                # a frame larger than the buffer: grow once, keep the new size
+                new = bytearray(max(2 * len(self.buf), pending + min_free))
+                new[:pending] = self.view[self.start:self.end]
+                self.buf, self.view = new, memoryview(new)
+            elif pending:
+                # copy first: source and destination may overlap
+                self.buf[:pending] = bytes(self.view[self.start:self.end])
+            self.start, self.end = 0, pending
+        return self.view[self.end:]
+
+    def commit(self, n):
+        self.end += n
+
+    def recv_from(self, sock):
+        """One recv_into from ``sock``; returns the byte count (0 on EOF)."""
+        n = sock.recv_into(self.writable())
+        self.end += n
+        return n
+
+    # ---- parsing ------------------------------------------------------
+    def events(self):
+        """Consume complete frames: list of (FT_DATA, view) / (FT_CTRL, dict)."""
+        if self.legacy:
+            return self._legacy_events()
+        out = []
+        buf, view = self.buf, self.view
+        pos, end = self.start, self.end
+        while end - pos >= _HDR:
+            ftype, n = _unpack_hdr(buf, pos)
+            if n > MAX_FRAME:
+                raise ProtocolError(f"frame of {n} bytes exceeds {MAX_FRAME}")
+            body = pos + _HDR
+            if end - body < n:
+                break
+            if ftype == FT_DATA:
+                out.append((FT_DATA, view[body:body + n]))
+            elif ftype == FT_CTRL:
+                out.append((FT_CTRL, decode_control(view[body:body + n])))
+            pos = body + n
+        self._consumed(pos)
+        return out
+
+    def data_bytes(self):
+        """Consume complete frames and return only the DATA payload byte count."""
+        if self.legacy:
+            return sum(len(p) for t, p in self._legacy_events() if t == FT_DATA)
+        total = 0
+        buf = self.buf
+        pos, end = self.start, self.end
+        while end - pos >= _HDR:
+            ftype, n = _unpack_hdr(buf, pos)
+            if n > MAX_FRAME:
+                raise ProtocolError(f"frame of {n} bytes exceeds {MAX_FRAME}")
+            if end - pos - _HDR < n:
+                break
+            if ftype == FT_DATA:
+                total += n
+            pos += _HDR + n
+        self._consumed(pos)
+        return total
+
+    def _legacy_events(self):
+        out = []
+        buf, view = self.buf, self.view
+        pos, end = self.start, self.end
+        while pos < end:
+            i = buf.find(CTRL_MARKER, pos, end)
+            if i == -1:
+                stop = end - _marker_tail(buf, pos, end)
+                if stop > pos:
+                    out.append((FT_DATA, view[pos:stop]))
+                pos = stop
+                break
+            if i > pos:
+                out.append((FT_DATA, view[pos:i]))
+            nl = buf.find(b"\n", i, end)
+            if nl == -1:
+                pos = i
+                break
+            try:
+                out.append((FT_CTRL, json.loads(bytes(view[i + len(CTRL_MARKER):nl]))))
+            except ValueError:
+                pass
+            pos = nl + 1
+        self._consumed(pos)
+        return out
+
+    def _consumed(self, pos):
+        if pos == self.end:
+            self.start = self.end = 0   # everything parsed: restart at the front
+        else:
+            self.start = pos
+
+
+def _marker_tail(buf, pos, end):
+    """Length of the longest tail of buf[pos:end] that could start CTRL_MARKER."""
+    for k in range(min(len(CTRL_MARKER) - 1, end - pos), 0, -1):
+        if buf[end - k:end] == CTRL_MARKER[:k]:
+            return k
+    return 0
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""Overrides for the case modules' settings, e.g. from a scenario file.
+
+The tunables (``APP_BUFFER_LIMIT``, ``Q_MAX``, ``WORKERS``,
+``BW_LIMIT_BPS``, ``INTERVAL_MS``, ...) are module constants read at
+call time, so setting them before a receiver is built is enough.
+Constants computed from others are listed in the module's ``DERIVED``
+map and recomputed unless they were set explicitly too.
+"""
+
+
+def apply_settings(module, settings):
+    """Set ``{NAME: value}`` on ``module`` (names case-insensitive); returns the names set."""
+    g = vars(module)
+    explicit = set()
+    for key, value in (settings or {}).items():
+        name = key.upper()
+        if name.startswith("_") or name not in g or name == "DERIVED":
+            raise KeyError(f"{module.__name__} has no setting {name}")
+        g[name] = value
+        explicit.add(name)
+    for name, fn in g.get("DERIVED", {}).items():
+        if name not in explicit:
+            g[name] = fn()
+    return explicit
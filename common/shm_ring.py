@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Fixed-slot record ring in ``multiprocessing.shared_memory``.
+
+Hands records from a receiver process to worker processes without
+pickling: ``put_many`` copies each record into a slot of the shared
+block and ``get_batch`` copies a batch back out, both under one
+cross-process lock per call. Slot layout is ``SLOT_HDR`` (enqueue time,
+send time or NaN, record length) followed by up to ``slot_bytes`` of
+record; the ring header holds the head and tail counters and a stop
+flag, so ``qsize()`` is readable from any process.
+
+The ring pickles by shared-memory name, so it can be passed to
+``Process(args=...)`` under any start method and attaches on arrival.
+"""
+
+import math, multiprocessing, struct, time
+from multiprocessing import shared_memory
+
+RING_HDR = struct.Struct('<QQQ')     # head, tail, stop
+SLOT_HDR = struct.Struct('<ddI4x')   # enqueue time, send time (NaN = none), length
+_HDR_BYTES = 64
+
+
+class ShmRing:
+    def __init__(self, slots=1024, slot_bytes=2048, ctx=None):
+        ctx = ctx or multiprocessing.get_context()
+        self.slots, self.slot_bytes = slots, slot_bytes
+        self.stride = SLOT_HDR.size + slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=_HDR_BYTES + slots * self.stride)
+        self.cond = ctx.Condition(ctx.Lock())
+        self.owner = True
+        self.buf = self.shm.buf
+        RING_HDR.pack_into(self.buf, 0, 0, 0, 0)
+
+    def __getstate__(self):
+        return self.shm.name, self.slots, self.slot_bytes, self.cond
+
+    def __setstate__(self, state):
+        name, self.slots, self.slot_bytes, self.cond = state
+        self.stride = SLOT_HDR.size + self.slot_bytes
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = False
+        self.buf = self.shm.buf
+
+    def qsize(self):
+        head, tail, _stop = RING_HDR.unpack_from(self.buf, 0)
+        return tail - head
+
+    @property
+    def stopped(self):
+        return RING_HDR.unpack_from(self.buf, 0)[2] != 0
+
+    def stop(self):
+        """Tell blocked producers and consumers to give up."""
+        with self.cond:
+            head, tail, _stop = RING_HDR.unpack_from(self.buf, 0)
+            RING_HDR.pack_into(self.buf, 0, head, tail, 1)
+            self.cond.notify_all()
+
+    def put_many(self, items, timeout=None):
+        """Copy ``(enqueue time, send time or None, record)`` items in, waiting
+        up to ``timeout`` for free slots; returns how many were taken."""
+        buf, stride, slots = self.buf, self.stride, self.slots
+        deadline = None if timeout is None else time.monotonic() + timeout
+        done = 0
+        with self.cond:
+            while done < len(items):
+                head, tail, stop = RING_HDR.unpack_from(buf, 0)
+                if stop:
+                    break
+                free = slots - (tail - head)
+                if not free:
+                    left = None if deadline is None else deadline - time.monotonic()
+                    if left is not None and left <= 0:
+                        break
+                    self.cond.wait(left)
+                    continue
+                for enq, sent, data in items[done:done + free]:
+                    n = len(data)
+                    if n > self.slot_bytes:
+                        raise ValueError(f"record of {n} bytes exceeds slot size {self.slot_bytes}")
+                    off = _HDR_BYTES + (tail % slots) * stride
+                    SLOT_HDR.pack_into(buf, off, enq, math.nan if sent is None else sent, n)
+                    off += SLOT_HDR.size
+                    buf[off:off + n] = data
+                    tail += 1
+                    done += 1
+                RING_HDR.pack_into(buf, 0, head, tail, 0)
+                self.cond.notify_all()
+        return done
+
+    def get_batch(self, max_items=1, timeout=None):
+        """Up to ``max_items`` ``(enqueue time, send time or None, bytes)``
+        items, oldest first; [] on timeout or once stopped and empty."""
+        buf, stride, slots = self.buf, self.stride, self.slots
+        with self.cond:
+            head, tail, stop = RING_HDR.unpack_from(buf, 0)
+            if head == tail and not stop:
+                self.cond.wait(timeout)
+                head, tail, stop = RING_HDR.unpack_from(buf, 0)
+            out = []
+            while head < tail and len(out) < max_items:
+                off = _HDR_BYTES + (head % slots) * stride
+                enq, sent, n = SLOT_HDR.unpack_from(buf, off)
+                off += SLOT_HDR.size
+                out.append((enq, None if sent != sent else sent, bytes(buf[off:off + n])))
+                head += 1
+            if out:
+                RING_HDR.pack_into(buf, 0, head, tail, stop)
+                self.cond.notify_all()   # a producer may be waiting for slots
+        return out
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Wire protocol shared by the fixed senders and receivers.
+
+Binary framing (default): every frame is a 5-byte header
+``!BI`` = (frame type, payload length) followed by the payload.
+
+    DATA  payload is application bytes
+    CTRL  payload is CTRL_BODY = !BBIII (kind, level, value, budget, interval_ms)
+
+``value`` is the buffer fill (case1) or queue length (case2). A sender's
+hello (kind 4, fair-queuing class and weight) carries the weight x1000
+in ``value`` and the class name, UTF-8, after the body. Control
+frames decode to the same dicts the legacy JSON lines carried, so the
+senders' handlers do not care which format is on the wire.
+
+Legacy text format (``--legacy``): raw data bytes with control lines
+``#CTRL#{json}\\n`` mixed in.
+"""
+
+import json, struct
+
+FRAME_HDR = struct.Struct('!BI')
+CTRL_BODY = struct.Struct('!BBIII')
+FT_DATA, FT_CTRL = 0x01, 0x02
+MAX_FRAME = 16 * 1024 * 1024
+
+KIND_BUFFER, KIND_QUEUE, KIND_BW, KIND_HELLO = 1, 2, 3, 4
+_KIND_BY_TYPE = {"buffer_status": KIND_BUFFER, "queue": KIND_QUEUE, "bw": KIND_BW, "hello": KIND_HELLO}
+LEVELS = ("OK", "SLOW", "FAST")
+_LEVEL_CODE = {name: i for i, name in enumerate(LEVELS)}
+
+CTRL_MARKER = b"#CTRL#"
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def encode_data(payload):
+    return FRAME_HDR.pack(FT_DATA, len(payload)) + payload
+
+
+def encode_control(msg, legacy=False):
+    if legacy:
+        return CTRL_MARKER + json.dumps(msg).encode() + b"\n"
+    kind = _KIND_BY_TYPE[msg["type"]]
+    value = msg.get("buffer", msg.get("qlen", 0))
+    tail = b""
+    if kind == KIND_HELLO:
+        value = int(round((msg.get("weight") or 0) * 1000))
+        tail = (msg.get("class") or "").encode()
+    body = CTRL_BODY.pack(kind, _LEVEL_CODE.get(msg.get("level", "OK"), 0), value,
+                          msg.get("budget", 0), msg.get("interval_ms", 0)) + tail
+    return FRAME_HDR.pack(FT_CTRL, len(body)) + body
+
+
+def decode_control(body):
+    kind, level, value, budget, interval_ms = CTRL_BODY.unpack_from(body)
+    if kind == KIND_BUFFER:
+        return {"type": "buffer_status", "buffer": value, "level": LEVELS[level]}
+    if kind == KIND_QUEUE:
+        return {"type": "queue", "qlen": value, "level": LEVELS[level]}
+    if kind == KIND_BW:
+        return {"type": "bw", "budget": budget, "interval_ms": interval_ms}
+    if kind == KIND_HELLO:
+        name = bytes(body[CTRL_BODY.size:]).decode()
+        return {"type": "hello", "class": name or None, "weight": value / 1000 if value else None}
+    return {"type": "unknown", "kind": kind}
+
+
+class FrameDecoder:
+    """Incremental decoder for binary frames.
+
+    ``feed`` returns a list of ``(FT_DATA, payload bytes)`` and
+    ``(FT_CTRL, msg dict)`` events. Consumed bytes are tracked by offset
+    and compacted in bulk, so the cost stays linear in the bytes fed.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        pos, end = self._pos, len(buf)
+        out = []
+        hdr = FRAME_HDR.size
+        while end - pos >= hdr:
+            ftype, n = FRAME_HDR.unpack_from(buf, pos)
+            if n > MAX_FRAME:
+                raise ProtocolError(f"frame of {n} bytes exceeds {MAX_FRAME}")
+            if end - pos - hdr < n:
+                break
+            start = pos + hdr
+            if ftype == FT_DATA:
+                out.append((FT_DATA, bytes(buf[start:start + n])))
+            elif ftype == FT_CTRL:
+                out.append((FT_CTRL, decode_control(buf[start:start + n])))
+            pos = start + n
+        if pos == end:
+            buf.clear()
+            pos = 0
+        elif pos > 65536:
+            del buf[:pos]
+            pos = 0
+        self._pos = pos
+        return out
+
+
+class LegacyDecoder:
+    """Incremental decoder for the text format (raw data + #CTRL# lines).
+
+    Scanning resumes where the previous call stopped instead of searching
+    the whole buffer again, and a partial marker at the end is held back
+    rather than counted as data.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        out = []
+        pos = 0
+        while True:
+            i = buf.find(CTRL_MARKER, pos)
+            if i == -1:
+                keep = _marker_prefix_len(buf)
+                if len(buf) - keep > pos:
+                    out.append((FT_DATA, bytes(buf[pos:len(buf) - keep])))
+                pos = len(buf) - keep
+                break
+            if i > pos:
+                out.append((FT_DATA, bytes(buf[pos:i])))
+            nl = buf.find(b"\n", i)
+            if nl == -1:
+                pos = i
+                break
+            try:
+                out.append((FT_CTRL, json.loads(bytes(buf[i + len(CTRL_MARKER):nl]))))
+            except ValueError:
+                pass
+            pos = nl + 1
+        del buf[:pos]
+        return out
+
+
+class RecordSplitter:
+    """Cuts a raw byte stream into fixed-size records.
+
+    The legacy format has no data framing, so a recv chunk can end or
+    start mid-record; the partial record is carried over to the next
+    ``feed``. Returns the complete records as bytes.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._partial = bytearray()
+
+    def feed(self, data):
+        size, out = self.size, []
+        pos, end = 0, len(data)
+        if self._partial:
+            pos = min(end, size - len(self._partial))
+            self._partial += data[:pos]
+            if len(self._partial) < size:
+                return out
+            out.append(bytes(self._partial))
+            self._partial.clear()
+        while end - pos >= size:
+            out.append(bytes(data[pos:pos + size]))
+            pos += size
+        if pos < end:
+            self._partial += data[pos:]
+        return out
+
+
+def _marker_prefix_len(buf):
+    """Length of the longest tail of buf that is a prefix of CTRL_MARKER."""
+    for k in range(min(len(CTRL_MARKER) - 1, len(buf)), 0, -1):
+        if buf.endswith(CTRL_MARKER[:k]):
+            return k
+    return 0
+
+
+def make_decoder(legacy=False):
+    return LegacyDecoder() if legacy else FrameDecoder()
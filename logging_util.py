@@ -1,31 +1,191 @@
 #!/usr/bin/env python3
 # File: logging_util.py (CREATE THIS FILE IN PROJECT ROOT)
 
+import os
+import sys
 import time
+import struct
 import threading
+from array import array
+
+# Binary log layout: a header of 16-byte slots followed by fixed-width records
+# of little-endian float64, one per column. Slot 0 is LOG_HEADER (magic,
+# column count, record size); slots 1..n hold the NUL-padded column names.
+LOG_MAGIC = b'BUFLOG\x01\x00'
+LOG_HEADER = struct.Struct('<8sHHI')
+LOG_SLOT = 16
+CSV_COLUMNS = ('Timestamp', 'BufferSize')
+STATS_COLUMNS = ('Timestamp', 'BufferSize', 'Min', 'Max', 'Mean', 'Count')
+
+def little_endian(rows):
+    """``rows`` (an array('d')) in the file's little-endian byte order."""
+    if sys.byteorder != 'little':
+        rows.byteswap()
+    return rows
+
+def log_header(columns):
+    head = LOG_HEADER.pack(LOG_MAGIC, len(columns), 8 * len(columns), 0)
+    return head + b''.join(c.encode().ljust(LOG_SLOT, b'\0') for c in columns)
 
 class BufferLogger:
-    def __init__(self, log_file='buffer_log.txt'):
+    """Logs a receiver's buffer/queue/bandwidth value to a file.
+
+    Default mode writes the latest value once per second. With
+    ``stats=True`` every ``update_buffer_size`` call is folded into the
+    current interval of ``interval`` seconds (down to 1 ms), and each
+    interval is written as its last value plus min, max, mean and count,
+    so peaks between samples are not lost. Finished intervals pass
+    through a preallocated ring of ``capacity`` rows; if the writer falls
+    that far behind, the newest rows are dropped and counted in
+    ``dropped_intervals``.
+
+    ``binary=True`` writes fixed-width float64 records after a small
+    header instead of CSV text (see ``analysis_tools.buffer_log``), with
+    buffered writes flushed about once a second.
+    """
+
+    def __init__(self, log_file='buffer_log.txt', stats=False, interval=1.0, capacity=8192, binary=False):
         self._log_file = log_file
         self._value_to_log = 0
         self._stop_event = threading.Event()
-        self._thread = threading.Thread(target=self._run, daemon=True)
-    
+        self._interval = interval
+        self._binary = binary
+        if stats:
+            self._thread = threading.Thread(target=self._run_stats, daemon=True)
+            # ring of finished intervals: index, last, min, max, sum, count
+            self._capacity = capacity
+            self._r_index = array('q', bytes(8 * capacity))
+            self._r_last = array('d', bytes(8 * capacity))
+            self._r_min = array('d', bytes(8 * capacity))
+            self._r_max = array('d', bytes(8 * capacity))
+            self._r_sum = array('d', bytes(8 * capacity))
+            self._r_count = array('q', bytes(8 * capacity))
+            self._head = 0   # rows written by the updater
+            self._tail = 0   # rows consumed by the writer thread
+            self.dropped_intervals = 0
+            self._rate = 1.0 / interval
+            self._cur = -1
+            self._min = self._max = self._sum = self._last = 0
+            self._count = 0
+            self._t0 = time.monotonic()
+            self._edge = self._t0   # first update opens an interval
+            self.update_buffer_size = self._update_stats
+        else:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _open(self, columns):
+        if self._binary:
+            f = open(self._log_file, 'wb')
+            f.write(log_header(columns))
+        else:
+            f = open(self._log_file, 'w')
+            f.write(','.join(columns) + '\n')
+        return f
+
     def _run(self):
-        with open(self._log_file, 'w') as f:
-            f.write('Timestamp,BufferSize\n')
+        with self._open(CSV_COLUMNS) as f:
             start_time = time.time()
-            while not self._stop_event.wait(timeout=1.0):
-                elapsed_time = time.time() - start_time
-                f.write(f'{elapsed_time},{self._value_to_log}\n')
-                f.flush()
-    
+            last_flush = start_time
+            while not self._stop_event.wait(timeout=self._interval):
+                now = time.time()
+                elapsed_time = now - start_time
+                if self._binary:
+                    f.write(little_endian(array('d', (elapsed_time, self._value_to_log))))
+                    if now - last_flush >= 1.0:
+                        f.flush()
+                        last_flush = now
+                else:
+                    f.write(f'{elapsed_time},{self._value_to_log}\n')
+                    f.flush()
+
     def update_buffer_size(self, size):
         self._value_to_log = size
-    
+
+    # ---- stats mode ----------------------------------------------------
+    def _update_stats(self, size, _now=time.monotonic):
+        if _now() >= self._edge:
+            self._roll(size)
+            return
+        if size < self._min:
+            self._min = size
+        elif size > self._max:
+            self._max = size
+        self._sum += size
+        self._count += 1
+        self._last = size
+
+    def _roll(self, size):
+        """Close the current interval into the ring and start the one now running."""
+        if self._count:
+            h = self._head
+            if h - self._tail >= self._capacity:
+                self.dropped_intervals += 1
+            else:
+                k = h % self._capacity
+                self._r_index[k] = self._cur
+                self._r_last[k] = self._last
+                self._r_min[k] = self._min
+                self._r_max[k] = self._max
+                self._r_sum[k] = self._sum
+                self._r_count[k] = self._count
+                self._head = h + 1   # publish after the row is complete
+        i = int((time.monotonic() - self._t0) * self._rate)
+        self._cur = i
+        self._edge = self._t0 + (i + 1) * self._interval
+        self._min = self._max = self._sum = self._last = size
+        self._count = 1
+
+    def _drain(self, f):
+        h, cap, iv = self._head, self._capacity, self._interval
+        if h == self._tail:
+            return
+        if self._binary:
+            rows = array('d')
+            for n in range(self._tail, h):
+                k = n % cap
+                c = self._r_count[k]
+                rows.extend((self._r_index[k] * iv, self._r_last[k], self._r_min[k],
+                             self._r_max[k], self._r_sum[k] / c, c))
+            f.write(little_endian(rows))
+        else:
+            lines = []
+            for n in range(self._tail, h):
+                k = n % cap
+                c = self._r_count[k]
+                lines.append(f'{self._r_index[k] * iv:.6f},{self._r_last[k]:g},{self._r_min[k]:g},'
+                             f'{self._r_max[k]:g},{self._r_sum[k] / c:.6g},{c}\n')
+            f.write(''.join(lines))
+        self._tail = h
+        f.flush()
+
+    def _run_stats(self):
+        with self._open(STATS_COLUMNS) as f:
+            # batch the file writes: at most ~10 per second however short the interval
+            period = max(self._interval, 0.1)
+            while not self._stop_event.wait(timeout=period):
+                self._drain(f)
+            self._roll(0)   # flush the interval in progress
+            self._drain(f)
+            if self.dropped_intervals:
+                print(f"[LOG] {self.dropped_intervals} intervals dropped (ring of {self._capacity} full)")
+
     def start(self):
         self._thread.start()
-    
+
     def stop(self):
         self._stop_event.set()
-        self._thread.join()
\ No newline at end of file
+        self._thread.join()
+
+
+def make_logger(log_file, argv=None):
+    """BufferLogger configured from ``--log-stats``, ``--log-interval-ms=N``
+    and ``--log-binary`` (which swaps a ``.txt`` log name for ``.bin``)."""
+    argv = sys.argv if argv is None else argv
+    interval_ms = 1000.0
+    for arg in argv:
+        if arg.startswith('--log-interval-ms='):
+            interval_ms = max(1.0, float(arg.split('=', 1)[1]))
+    binary = '--log-binary' in argv
+    if binary:
+        log_file = os.path.splitext(log_file)[0] + '.bin'
+    return BufferLogger(log_file, stats='--log-stats' in argv, interval=interval_ms / 1000.0, binary=binary)
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""Userspace network emulator: an asyncio TCP/UDP proxy with a link model.
+
+Sits between an unmodified sender and receiver and gives each direction
+of every connection its own emulated link:
+
+    delay       one-way propagation delay
+    jitter      per-segment delay variation (normal, sigma = jitter)
+    rate        bottleneck bandwidth; segments serialize one after another
+    queue       bottleneck buffer in bytes (the backlog waiting to serialize)
+    loss        random (Bernoulli) loss, or
+    burst       Gilbert-Elliott loss: p(good->bad), p(bad->good), and the
+                loss probability in the bad and good states
+
+TCP carries a byte stream, so the proxy cannot discard bytes without
+corrupting it. A full queue instead stops the proxy reading from the
+source, which closes the sender's window like a real bottleneck, and a
+lost segment is held back for a fast retransmit (one round trip), plus
+a retransmission timeout, doubling up to MAX_RTO, for each retransmission
+that is lost too. The bytes behind it wait, so the application sees the
+stall and in-order recovery that TCP would give it. UDP datagrams are really dropped, by loss or by a full queue,
+and jitter may reorder them.
+
+Every link has its own ``random.Random`` seeded from ``seed``, the
+connection number and the direction, so a run with the same seed and
+traffic loses the same segments.
+
+    python -m netem.proxy --listen 6001 --target localhost:5001 \\
+        --delay 20 --jitter 2 --rate 10mbit --queue 64kb --loss 0.01 --seed 1
+
+By default rate, queue and loss apply to the client->server direction
+and delay/jitter to both; ``--symmetric`` applies everything both ways.
+"""
+
+import heapq, random, socket, asyncio, argparse, itertools, threading
+
+READ_SIZE = 65536
+SEGMENT = 8192            # bytes per emulated segment (loss and serialization unit)
+QUEUE_BYTES = 64 * 1024
+INFLIGHT_BYTES = 4 * 1024 * 1024   # scheduled but not yet delivered, per direction
+MIN_RTO = 0.2             # retransmission timeout once a retransmission is lost too
+MAX_RTO = 2.0
+FAST_RECOVERY = 0.005     # floor for the one-RTT fast-retransmit cost of a lost segment
+
+RATE_UNITS = {"bit": 1, "kbit": 1e3, "mbit": 1e6, "gbit": 1e9, "bps": 8, "kbps": 8e3, "mbps": 8e6, "gbps": 8e9}
+SIZE_UNITS = {"b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+
+
+def _parse_unit(text, units, default):
+    text = str(text).strip().lower()
+    for unit in sorted(units, key=len, reverse=True):
+        if text.endswith(unit):
+            return float(text[:-len(unit)]) * units[unit]
+    return float(text) * default
+
+
+def parse_rate(text):
+    """'10mbit', '1.5mbps' (bytes), '250000' (bit/s) -> bit/s."""
+    return _parse_unit(text, RATE_UNITS, 1)
+
+
+def parse_size(text):
+    """'64kb', '1mb', '1500' -> bytes."""
+    return int(_parse_unit(text, SIZE_UNITS, 1))
+
+
+class LinkSpec:
+    """One direction's link parameters (times in ms, rate in bit/s, queue in bytes)."""
+
+    def __init__(self, delay_ms=0.0, jitter_ms=0.0, rate_bps=0, queue_bytes=QUEUE_BYTES,
+                 loss=0.0, burst=None, segment=SEGMENT):
+        self.delay, self.jitter = delay_ms / 1000.0, jitter_ms / 1000.0
+        self.rate_bps, self.queue_bytes = rate_bps, queue_bytes
+        self.loss = loss
+        self.burst = tuple(burst) + (1.0, 0.0)[len(burst) - 2:] if burst else None   # p_gb, p_bg, loss_bad, loss_good
+        self.segment = segment
+
+    @classmethod
+    def from_dict(cls, d):
+        """Scenario/JSON form: delay_ms, jitter_ms, rate ('10mbit'), queue ('64kb'), loss, burst, segment."""
+        d = dict(d or {})
+        kw = {k: d[k] for k in ("delay_ms", "jitter_ms", "loss", "burst", "segment") if k in d}
+        if "rate" in d:
+            kw["rate_bps"] = parse_rate(d["rate"])
+        if "queue" in d:
+            kw["queue_bytes"] = parse_size(d["queue"])
+        return cls(**kw)
+
+    def shaped(self):
+        return bool(self.delay or self.jitter or self.rate_bps or self.loss or self.burst)
+
+
+class Link:
+    """Timing and loss state of one direction of one connection."""
+
+    def __init__(self, spec, rng):
+        self.spec, self.rng = spec, rng
+        self.free_at = 0.0      # when the serializer is done with what it holds
+        self.last = 0.0         # latest release time handed out (TCP keeps order)
+        self.bad = False        # Gilbert-Elliott state
+        self.stats = {"bytes": 0, "segments": 0, "lost": 0, "dropped": 0}
+
+    def backlog(self, now):
+        """Bytes queued at the bottleneck, waiting to serialize."""
+        if not self.spec.rate_bps:
+            return 0
+        return max(0.0, self.free_at - now) * self.spec.rate_bps / 8
+
+    def lose(self):
+        spec, rng = self.spec, self.rng
+        if spec.burst:
+            p_gb, p_bg, loss_bad, loss_good = spec.burst
+            self.bad = rng.random() < (1 - p_bg if self.bad else p_gb)
+            return rng.random() < (loss_bad if self.bad else loss_good)
+        return spec.loss > 0 and rng.random() < spec.loss
+
+    def schedule(self, now, size, ordered):
+        """Release time for a segment of ``size`` bytes offered at ``now``, or None if dropped."""
+        spec = self.spec
+        if not ordered and spec.rate_bps and self.backlog(now) + size > spec.queue_bytes:
+            self.stats["dropped"] += 1
+            return None
+        penalty = 0.0
+        if self.lose():
+            self.stats["lost"] += 1
+            if not ordered:
+                return None
+            penalty = max(FAST_RECOVERY, 2 * spec.delay)
+            rto = max(MIN_RTO, 4 * spec.delay)
+            while self.lose():          # the retransmission can be lost too
+                penalty += rto
+                rto = min(MAX_RTO, rto * 2)
+        t = now
+        if spec.rate_bps:
+            self.free_at = max(now, self.free_at) + size * 8 / spec.rate_bps
+            t = self.free_at
+        t += spec.delay + penalty
+        if spec.jitter:
+            t = max(t - spec.delay, t + self.rng.gauss(0.0, spec.jitter))
+        if ordered:
+            t = self.last = max(t, self.last)
+        self.stats["bytes"] += size
+        self.stats["segments"] += 1
+        return t
+
+
+class Pipe:
+    """Segments of one direction waiting for their release time."""
+
+    def __init__(self, link, ordered):
+        self.link, self.ordered = link, ordered
+        self.heap = []
+        self.seq = itertools.count()
+        self.inflight = 0
+        self.eof = False
+        self.failed = False     # deliver() ended early: the destination is gone
+        self.wake = asyncio.Event()
+        self.space = asyncio.Event()
+        self.space.set()
+
+    def _push(self, t, data):
+        heapq.heappush(self.heap, (t, next(self.seq), data))
+        self.inflight += len(data)
+        if self.heap[0][2] is data:
+            self.wake.set()
+
+    def offer(self, data):
+        """Datagram path: schedule or drop ``data``."""
+        t = self.link.schedule(asyncio.get_running_loop().time(), len(data), False)
+        if t is not None:
+            self._push(t, data)
+
+    async def send(self, data):
+        """Stream path: wait for queue and inflight room, then schedule every segment."""
+        loop, link = asyncio.get_running_loop(), self.link
+        spec = link.spec
+        if spec.rate_bps:
+            over = link.backlog(loop.time()) + len(data) - spec.queue_bytes
+            if over > 0:
+                await asyncio.sleep(over * 8 / spec.rate_bps)
+        while self.inflight > INFLIGHT_BYTES and not self.failed:
+            self.space.clear()
+            await self.space.wait()
+        if self.failed:
+            raise ConnectionResetError("destination closed")
+        seg = spec.segment
+        for off in range(0, len(data), seg):
+            chunk = data[off:off + seg]
+            self._push(link.schedule(loop.time(), len(chunk), True), chunk)
+
+    def close(self):
+        self.eof = True
+        self.wake.set()
+
+    async def deliver(self, write, drain=None):
+        """Hand segments to ``write`` at their release times until closed and empty."""
+        loop, heap = asyncio.get_running_loop(), self.heap
+        try:
+            while heap or not self.eof:
+                if not heap:
+                    self.wake.clear()
+                    await self.wake.wait()
+                    continue
+                if heap[0][0] > loop.time():
+                    self.wake.clear()
+                    timer = loop.call_at(heap[0][0], self.wake.set)
+                    await self.wake.wait()
+                    timer.cancel()
+                    continue
+                now = loop.time()
+                while heap and heap[0][0] <= now:
+                    data = heapq.heappop(heap)[2]
+                    self.inflight -= len(data)
+                    write(data)
+                if drain is not None:
+                    await drain()
+                if self.inflight <= INFLIGHT_BYTES:
+                    self.space.set()
+        finally:
+            if heap or not self.eof:
+                self.failed = True
+                self.space.set()
+
+
+class _UdpSession(asyncio.DatagramProtocol):
+    """Upstream socket for one UDP client; replies go back through ``down``."""
+
+    def __init__(self, proxy, addr, up, down):
+        self.proxy, self.addr, self.up, self.down = proxy, addr, up, down
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.down.offer(data)
+
+
+class _UdpFront(asyncio.DatagramProtocol):
+    def __init__(self, proxy):
+        self.proxy = proxy
+
+    def connection_made(self, transport):
+        self.proxy.udp_transport = transport
+
+    def datagram_received(self, data, addr):
+        self.proxy._udp_datagram(data, addr)
+
+
+class NetemProxy:
+    """Proxy ``listen`` -> ``target`` through emulated ``up``/``down`` links."""
+
+    def __init__(self, target, listen=("localhost", 0), up=None, down=None, udp=False, seed=0):
+        self.target, self.listen = target, listen
+        self.up, self.down = up or LinkSpec(), down or LinkSpec()
+        self.udp, self.seed = udp, seed
+        self.port = None
+        self.server = self.udp_transport = None
+        self.ids = itertools.count()
+        self.connections = 0
+        self.links = []           # (direction, Link) for stats
+        self.tasks = set()
+        self.sessions = {}        # UDP client addr -> session
+        self.loop = self.thread = None
+
+    def _link(self, conn_id, direction):
+        spec = self.up if direction == "up" else self.down
+        link = Link(spec, random.Random(f"{self.seed}/{conn_id}/{direction}"))
+        self.links.append((direction, link))
+        return link
+
+    async def start(self):
+        host, port = self.listen
+        if self.udp:
+            transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: _UdpFront(self), local_addr=(host, port))
+            self.port = transport.get_extra_info("sockname")[1]
+        else:
+            self.server = await asyncio.start_server(self._tcp_client, host, port)
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    # ---- TCP ----
+
+    async def _tcp_client(self, c_reader, c_writer):
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        conn_id = next(self.ids)
+        self.connections += 1
+        try:
+            s_reader, s_writer = await asyncio.open_connection(*self.target)
+        except OSError as e:
+            print(f"[NETEM] connect to {self.target[0]}:{self.target[1]} failed: {e}")
+            c_writer.close()
+            self.tasks.discard(task)
+            return
+        for w in (c_writer, s_writer):
+            sock = w.get_extra_info("socket")
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        up = Pipe(self._link(conn_id, "up"), ordered=True)
+        down = Pipe(self._link(conn_id, "down"), ordered=True)
+        try:
+            await asyncio.gather(self._pump(c_reader, s_writer, up), self._pump(s_reader, c_writer, down))
+        except (OSError, asyncio.CancelledError):
+            pass
+        finally:
+            for w in (c_writer, s_writer):
+                w.close()
+            self.tasks.discard(task)
+
+    @staticmethod
+    async def _pump(reader, writer, pipe):
+        deliver = asyncio.ensure_future(pipe.deliver(writer.write, writer.drain))
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                await pipe.send(data)
+        except OSError:
+            pass
+        finally:
+            pipe.close()
+        try:
+            await deliver
+            if writer.can_write_eof():
+                writer.write_eof()
+        except OSError:
+            pass
+
+    # ---- UDP ----
+
+    def _udp_datagram(self, data, addr):
+        session = self.sessions.get(addr)
+        if session is None:
+            conn_id = next(self.ids)
+            self.connections += 1
+            up = Pipe(self._link(conn_id, "up"), ordered=False)
+            down = Pipe(self._link(conn_id, "down"), ordered=False)
+            session = self.sessions[addr] = _UdpSession(self, addr, up, down)
+            task = asyncio.ensure_future(self._udp_session(session))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        session.up.offer(data)
+
+    async def _udp_session(self, session):
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: session, remote_addr=self.target)
+        front = self.udp_transport
+        await asyncio.gather(session.up.deliver(session.transport.sendto),
+                             session.down.deliver(lambda d: front.sendto(d, session.addr)))
+
+    # ---- lifecycle ----
+
+    def stats(self):
+        out = {}
+        for direction, link in self.links:
+            agg = out.setdefault(direction, dict.fromkeys(link.stats, 0))
+            for k, v in link.stats.items():
+                agg[k] += v
+        out["connections"] = self.connections
+        return out
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        if self.udp_transport is not None:
+            self.udp_transport.close()
+        for s in self.sessions.values():
+            if s.transport is not None:
+                s.transport.close()
+        for t in list(self.tasks):
+            t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def start_background(self):
+        """Run on an event loop in a daemon thread; returns once listening."""
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.start())
+            ready.set()
+            self.loop.run_forever()
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name="netem", daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        """Stop a ``start_background`` proxy; returns its stats."""
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        return self.stats()
+
+
+def spec_from_args(args):
+    burst = [float(v) for v in args.burst.split(",")] if args.burst else None
+    return LinkSpec(args.delay, args.jitter, parse_rate(args.rate) if args.rate else 0,
+                    parse_size(args.queue), args.loss, burst, parse_size(args.segment))
+
+
+async def _main(args):
+    host, _, port = args.target.rpartition(":")
+    up = spec_from_args(args)
+    down = up if args.symmetric else LinkSpec(args.delay, args.jitter, segment=up.segment)
+    proxy = await NetemProxy((host or "localhost", int(port)), (args.host, args.listen), up, down,
+                             udp=args.udp, seed=args.seed).start()
+    print(f"[NETEM] {'udp' if args.udp else 'tcp'} {args.host}:{proxy.port} -> {args.target} "
+          f"delay {args.delay}ms jitter {args.jitter}ms rate {args.rate or 'unlimited'} "
+          f"queue {args.queue} loss {args.burst and 'burst ' + args.burst or args.loss}")
+    try:
+        while True:
+            await asyncio.sleep(args.report or 3600)
+            if args.report:
+                print(f"[NETEM] {proxy.stats()}")
+    finally:
+        await proxy.close()
+        print(f"[NETEM] {proxy.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TCP/UDP proxy emulating delay, jitter, rate limit and loss")
+    parser.add_argument("--listen", type=int, required=True, help="port to accept clients on")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--target", required=True, help="host:port of the real server")
+    parser.add_argument("--udp", action="store_true")
+    parser.add_argument("--delay", type=float, default=0.0, help="one-way delay, ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="delay standard deviation, ms")
+    parser.add_argument("--rate", help="bottleneck rate, e.g. 10mbit, 500kbit, 1mbps")
+    parser.add_argument("--queue", default="64kb", help="bottleneck queue size")
+    parser.add_argument("--loss", type=float, default=0.0, help="random loss probability")
+    parser.add_argument("--burst", help="Gilbert-Elliott loss: p_gb,p_bg[,loss_bad[,loss_good]]")
+    parser.add_argument("--segment", default=str(SEGMENT), help="emulated segment size")
+    parser.add_argument("--symmetric", action="store_true", help="shape server->client the same way")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", type=float, default=0, help="print stats every N seconds")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""Run declarative scenarios: receiver, sender and capture in one go.
+
+A scenario is a JSON file; only ``case`` is required:
+
+    {
+      "name": "case2_codel",
+      "case": "case2",
+      "duration": 15,
+      "receiver": {"variant": "fixed", "mode": "threads",
+                   "options": {"aqm": "codel", "seed": 1},
+                   "settings": {"WORKERS": 4, "Q_MAX": 400}},
+      "sender": {"variant": "fixed", "nodelay": true, "attrs": {"max_batch": 16}},
+      "logging": {"stats": true, "interval_ms": 100, "binary": false},
+      "capture": {"enabled": true, "interface": "lo", "method": "auto"},
+      "netem": {"delay_ms": 20, "rate": "20mbit", "queue": "64kb", "loss": 0.001, "seed": 1},
+      "metrics": true
+    }
+
+receiver   variant simple|fixed; mode threads|async; ``options`` are
+           constructor (or policy) keyword arguments, ``settings`` module
+           constants (see common.settings); ``legacy`` for the text wire format
+sender     variant simple|fixed; ``stress`` runs the simple sender's
+           overload/burst/fast mode (default on); ``attrs`` set sender
+           attributes, ``settings`` its module constants; fixed senders run
+           for ``duration`` seconds
+logging    BufferLogger options for the receiver's level log
+capture    port-filtered pcap of the run; method packet (in-process
+           AF_PACKET capture, analysis_tools.capture_engine), tcpdump
+           (or tshark), tap (the receiver records its own socket traffic)
+           or auto, the first of those that works here
+netem      optional emulated link between sender and receiver (netem.proxy):
+           delay_ms, jitter_ms, rate, queue, loss, burst and segment shape
+           sender->receiver; "down" holds the reverse direction's (default:
+           the same delay and jitter only); seed
+
+Each scenario gets a free port and a run directory under runs/. The
+receiver and sender run as separate processes (this module with
+``--role``), the receiver gets ``DRAIN_SEC`` after the sender exits, and
+everything left is stopped. The run directory then holds scenario.json,
+receiver.out/sender.out, the level log, capture.pcap, receiver.json and
+sender.json (metrics and latency), and result.json. Independent scenarios
+run in parallel:
+
+    python -m scenarios.runner scenarios/*.json --jobs 3
+"""
+
+import os, sys, json, time, signal, shutil, socket, argparse, importlib, subprocess, threading
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+RUNS_DIR = os.path.join(PROJECT_ROOT, "runs")
+STARTUP_SEC = 0.5       # receiver (and capture) start before the sender connects
+DRAIN_SEC = 2.0         # receiver's time to finish after the sender exits
+STOP_SEC = 5.0          # grace after SIGTERM before the process group is killed
+
+# case -> fixed receiver module, class, async policy; simple receiver module
+RECEIVERS = {
+    "case1": ("case1_buffer_overflow.fixed_receiver_case1", "ReceiverFixed", "Case1Policy",
+              "case1_buffer_overflow.simple_receiver"),
+    "case2": ("case2_long_queue.fixed_receiver_case2", "FixedReceiverCase2", "Case2Policy",
+              "case2_long_queue.case2_receiver"),
+    "case3": ("case3_bandwidth_limit.fixed_receiver_case3", "FixedReceiverCase3", "Case3Policy",
+              "case3_bandwidth_limit.case3_receiver"),
+}
+# case -> fixed sender module, class; simple sender module, its stress-mode argument
+SENDERS = {
+    "case1": ("case1_buffer_overflow.fixed_sender_case1", "SenderFixed",
+              "case1_buffer_overflow.simple_sender", "overload"),
+    "case2": ("case2_long_queue.fixed_sender_case2", "FixedSenderCase2",
+              "case2_long_queue.case2_sender", "burst_mode"),
+    "case3": ("case3_bandwidth_limit.fixed_sender_case3", "FixedSenderCase3",
+              "case3_bandwidth_limit.case3_sender", "high_rate"),
+}
+LOG_NAMES = {"case1": "buffer_log.txt", "case2": "queue_log.txt", "case3": "bandwidth_log.txt"}
+
+_ports_lock = threading.Lock()
+_ports_used = set()
+
+
+def load_scenario(path):
+    with open(path) as f:
+        sc = json.load(f)
+    if sc.get("case") not in RECEIVERS:
+        raise ValueError(f"{path}: 'case' must be one of {', '.join(RECEIVERS)}")
+    sc.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    sc.setdefault("duration", 10)
+    return sc
+
+
+def free_port(host="localhost"):
+    """A port no other scenario of this run has been given."""
+    with _ports_lock:
+        while True:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                s.bind((host, 0))
+                port = s.getsockname()[1]
+            if port not in _ports_used:
+                _ports_used.add(port)
+                return port
+
+
+# ---- roles (run inside the child processes) ------------------------
+
+def _write_json(path, obj):
+    with open(path, "w") as f:
+        json.dump(obj, f, indent=2)
+
+
+def _finish_role(run_dir, role, started, hist=None, capture=None):
+    from common.metrics import REGISTRY
+    with open(os.path.join(run_dir, role + ".prom"), "w") as f:
+        f.write(REGISTRY.render())
+    out = {"role": role, "elapsed_s": round(time.monotonic() - started, 3)}
+    if hist is not None:
+        out["latency"] = hist.summary()
+    if capture is not None:
+        out["capture"] = capture
+    _write_json(os.path.join(run_dir, role + ".json"), out)
+
+
+def receiver_role(sc, port, run_dir):
+    from logging_util import BufferLogger
+    from common.settings import apply_settings
+    from common.metrics import start_http_server
+    from analysis_tools.capture_engine import install_tap, remove_tap
+    case, spec = sc["case"], sc.get("receiver", {})
+    if (sc.get("capture") or {}).get("method") == "tap":
+        install_tap(os.path.join(run_dir, "capture.pcap"), port)
+    fixed_mod, cls_name, policy_name, simple_mod = RECEIVERS[case]
+    log = sc.get("logging", {})
+    log_path = os.path.join(run_dir, LOG_NAMES[case])
+    if log.get("binary"):
+        log_path = os.path.splitext(log_path)[0] + ".bin"
+    logger = BufferLogger(log_path, stats=log.get("stats", False),
+                          interval=log.get("interval_ms", 1000) / 1000.0, binary=log.get("binary", False))
+    if sc.get("metrics"):
+        server = start_http_server(0)
+        _write_json(os.path.join(run_dir, "metrics_port.json"), {"port": server.server_address[1]})
+
+    hist = None
+    if spec.get("variant", "fixed") == "simple":
+        mod = importlib.import_module(simple_mod)
+        serve = lambda: mod.start_receiver(port, logger)
+    else:
+        mod = importlib.import_module(fixed_mod)
+        apply_settings(mod, spec.get("settings"))
+        opts, legacy = spec.get("options", {}), spec.get("legacy", False)
+        if spec.get("mode", "threads") == "async":
+            from common.async_receiver import AsyncReceiver
+            policy = getattr(mod, policy_name)(**opts)
+            rx = AsyncReceiver(policy, mod.HOST, port, logger=logger, legacy=legacy)
+            hist = policy.latency
+        else:
+            rx = getattr(mod, cls_name)(legacy=legacy, logger=logger, port=port, **opts)
+            hist = rx.latency
+        serve = rx.serve
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    started = time.monotonic()
+    t = threading.Thread(target=serve, daemon=True)
+    t.start()
+    while t.is_alive() and not stop.wait(0.1):
+        pass
+    if t.is_alive():
+        logger.stop()   # serve() never returned, so its finally did not run
+    _finish_role(run_dir, "receiver", started, hist, remove_tap())
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def sender_role(sc, port, run_dir):
+    from common.settings import apply_settings
+    case, spec = sc["case"], sc.get("sender", {})
+    fixed_mod, cls_name, simple_mod, stress_arg = SENDERS[case]
+    started = time.monotonic()
+    if spec.get("variant", "fixed") == "simple":
+        mod = importlib.import_module(simple_mod)
+        mod.start_sender(port, **{stress_arg: spec.get("stress", True)})
+    else:
+        mod = importlib.import_module(fixed_mod)
+        apply_settings(mod, spec.get("settings"))
+        tx = getattr(mod, cls_name)(legacy=sc.get("receiver", {}).get("legacy", False),
+                                    nodelay=spec.get("nodelay"), cork=spec.get("cork", False), port=port)
+        for name, value in spec.get("attrs", {}).items():
+            if not hasattr(tx, name):
+                raise AttributeError(f"{cls_name} has no attribute {name}")
+            setattr(tx, name, value)
+        run_args = {"seconds": sc["duration"]}
+        if case == "case1":
+            run_args["total_packets"] = sys.maxsize
+        tx.run(**run_args)
+    _finish_role(run_dir, "sender", started)
+
+
+# ---- orchestration -------------------------------------------------
+
+def start_capture(sc, port, run_dir):
+    """Start capturing to run_dir/capture.pcap; returns (handle, description).
+
+    The handle is a PacketCapture, a tcpdump/tshark process, or None (off,
+    unavailable, or "tap", which the receiver role sets up itself).
+    """
+    from analysis_tools.capture_engine import PacketCapture
+    cap = sc.get("capture") or {}
+    if not cap.get("enabled"):
+        return None, "off"
+    iface = cap.get("interface") or ("lo0" if sys.platform == "darwin" else "lo")
+    path = os.path.join(run_dir, "capture.pcap")
+    method = cap.get("method", "auto")
+    if method in ("auto", "packet") and PacketCapture.available():
+        pc = PacketCapture(path, port, iface).start()
+        return pc, f"packet: {iface} tcp port {port} ({pc.mode})"
+    if method in ("auto", "tcpdump"):
+        if shutil.which("tcpdump"):
+            cmd = ["tcpdump", "-i", iface, "-U", "-w", path, f"tcp port {port}"]
+        elif shutil.which("tshark"):
+            cmd = ["tshark", "-i", iface, "-f", f"tcp port {port}", "-w", path]
+        else:
+            cmd = None
+        if cmd:
+            out = open(os.path.join(run_dir, "capture.out"), "w")
+            return subprocess.Popen(cmd, stdout=out, stderr=subprocess.STDOUT, start_new_session=True), " ".join(cmd)
+    if method in ("auto", "tap"):
+        return None, "tap"
+    return None, f"skipped: capture method {method} unavailable"
+
+
+def start_netem(sc, port):
+    """Started NetemProxy in front of the receiver's port, or None."""
+    spec = sc.get("netem")
+    if not spec:
+        return None
+    from netem.proxy import NetemProxy, LinkSpec
+    up = LinkSpec.from_dict({k: v for k, v in spec.items() if k not in ("down", "seed")})
+    down = LinkSpec.from_dict(spec.get("down", {k: spec[k] for k in ("delay_ms", "jitter_ms") if k in spec}))
+    return NetemProxy(("localhost", port), ("localhost", free_port()), up, down,
+                      seed=spec.get("seed", 0)).start_background()
+
+
+def stop_capture(capture):
+    """Stop what start_capture started; PacketCapture stats or None."""
+    if isinstance(capture, subprocess.Popen):
+        _stop(capture, signal.SIGINT)
+        return None
+    return capture.stop() if capture is not None else None
+
+
+def _spawn(role, path, port, run_dir):
+    out = open(os.path.join(run_dir, role + ".out"), "w")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_ROOT, os.environ.get("PYTHONPATH")])))
+    cmd = [sys.executable, "-u", "-m", "scenarios.runner", "--role", role, "--port", str(port),
+           "--run-dir", run_dir, path]
+    return subprocess.Popen(cmd, stdout=out, stderr=subprocess.STDOUT, cwd=run_dir, env=env,
+                            start_new_session=True)
+
+
+def _stop(proc, sig=signal.SIGTERM):
+    """Signal ``proc``'s process group, then kill whatever is left after STOP_SEC."""
+    if proc is None:
+        return None
+    if proc.poll() is None:
+        try:
+            os.killpg(proc.pid, sig)
+            proc.wait(STOP_SEC)
+        except (ProcessLookupError, subprocess.TimeoutExpired):
+            pass
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)   # workers the role may have started
+    except ProcessLookupError:
+        pass
+    return proc.wait()
+
+
+def run_scenario(path, runs_dir=RUNS_DIR):
+    sc = load_scenario(path)
+    port = free_port()
+    run_dir = os.path.join(runs_dir, f"{sc['name']}-{time.strftime('%Y%m%d-%H%M%S')}-{port}")
+    os.makedirs(run_dir)
+    print(f"[RUN] {sc['name']}: port {port} -> {os.path.relpath(run_dir, PROJECT_ROOT)}")
+
+    t0 = time.monotonic()
+    capture, capture_info = start_capture(sc, port, run_dir)
+    if capture_info == "tap":
+        sc["capture"]["method"] = "tap"   # tells the receiver role to record its sockets
+    _write_json(os.path.join(run_dir, "scenario.json"), sc)
+    scenario_path = os.path.join(run_dir, "scenario.json")
+    rx = _spawn("receiver", scenario_path, port, run_dir)
+    netem = start_netem(sc, port)
+    time.sleep(STARTUP_SEC)
+    tx = _spawn("sender", scenario_path, netem.port if netem else port, run_dir)
+    try:
+        # simple senders ignore the duration; allow them their own script plus slack
+        tx_rc = tx.wait(timeout=max(3 * sc["duration"], sc["duration"] + 120))
+    except subprocess.TimeoutExpired:
+        tx_rc = _stop(tx)
+    try:
+        rx.wait(timeout=DRAIN_SEC)
+    except subprocess.TimeoutExpired:
+        pass
+    rx_rc = _stop(rx)
+    _stop(tx)
+    capture_stats = stop_capture(capture)
+    netem_stats = netem.stop() if netem else None
+    elapsed = time.monotonic() - t0
+
+    result = {"name": sc["name"], "case": sc["case"], "port": port, "elapsed_s": round(elapsed, 3),
+              "sender_rc": tx_rc, "receiver_rc": rx_rc, "capture": capture_info,
+              "artifacts": sorted(os.listdir(run_dir)) + ["result.json"]}
+    for role in ("receiver", "sender"):
+        try:
+            with open(os.path.join(run_dir, role + ".json")) as f:
+                result[role] = json.load(f)
+        except (OSError, ValueError):
+            result[role] = None
+    result["capture_stats"] = capture_stats or (result["receiver"] or {}).get("capture")
+    result["netem"] = netem_stats
+    _write_json(os.path.join(run_dir, "result.json"), result)
+    ok = tx_rc == 0 and rx_rc == 0 and result["receiver"] is not None
+    lat = (result["receiver"] or {}).get("latency") or {}
+    print(f"[RUN] {sc['name']}: {'ok' if ok else 'FAILED'} in {elapsed:.1f}s"
+          + (f", latency {lat['p50_ms']}/{lat['p99_ms']} ms p50/p99" if lat.get("count") else ""))
+    return result
+
+
+def run_all(paths, jobs=1, runs_dir=RUNS_DIR):
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(lambda p: run_scenario(p, runs_dir), paths))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run scenario files (receiver + sender + capture)")
+    parser.add_argument("scenarios", nargs="+", help="scenario JSON files")
+    parser.add_argument("--jobs", type=int, default=1, help="scenarios to run at once")
+    parser.add_argument("--runs-dir", default=RUNS_DIR)
+    parser.add_argument("--role", choices=("receiver", "sender"), help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--run-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role:
+        role = receiver_role if args.role == "receiver" else sender_role
+        role(load_scenario(args.scenarios[0]), args.port, args.run_dir)
+        sys.exit(0)
+    results = run_all(args.scenarios, args.jobs, args.runs_dir)
+    sys.exit(0 if all(r["sender_rc"] == 0 and r["receiver_rc"] == 0 for r in results) else 1)
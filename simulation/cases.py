@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""Discrete-event models of the three fixed bottleneck cases.
+
+The models run on ``simulation.engine.Simulator`` in virtual time and
+reuse the receivers' constants and feedback functions and the senders'
+own control-reaction methods, so they track the real code. A minute of
+simulated traffic finishes in well under a second, and a given seed
+always gives the same result.
+
+    python -m simulation.cases case2 --seconds 60 --seed 1 --set WORKERS=4
+"""
+
+import os, sys, json, time, random, argparse
+from collections import deque
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from simulation.engine import Simulator
+from case1_buffer_overflow import fixed_receiver_case1 as rx1
+from case1_buffer_overflow.fixed_sender_case1 import SenderFixed
+from case2_long_queue import fixed_receiver_case2 as rx2
+from case2_long_queue.fixed_sender_case2 import FixedSenderCase2
+from case2_long_queue.aqm import make_aqm
+from case3_bandwidth_limit import fixed_receiver_case3 as rx3
+from case3_bandwidth_limit.fixed_sender_case3 import FixedSenderCase3
+from case3_bandwidth_limit.token_bucket import TokenBucket, POLICE, SHAPE
+
+LINK_DELAY = 0.0001     # one-way loopback latency for data and control
+CONTROL_PERIOD = 0.2    # case1/case2 receivers report every 200 ms
+SAMPLE_PERIOD = 0.1     # queue/buffer sampling for the result statistics
+CASE2_RECORD = 17 + 1 + 512   # "<time.time():.6f>|" + 512 B body
+
+
+def _percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+
+class Samples(list):
+    """Latency samples; ``record`` as on LatencyHistogram, so receiver helpers can fill it."""
+    record = list.append
+
+
+class CaseSim:
+    """Common bookkeeping: byte counters, level samples and the result dict."""
+
+    name = "case"
+
+    def __init__(self, sim, seed=0, link_delay=LINK_DELAY):
+        self.sim = sim
+        self.rng = random.Random(seed)
+        self.link_delay = link_delay
+        self.sent_bytes = self.delivered_bytes = self.dropped_bytes = 0
+        self.samples = []
+        self.latencies = Samples()
+
+    def level(self):
+        raise NotImplementedError
+
+    def start(self):
+        self.sim.every(SAMPLE_PERIOD, lambda: self.samples.append(self.level()))
+
+    def result(self, duration):
+        lat = sorted(self.latencies)
+        return {
+            "case": self.name,
+            "duration_s": duration,
+            "sent_bytes": self.sent_bytes,
+            "delivered_bytes": self.delivered_bytes,
+            "dropped_bytes": self.dropped_bytes,
+            "goodput_bps": self.delivered_bytes * 8 / duration if duration else 0.0,
+            "drop_rate": self.dropped_bytes / self.sent_bytes if self.sent_bytes else 0.0,
+            "level_mean": sum(self.samples) / len(self.samples) if self.samples else 0.0,
+            "level_max": max(self.samples) if self.samples else 0,
+            "latency_p50_ms": _ms(_percentile(lat, 0.50)),
+            "latency_p99_ms": _ms(_percentile(lat, 0.99)),
+            "latency_p999_ms": _ms(_percentile(lat, 0.999)),
+        }
+
+
+def _ms(v):
+    return None if v is None else round(v * 1000, 3)
+
+
+class Case1Sim(CaseSim):
+    """App buffer with watermark feedback (ReceiverFixed + SenderFixed).
+
+    Bytes that would push the buffer past ``limit`` are counted as
+    dropped, which is what a bounded application buffer would do.
+    Like ``drain_frames``, bytes count as delivered, and a frame's latency
+    is recorded, when the consumer drains them, so both include the time
+    spent in the buffer.
+    """
+
+    name = "case1"
+
+    def __init__(self, sim, seed=0, link_delay=LINK_DELAY, limit=rx1.APP_BUFFER_LIMIT,
+                 low=None, high=None, drain_bytes=4096, drain_period=0.01, total_packets=None):
+        super().__init__(sim, seed, link_delay)
+        self.limit = limit
+        self.low = int(limit * 0.5) if low is None else low
+        self.high = int(limit * 0.9) if high is None else high
+        self.drain_bytes, self.drain_period = drain_bytes, drain_period
+        self.total_packets = total_packets
+        self.tx = SenderFixed()
+        self.app_buffer = 0
+        self.frames = deque()         # [bytes left, send time] per buffered frame, oldest first
+        self.packets = 0
+
+    def level(self):
+        return self.app_buffer
+
+    def start(self):
+        super().start()
+        self.sim.schedule(0.0, self._send)
+        self.sim.every(self.drain_period, self._drain)
+        self.sim.every(CONTROL_PERIOD, self._control)
+
+    def _send(self):
+        n = self.tx.chunk_size
+        self.sent_bytes += n
+        self.packets += 1
+        self.sim.schedule(self.link_delay, self._arrive, n, self.sim.now)
+        if self.total_packets is None or self.packets < self.total_packets:
+            self.sim.schedule(self.tx.rate_delay, self._send)
+
+    def _arrive(self, n, sent_at):
+        if self.app_buffer + n > self.limit:
+            self.dropped_bytes += n
+            return
+        self.app_buffer += n
+        self.frames.append([n, sent_at])
+
+    def _drain(self):
+        n = min(self.drain_bytes, self.app_buffer)
+        self.app_buffer -= n
+        self.delivered_bytes += n
+        rx1.drain_frames(self.frames, n, self.latencies, self.sim.now)
+
+    def _control(self):
+        level = rx1.buffer_level(self.app_buffer, self.low, self.high)
+        self.sim.schedule(self.link_delay, self.tx.on_buffer_status, level)
+
+
+class Case2Sim(CaseSim):
+    """AQM-managed work queue drained by a worker pool (FixedReceiverCase2).
+
+    Every sender record is one queue item; latency is the time from send
+    to the end of processing, so it includes the queueing delay. The
+    sender reacts to queue status and to its RTT trend guard
+    (``on_send_time``) as FixedSenderCase2 does. ``aqm``
+    is a ``case2_long_queue.aqm`` spec (``red``, ``codel``, ``pie``, with
+    optional ``:key=value`` parameters); RED takes ``q_min_th``/``q_max_th``.
+    """
+
+    name = "case2"
+
+    def __init__(self, sim, seed=0, link_delay=LINK_DELAY, q_max=rx2.Q_MAX,
+                 q_min_th=rx2.Q_MIN_TH, q_max_th=rx2.Q_MAX_TH, workers=rx2.WORKERS,
+                 proc_delay=rx2.PROC_DELAY_SEC, record_size=CASE2_RECORD, aqm="red"):
+        super().__init__(sim, seed, link_delay)
+        self.q_max, self.q_min_th, self.q_max_th = q_max, q_min_th, q_max_th
+        self.proc_delay = proc_delay
+        self.record_size = record_size
+        self.tx = FixedSenderCase2()
+        if aqm.partition(":")[0] == "red" and ":" not in aqm:
+            aqm = f"red:min_th={q_min_th},max_th={q_max_th}"
+        self.aqm = make_aqm(aqm, rng=self.rng)
+        self.queue = deque()          # (send time, enqueue time) of queued records
+        self.idle = workers
+        self.processed = self.dropped_items = 0
+
+    def level(self):
+        return len(self.queue)
+
+    def start(self):
+        super().start()
+        self.sim.schedule(0.0, self._cycle)
+        self.sim.every(CONTROL_PERIOD, self._control)
+
+    def _cycle(self):
+        batch = self.tx.batch
+        self.sent_bytes += batch * self.record_size
+        self.sim.schedule(self.link_delay, self._arrive, batch, self.sim.now)
+        # the receiver's reader keeps the socket drained, so a batch write never blocks
+        self.tx.on_send_time(0.0, batch)
+        self.sim.schedule(self.tx.delay, self._cycle)
+
+    def _arrive(self, batch, sent_at):
+        q, size = self.queue, self.record_size
+        now = self.sim.now
+        for _ in range(batch):
+            if self.aqm.enqueue(len(q), now) or len(q) >= self.q_max:
+                self._drop()
+                continue
+            q.append((sent_at, now))
+        while self.idle:
+            sent_at = self._dequeue()
+            if sent_at is None:
+                break
+            self.idle -= 1
+            self.sim.schedule(self.proc_delay, self._done, sent_at)
+
+    def _drop(self):
+        self.dropped_items += 1
+        self.dropped_bytes += self.record_size
+
+    def _dequeue(self):
+        """Send time of the next record a worker keeps, None if the queue empties."""
+        q, now = self.queue, self.sim.now
+        while q:
+            sent_at, enq = q.popleft()
+            if not self.aqm.dequeue(now - enq, len(q), now):
+                return sent_at
+            self._drop()
+        return None
+
+    def _done(self, sent_at):
+        self.processed += 1
+        self.delivered_bytes += self.record_size
+        self.latencies.append(self.sim.now - sent_at)
+        nxt = self._dequeue()
+        if nxt is not None:
+            self.sim.schedule(self.proc_delay, self._done, nxt)
+        else:
+            self.idle += 1
+
+    def _control(self):
+        level = self.aqm.level(len(self.queue), self.sim.now)
+        self.sim.schedule(self.link_delay, self.tx.on_queue_status, level)
+
+    def result(self, duration):
+        r = super().result(duration)
+        r.update(processed=self.processed, dropped_items=self.dropped_items)
+        return r
+
+
+class Case3Sim(CaseSim):
+    """Token bucket policing or shaping (FixedReceiverCase3 + FixedSenderCase3).
+
+    ``mode`` is one of the receiver's POLICY_MODEs: "police" (partial
+    acceptance from a continuous bucket of ``depth`` bytes), "shape"
+    (nothing dropped, delivery delayed until the tokens cover it) or
+    "interval" (whole-chunk budget reset every interval).
+
+    Like the sender's Pacer, chunks are spread evenly over the interval
+    and intervals start on fixed deadlines. A ``chunk_gap`` in seconds
+    replaces the even spread with a fixed gap after every chunk.
+    """
+
+    name = "case3"
+
+    def __init__(self, sim, seed=0, link_delay=LINK_DELAY, bw_limit_bps=rx3.BW_LIMIT_BPS,
+                 interval_ms=rx3.INTERVAL_MS, chunk_gap=None, mode=rx3.POLICY_MODE, depth=None):
+        super().__init__(sim, seed, link_delay)
+        self.interval_ms = interval_ms
+        self.budget = (bw_limit_bps // 8) * interval_ms // 1000
+        self.tokens = self.budget
+        self.mode = rx3.check_mode(mode)
+        self.bucket = TokenBucket(bw_limit_bps / 8, depth or self.budget, now=0.0, clock=lambda: self.sim.now)
+        self.used = 0
+        self.chunk_gap = chunk_gap
+        self.tx = FixedSenderCase3()
+
+    def level(self):
+        return self.used
+
+    def start(self):
+        super().start()
+        self.sim.schedule(0.0, self._cycle)
+        self.sim.every(self.interval_ms / 1000.0, self._refill)
+
+    def _cycle(self):
+        allowed = min(self.tx.budget, self.tx.cwnd)
+        self.sim.schedule(self.tx.interval, self._cycle)
+        self._chunk(allowed, 0)
+
+    def _chunk(self, allowed, sent):
+        if sent >= allowed:
+            self.tx.after_interval(sent)
+            return
+        n = min(self.tx.chunk, allowed - sent)
+        self.sent_bytes += n
+        self.sim.schedule(self.link_delay, self._arrive, n, self.sim.now)
+        gap = self.chunk_gap if self.chunk_gap is not None else n * self.tx.interval / allowed
+        self.sim.schedule(gap, self._chunk, allowed, sent + n)
+
+    def _arrive(self, n, sent_at):
+        if self.mode == SHAPE:
+            wait = self.bucket.reserve(n)
+            self.used += n
+            self.delivered_bytes += n
+            self.latencies.append(self.sim.now + wait - sent_at)
+        elif self.mode == POLICE:
+            ok = self.bucket.take(n)
+            if ok:
+                self.used += ok
+                self.delivered_bytes += ok
+                self.latencies.append(self.sim.now - sent_at)
+            self.dropped_bytes += n - ok
+        elif n <= self.tokens:
+            self.tokens -= n
+            self.used += n
+            self.delivered_bytes += n
+            self.latencies.append(self.sim.now - sent_at)
+        else:
+            self.dropped_bytes += n
+
+    def _refill(self):
+        self.used = 0
+        if self.mode not in (POLICE, SHAPE):
+            self.tokens = self.budget
+        self.sim.schedule(self.link_delay, self.tx.on_budget, self.budget, self.interval_ms)
+
+
+CASES = {"case1": Case1Sim, "case2": Case2Sim, "case3": Case3Sim}
+
+
+def simulate(case, seconds=60.0, seed=0, **params):
+    """Run one case for ``seconds`` of virtual time and return its result dict."""
+    sim = Simulator()
+    model = CASES[case](sim, seed=seed, **params)
+    model.start()
+    t0 = time.perf_counter()
+    sim.run(seconds)
+    r = model.result(seconds)
+    r.update(seed=seed, params=params, events=sim.events,
+             wall_s=round(time.perf_counter() - t0, 4))
+    return r
+
+
+def parse_overrides(items):
+    """['workers=4', 'aqm=codel'] -> {'workers': 4, 'aqm': 'codel'}; non-JSON values stay strings."""
+    params = {}
+    for item in items or []:
+        k, _, v = item.partition('=')
+        try:
+            params[k.strip().lower()] = json.loads(v)
+        except ValueError:
+            params[k.strip().lower()] = v
+    return params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discrete-event simulation of a bottleneck case")
+    parser.add_argument("case", choices=sorted(CASES))
+    parser.add_argument("--seconds", type=float, default=60.0, help="simulated duration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--set", action="append", metavar="NAME=VALUE",
+                        help="override a model parameter, e.g. --set workers=4")
+    args = parser.parse_args()
+    print(json.dumps(simulate(args.case, args.seconds, args.seed, **parse_overrides(args.set)), indent=2))
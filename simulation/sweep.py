@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Parameter sweep and tuner for the fixed receivers, on the simulator.
+
+Each configuration is scored by ``simulation.cases.simulate`` (virtual
+time, so a minute of traffic costs well under a second) and scored on
+three objectives: goodput (higher is better), p99 latency and drop rate
+(lower is better). The report is the Pareto front: the configurations
+that no other configuration beats on all three at once.
+
+Search methods:
+
+    grid      every combination of ``--levels`` points per dimension
+    random    ``--samples`` independent draws
+    halving   successive halving: ``--samples`` random draws at
+              ``--min-seconds``, keep the best 1/eta by Pareto rank, run
+              the survivors ``eta`` times longer, until ``--seconds``
+
+Dimensions default to SPACES[case] and are changed with ``--param``:
+``name=lo:hi`` (ints if both ends are), ``name=lo:hi:log``,
+``name=a,b,c`` (choices) or ``name=value`` (fixed). Watermarks and RED
+thresholds are searched as fractions of the buffer/queue size.
+
+Dimensions are receiver settings only. The traffic they are tuned for
+(WORKLOADS[case], e.g. case1's consumer speed) is held fixed for every
+configuration and changed with ``--set name=value``.
+
+    python -m simulation.sweep case2 --method halving --samples 81 --jobs 4
+    python -m simulation.sweep case1 --method grid --levels 4 --param limit=65536:1048576:log
+    python -m simulation.sweep case1 --set drain_bytes=1024
+"""
+
+import os, sys, json, math, random, argparse, itertools
+from concurrent.futures import ProcessPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from simulation.cases import simulate, parse_overrides
+
+OBJECTIVES = (("goodput_bps", "max"), ("latency_p99_ms", "min"), ("drop_rate", "min"))
+
+
+class Dim:
+    """One search dimension: a numeric range (optionally log-scaled) or choices."""
+
+    def __init__(self, lo=None, hi=None, log=False, integer=False, choices=None):
+        self.lo, self.hi, self.log, self.integer = lo, hi, log, integer
+        self.choices = list(choices) if choices is not None else None
+
+    def _cast(self, v):
+        return int(round(v)) if self.integer else round(v, 6)
+
+    def sample(self, rng):
+        if self.choices is not None:
+            return rng.choice(self.choices)
+        if self.log:
+            return self._cast(math.exp(rng.uniform(math.log(self.lo), math.log(self.hi))))
+        return self._cast(rng.uniform(self.lo, self.hi))
+
+    def grid(self, levels):
+        if self.choices is not None:
+            return list(self.choices)
+        if levels < 2 or self.lo == self.hi:
+            return [self._cast(self.lo)]
+        if self.log:
+            a, b = math.log(self.lo), math.log(self.hi)
+            pts = [math.exp(a + (b - a) * i / (levels - 1)) for i in range(levels)]
+        else:
+            pts = [self.lo + (self.hi - self.lo) * i / (levels - 1) for i in range(levels)]
+        return sorted(set(self._cast(p) for p in pts))
+
+
+SPACES = {
+    "case1": {
+        "limit": Dim(32 * 1024, 1024 * 1024, log=True, integer=True),
+        "low_frac": Dim(0.2, 0.7),
+        "high_frac": Dim(0.6, 0.95),
+    },
+    "case2": {
+        "q_max": Dim(200, 2000, integer=True),
+        "min_th_frac": Dim(0.1, 0.6),
+        "max_th_frac": Dim(0.5, 0.95),
+        "workers": Dim(2, 16, integer=True),
+        "aqm": Dim(choices=["red", "codel", "pie"]),
+    },
+    "case3": {
+        "bw_limit_bps": Dim(100_000, 2_000_000, log=True, integer=True),
+        "interval_ms": Dim(20, 500, log=True, integer=True),
+        "mode": Dim(choices=["police", "shape", "interval"]),
+    },
+}
+
+
+# workload held fixed while the receiver settings are searched
+WORKLOADS = {
+    "case1": {"drain_bytes": 2048},   # consumer speed per 10 ms: below the sender's rate, so the buffer fills
+    "case2": {},
+    "case3": {},
+}
+
+
+def to_params(case, config):
+    """Simulator keyword arguments for a configuration (fractions made absolute)."""
+    p = dict(config)
+    if case == "case1" and "limit" in p:
+        limit = p["limit"]
+        low = p.pop("low_frac", 0.5)
+        high = max(low, p.pop("high_frac", 0.9))
+        p["low"], p["high"] = int(limit * low), int(limit * high)
+    elif case == "case2" and "q_max" in p:
+        q_max = p["q_max"]
+        lo = p.pop("min_th_frac", None)
+        hi = p.pop("max_th_frac", None)
+        if lo is not None and hi is not None:
+            lo, hi = sorted((lo, hi))
+        if lo is not None:
+            p["q_min_th"] = int(q_max * lo)
+        if hi is not None:
+            p["q_max_th"] = max(p.get("q_min_th", 0) + 1, int(q_max * hi))
+    return p
+
+
+def evaluate(case, config, seconds, seeds=1, seed=0, workload=None):
+    """Mean objectives over ``seeds`` runs of ``config`` under ``workload``."""
+    params = dict(workload or {}, **to_params(case, config))
+    runs = [simulate(case, seconds, seed + i, **params) for i in range(seeds)]
+    out = {"config": config, "seconds": seconds}
+    for key, _sense in OBJECTIVES:
+        vals = [r[key] for r in runs if r[key] is not None]
+        out[key] = sum(vals) / len(vals) if len(vals) == len(runs) else None
+    out["latency_p50_ms"] = runs[0]["latency_p50_ms"]
+    out["level_mean"] = sum(r["level_mean"] for r in runs) / len(runs)
+    return out
+
+
+def _key(r, name, sense):
+    v = r[name]
+    if v is None:
+        return math.inf   # no deliveries: worst on every objective
+    return -v if sense == "max" else v
+
+
+def dominates(a, b):
+    ka = [_key(a, n, s) for n, s in OBJECTIVES]
+    kb = [_key(b, n, s) for n, s in OBJECTIVES]
+    return all(x <= y for x, y in zip(ka, kb)) and any(x < y for x, y in zip(ka, kb))
+
+
+def pareto_ranks(results):
+    """Non-dominated sorting: rank 0 is the Pareto front, 1 the front without it, ..."""
+    ranks, left, rank = [None] * len(results), set(range(len(results))), 0
+    while left:
+        front = {i for i in left if not any(dominates(results[j], results[i]) for j in left if j != i)}
+        for i in front:
+            ranks[i] = rank
+        left -= front
+        rank += 1
+    return ranks
+
+
+def pareto_front(results):
+    ranks = pareto_ranks(results)
+    return sorted((r for r, k in zip(results, ranks) if k == 0), key=lambda r: -(r["goodput_bps"] or 0))
+
+
+class Sweep:
+    def __init__(self, case, space=None, jobs=None, seeds=1, seed=0, workload=None):
+        self.case = case
+        self.space = space or SPACES[case]
+        self.workload = dict(WORKLOADS.get(case, {}), **(workload or {}))
+        self.jobs = jobs or os.cpu_count() or 1
+        self.seeds, self.seed = seeds, seed
+        self.rng = random.Random(seed)
+        self.history = []   # every evaluation, all budgets
+
+    def _run(self, configs, seconds):
+        n = len(configs)
+        args = ([self.case] * n, configs, [seconds] * n, [self.seeds] * n, [self.seed] * n, [self.workload] * n)
+        if self.jobs > 1 and n > 1:
+            with ProcessPoolExecutor(max_workers=min(self.jobs, n)) as pool:
+                results = list(pool.map(evaluate, *args))
+        else:
+            results = list(map(evaluate, *args))
+        self.history.extend(results)
+        return results
+
+    def random_configs(self, n):
+        return [{k: d.sample(self.rng) for k, d in self.space.items()} for _ in range(n)]
+
+    def grid(self, seconds, levels=3):
+        names = list(self.space)
+        axes = [self.space[k].grid(levels) for k in names]
+        return self._run([dict(zip(names, combo)) for combo in itertools.product(*axes)], seconds)
+
+    def random(self, seconds, samples=50):
+        return self._run(self.random_configs(samples), seconds)
+
+    def halving(self, seconds, samples=81, min_seconds=5.0, eta=3):
+        configs, budget = self.random_configs(samples), min_seconds
+        while True:
+            budget = min(budget, seconds)
+            results = self._run(configs, budget)
+            print(f"[SWEEP] {len(configs)} configs at {budget:g}s", file=sys.stderr)
+            if budget >= seconds or len(configs) <= 1:
+                return results
+            ranks = pareto_ranks(results)
+            order = sorted(range(len(results)), key=lambda i: (ranks[i], -(results[i]["goodput_bps"] or 0)))
+            configs = [results[i]["config"] for i in order[:max(1, len(results) // eta)]]
+            budget *= eta
+
+
+def parse_dim(text):
+    """'lo:hi', 'lo:hi:log', 'a,b,c' or 'value' -> Dim."""
+    def num(s):
+        try:
+            return json.loads(s)
+        except ValueError:
+            return s
+    if ":" in text:
+        parts = text.split(":")
+        lo, hi = num(parts[0]), num(parts[1])
+        return Dim(lo, hi, log="log" in parts[2:], integer=isinstance(lo, int) and isinstance(hi, int))
+    return Dim(choices=[num(v) for v in text.split(",")])
+
+
+def format_front(front):
+    names = list(front[0]["config"]) if front else []
+    head = f"{'goodput_kbps':>13}{'p99_ms':>10}{'drop':>8}  " + "  ".join(names)
+    lines = [head]
+    for r in front:
+        p99 = "-" if r["latency_p99_ms"] is None else f"{r['latency_p99_ms']:.1f}"
+        cfg = "  ".join(f"{r['config'][k]}" for k in names)
+        lines.append(f"{(r['goodput_bps'] or 0) / 1e3:>13.1f}{p99:>10}{r['drop_rate'] or 0:>8.3f}  {cfg}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep fixed-receiver parameters on the simulator")
+    parser.add_argument("case", choices=sorted(SPACES))
+    parser.add_argument("--method", choices=("grid", "random", "halving"), default="random")
+    parser.add_argument("--seconds", type=float, default=30.0, help="simulated duration (final budget for halving)")
+    parser.add_argument("--min-seconds", type=float, default=5.0, help="first halving budget")
+    parser.add_argument("--eta", type=int, default=3, help="halving keep ratio and budget growth")
+    parser.add_argument("--samples", type=int, default=50, help="random/halving configurations")
+    parser.add_argument("--levels", type=int, default=3, help="grid points per numeric dimension")
+    parser.add_argument("--param", action="append", metavar="NAME=SPEC",
+                        help="replace or add a dimension: lo:hi[:log], a,b,c or a fixed value")
+    parser.add_argument("--set", action="append", metavar="NAME=VALUE",
+                        help="workload parameter held fixed for every configuration, e.g. drain_bytes=1024")
+    parser.add_argument("--seeds", type=int, default=1, help="runs averaged per configuration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=None, help="parallel evaluations (default: CPUs)")
+    parser.add_argument("--out", help="write every evaluation and the front as JSON")
+    args = parser.parse_args()
+
+    space = dict(SPACES[args.case])
+    for item in args.param or []:
+        name, _, spec = item.partition("=")
+        space[name.strip()] = parse_dim(spec)
+    sweep = Sweep(args.case, space, args.jobs, args.seeds, args.seed, parse_overrides(args.set))
+    if args.method == "grid":
+        final = sweep.grid(args.seconds, args.levels)
+    elif args.method == "random":
+        final = sweep.random(args.seconds, args.samples)
+    else:
+        final = sweep.halving(args.seconds, args.samples, args.min_seconds, args.eta)
+    front = pareto_front(final)
+    print(f"[SWEEP] {args.case} {args.method}: {len(sweep.history)} evaluations, "
+          f"{len(front)} of {len(final)} on the Pareto front; workload {sweep.workload or '-'}")
+    print(format_front(front))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"case": args.case, "method": args.method, "workload": sweep.workload, "final": final, "front": front,
+                       "history": sweep.history}, f, indent=2)
+        print(f"[SWEEP] Saved: {args.out}")